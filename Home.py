@@ -4,10 +4,26 @@ import yaml
 import base64
 from yaml import SafeLoader
 
-from pages.helper import db_queries
+from pages.helper import db_queries, jobs
+from pages.helper.streamlit_helpers import JOB_MISSING, wait_for_job
 st.set_page_config("Admin/ Main ", initial_sidebar_state="auto")
 # print("Dhruvil Nakrani")
 
+
+# ✅ Create tables/run migrations once per server process, not on every rerun
+@st.cache_resource
+def init_db():
+    db_queries.create_db()
+
+
+# ✅ Dashboard counts, refreshed at most every 30 seconds
+@st.cache_data(ttl=30)
+def load_dashboard_stats(submitted_by):
+    return db_queries.get_dashboard_stats(submitted_by)
+
+
+init_db()
+
 # ✅ Background Image Setup
 def add_bg_from_local(image_file):
     with open(image_file, "rb") as img:
@@ -64,6 +80,7 @@ if st.session_state.get("authentication_status"):
     st.session_state["login_status"] = True
     user_info = config["credentials"]["usernames"][st.session_state["username"]]
     st.session_state["user"] = user_info["name"]
+    st.session_state["role"] = user_info["role"]
     
     # ✅ Display user profile info
     st.markdown(
@@ -76,12 +93,21 @@ if st.session_state.get("authentication_status"):
     )
 
     # ✅ Show dashboard metrics
-    found_cases = db_queries.get_registered_cases_count(user_info["name"], "F")
-    not_found_cases = db_queries.get_registered_cases_count(user_info["name"], "NF")
+    stats = load_dashboard_stats(user_info["name"])
+    status_counts = stats["status_counts"]
 
     col1, col2 = st.columns(2)
-    col1.metric("🟢 Found Cases", value=len(found_cases))
-    col2.metric("🟠 Not Found Cases", value=len(not_found_cases))
+    col1.metric("🟢 Found Cases", value=status_counts.get("F", 0))
+    col2.metric("🟠 Not Found Cases", value=status_counts.get("NF", 0))
+
+    # ✅ Cases registered per day (last 30 days)
+    if stats["daily"]:
+        days = sorted({day for day, _, _ in stats["daily"]})
+        per_day = {"Day": days, "Found": [0] * len(days), "Not Found": [0] * len(days)}
+        for day, status, count in stats["daily"]:
+            column = "Found" if status == "F" else "Not Found"
+            per_day[column][days.index(day)] += count
+        st.bar_chart(per_day, x="Day", y=["Found", "Not Found"])
 
 # ❌ Incorrect Login
 elif st.session_state.get("authentication_status") is False:
@@ -92,16 +118,36 @@ elif st.session_state.get("authentication_status") is None:
     st.warning("🔐 Please enter your username and password.")
     st.session_state["login_status"] = False
 
-st.sidebar.header("Admin GenAI Tools")
-case_to_regen = st.sidebar.text_input("Case ID to (re)generate alert/explanation", value="")
-if st.sidebar.button("Regenerate GenAI outputs") and case_to_regen:
-    try:
-        from pages.helper.genai_agent import generate_alert, explain_matches
-        # Fetch case details
-        rec = db_queries.get_registered_case_detail(case_to_regen)[0]
-        case_dict = {"id": case_to_regen, "name": rec[0], "last_seen": rec[4] if len(rec)>4 else ""}
-        alert = generate_alert(case_dict)
-        st.sidebar.success("Alert regenerated (preview below).")
-        st.sidebar.write(alert.get("short", str(alert)))
-    except Exception as e:
-        st.sidebar.error(f"Failed: {str(e)}")
+# 🔐 Sidebar tools queue background jobs (alert drafts, index rebuilds that
+# refit the descriptor), so they are only offered after login
+if st.session_state.get("authentication_status"):
+    st.sidebar.header("Admin GenAI Tools")
+    case_to_regen = st.sidebar.text_input("Case ID to (re)generate alert/explanation", value="")
+    if st.sidebar.button("Regenerate GenAI outputs") and case_to_regen:
+        try:
+            # Fetch case details
+            rec = db_queries.get_registered_case_detail(case_to_regen)[0]
+            case_dict = {"id": case_to_regen, "name": rec[0], "age": rec[2], "last_seen": rec[3], "birth_marks": rec[4]}
+            # A preview only: the case's stored alert draft is left as it is
+            st.session_state["regen_job"] = jobs.submit("alert_preview", case=case_dict)
+        except Exception as e:
+            st.sidebar.error(f"Failed: {str(e)}")
+
+    if st.sidebar.button("Rebuild match index"):
+        st.session_state["rebuild_job"] = jobs.submit("rebuild_index", dedupe=True)
+
+    with st.sidebar:
+        if "regen_job" in st.session_state:
+            job = wait_for_job(st.session_state["regen_job"], "regen_job")
+            if job is not None and job.status in ("failed", JOB_MISSING):
+                st.error(f"Failed: {job.error}")
+            elif job is not None:
+                alert = jobs.job_result(job)
+                st.success("Alert regenerated (preview below).")
+                st.write(alert.get("short", str(alert)))
+        if "rebuild_job" in st.session_state:
+            job = wait_for_job(st.session_state["rebuild_job"], "rebuild_job")
+            if job is not None and job.status in ("failed", JOB_MISSING):
+                st.error(f"Failed: {job.error}")
+            elif job is not None:
+                st.success(f"Match index rebuilt: {jobs.job_result(job)}")
@@ -0,0 +1,84 @@
+"""
+Compares ann_backends on synthetic face meshes: build time, query latency,
+index memory and recall@k against the exact brute-force backend.
+
+    python -m benchmarks.bench_backends --registered 20000 --public 1000
+    python -m benchmarks.bench_backends --dim 96 --backends brute graph \
+        --params '{"graph": {"m": 24, "ef": 128}}'
+
+--dim 1434 uses raw landmark width, and smaller values mimic the PCA
+descriptors from descriptor.py.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from pages.helper import ann_backends
+
+
+def synthetic_features(n_registered, n_public, dim, seed=0):
+    """Registered identities plus noisy public sightings of some of them."""
+    rng = np.random.default_rng(seed)
+    registered = rng.normal(0, 1, (n_registered, dim)).astype(np.float32)
+    source = rng.integers(0, n_registered, size=n_public)
+    public = registered[source] + rng.normal(0, 0.05, (n_public, dim)).astype(np.float32)
+    return registered, public
+
+
+def run_backend(name, params, registered, public, exact, k):
+    start = time.perf_counter()
+    backend = ann_backends.get_backend(name, **params).fit(registered)
+    build = time.perf_counter() - start
+
+    # Single-query latency, which is what one new submission costs
+    latencies = []
+    for row in public[: min(len(public), 200)]:
+        start = time.perf_counter()
+        backend.query(row[None, :], k)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    backend.query(public, k)
+    batch = time.perf_counter() - start
+
+    return {
+        "backend": name,
+        "params": params,
+        "build_s": round(build, 4),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "batch_queries_per_s": round(len(public) / batch, 1),
+        "index_mb": round(backend.nbytes() / 2**20, 2),
+        f"recall@{k}": round(ann_backends.recall_at_k(backend, exact, public, k), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--registered", type=int, default=20000)
+    parser.add_argument("--public", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=1434)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", default=sorted(ann_backends.BACKENDS))
+    parser.add_argument(
+        "--params", default="{}", help='JSON per backend, e.g. \'{"graph": {"ef": 128}}\''
+    )
+    parser.add_argument("--json", action="store_true", help="print one JSON object per backend")
+    args = parser.parse_args()
+
+    params = json.loads(args.params)
+    registered, public = synthetic_features(args.registered, args.public, args.dim)
+    exact = ann_backends.get_backend("brute").fit(registered)
+
+    for name in args.backends:
+        result = run_backend(name, params.get(name, {}), registered, public, exact, args.k)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print("  ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
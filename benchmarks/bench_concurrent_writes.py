@@ -0,0 +1,85 @@
+"""
+Public submissions per second with N parallel writer processes, comparing
+SQLite's defaults against db_queries.ENGINE_PROFILE. Each run uses a fresh
+scratch database.
+
+    python -m benchmarks.bench_concurrent_writes --writers 1 4 8 --submissions 200
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+# SQLite's own defaults, for comparison with the tuned profile
+DEFAULT_PROFILE = {
+    "FMP_SQLITE_JOURNAL_MODE": "DELETE",
+    "FMP_SQLITE_SYNCHRONOUS": "FULL",
+    "FMP_SQLITE_MMAP_SIZE": "0",
+    "FMP_SQLITE_CACHE_SIZE": "-2000",
+}
+
+
+def _create_db():
+    from pages.helper import db_queries
+
+    db_queries.create_db()
+
+
+def _writer(n_submissions, start_event):
+    from pages.helper import db_queries
+    from pages.helper.data_models import PublicSubmissions
+
+    face_mesh = json.dumps([0.5] * 1434)
+    start_event.wait()
+    for _ in range(n_submissions):
+        db_queries.new_public_case(
+            PublicSubmissions(face_mesh=face_mesh, mobile="0000000000", status="NF")
+        )
+
+
+def run(n_writers, n_submissions, env):
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as scratch:
+        # Children are spawned, so they import db_queries with this env
+        os.environ.update(env, FMP_DB_PATH=os.path.join(scratch, "bench.db"))
+        setup = ctx.Process(target=_create_db)
+        setup.start()
+        setup.join()
+        start_event = ctx.Event()
+        writers = [
+            ctx.Process(target=_writer, args=(n_submissions, start_event))
+            for _ in range(n_writers)
+        ]
+        for writer in writers:
+            writer.start()
+        time.sleep(2)  # let every writer finish importing
+        start = time.perf_counter()
+        start_event.set()
+        for writer in writers:
+            writer.join()
+        elapsed = time.perf_counter() - start
+        failed = sum(writer.exitcode != 0 for writer in writers)
+        for name in list(env) + ["FMP_DB_PATH"]:
+            del os.environ[name]
+    return n_writers * n_submissions / elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--submissions", type=int, default=200, help="per writer")
+    args = parser.parse_args()
+
+    for label, env in (("sqlite defaults", DEFAULT_PROFILE), ("ENGINE_PROFILE", {})):
+        for n_writers in args.writers:
+            rate, failed = run(n_writers, args.submissions, env)
+            print(
+                f"{label:16s} writers={n_writers:<3d} {rate:8,.0f} submissions/s"
+                + (f"  ({failed} writers failed)" if failed else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Exercises genai_agent.LLMClient offline against StubBackend: sequential
+calls vs concurrent fan-out, cache hits, and retry on failures. Uses a
+scratch database for the response cache.
+
+    python -m benchmarks.bench_genai --prompts 20 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ["FMP_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_genai.db")
+
+from pages.helper import db_queries, genai_agent  # noqa: E402
+
+
+def timed(coro):
+    start = time.perf_counter()
+    result = asyncio.run(coro)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.5, help="stub latency per call (s)")
+    parser.add_argument("--concurrency", type=int, default=genai_agent.LLM_CONFIG["concurrency"])
+    args = parser.parse_args()
+    db_queries.create_db()
+
+    prompts = [f"Draft an alert for case {i}" for i in range(args.prompts)]
+    config = {"concurrency": args.concurrency, "backoff": 0.01}
+
+    async def sequential(client):
+        return [await client.complete(prompt) for prompt in prompts]
+
+    client = genai_agent.LLMClient(genai_agent.StubBackend(delay=args.delay), config, use_cache=False)
+    _, seconds = timed(sequential(client))
+    print(f"sequential  {args.prompts} prompts: {seconds:.2f}s")
+
+    client = genai_agent.LLMClient(genai_agent.StubBackend(delay=args.delay), config)
+    _, seconds = timed(client.complete_many(prompts))
+    print(f"fan-out     {args.prompts} prompts: {seconds:.2f}s (concurrency {args.concurrency})")
+
+    backend_calls = client.backend.calls
+    _, seconds = timed(client.complete_many(prompts))
+    print(f"cached      {args.prompts} prompts: {seconds:.4f}s, {client.backend.calls - backend_calls} backend calls")
+
+    client = genai_agent.LLMClient(genai_agent.StubBackend(failures=2), config, use_cache=False)
+    result, _ = timed(client.complete("retry me"))
+    print(f"retry       {client.backend.calls} calls for 1 prompt -> {result!r}")
+
+    client = genai_agent.LLMClient(
+        genai_agent.StubBackend(delay=1.0), {**config, "timeout": 0.05, "retries": 1}, use_cache=False
+    )
+    results, _ = timed(client.complete_many(["slow"]))
+    print(f"timeout     {type(results[0]).__name__} after {client.backend.calls} attempts")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Cold-start import cost of each Streamlit entry point.
+
+Runs the top-level imports of Home.py, mobile_app.py and every page in a
+fresh interpreter (python -X importtime), so nothing is cached between
+measurements, and reports the wall time plus the slowest modules.
+
+    python -m benchmarks.bench_import_time --repeat 5
+    python -m benchmarks.bench_import_time --json > import_times.json
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ["Home.py", "mobile_app.py"] + sorted(
+    os.path.relpath(path, ROOT) for path in glob.glob(os.path.join(ROOT, "pages", "*.py"))
+)
+
+
+def import_statements(script_path: str) -> str:
+    """Source of the module-level import statements of `script_path`."""
+    with open(script_path, encoding="utf-8") as file:
+        tree = ast.parse(file.read())
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in imports)
+
+
+def measure(code: str, env: dict):
+    """(wall seconds, {module: cumulative microseconds}) for one cold run."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cum)
+    return wall, cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import time per entry point")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="slowest modules to list")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    # Imports must not touch the real database
+    env = dict(os.environ, FMP_DB_PATH=os.path.join(tempfile.mkdtemp(), "bench_import.db"))
+    baseline = min(measure("pass", env)[0] for _ in range(args.repeat))
+
+    report = {"interpreter_s": round(baseline, 4), "scripts": {}}
+    for script in SCRIPTS:
+        code = import_statements(os.path.join(ROOT, script))
+        try:
+            runs = [measure(code, env) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            report["scripts"][script] = {"error": str(e)}
+            continue
+        walls = [wall for wall, _ in runs]
+        # Only top-level packages, so nested modules are not counted twice
+        modules = {name: us for name, us in runs[-1][1].items() if "." not in name}
+        report["scripts"][script] = {
+            "median_s": round(statistics.median(walls), 4),
+            "min_s": round(min(walls), 4),
+            "slowest": sorted(modules.items(), key=lambda item: -item[1])[: args.top],
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"interpreter startup: {baseline * 1000:.0f} ms")
+    for script, result in report["scripts"].items():
+        if "error" in result:
+            print(f"{script:32s} failed: {result['error']}")
+            continue
+        slowest = ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in result["slowest"])
+        print(f"{script:32s} {result['median_s'] * 1000:7.0f} ms  ({slowest})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
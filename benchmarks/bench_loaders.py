@@ -0,0 +1,172 @@
+"""
+Time and peak memory of the landmark loaders on a scratch database.
+
+Compares, for the NF registered cases of one user:
+
+- legacy: every row's JSON face mesh exploded into a 1434-column pandas
+  frame, then pd.to_numeric column by column (the original
+  get_registered_cases_data / get_train_data path)
+- fetch_all: .all() on the float32 blobs, then one join into a matrix
+- streaming: db_queries.fetch_landmarks (yield_per into a preallocated matrix)
+
+Each loader runs in a fresh process so peak RSS is not shared.
+
+    python -m benchmarks.bench_loaders --rows 20000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def legacy(db_queries):
+    import pandas as pd
+    from sqlmodel import Session, select
+
+    RegisteredCases = db_queries.RegisteredCases
+    with Session(db_queries.engine) as session:
+        result = session.exec(
+            select(RegisteredCases.id, RegisteredCases.face_mesh, RegisteredCases.status)
+            .where(RegisteredCases.submitted_by == "admin")
+        ).all()
+    d1 = pd.DataFrame(result, columns=["label", "face_mesh", "status"])
+    d1 = d1[d1["status"] == "NF"]
+    d1["face_mesh"] = d1["face_mesh"].apply(lambda x: json.loads(x))
+    d2 = pd.DataFrame(d1.pop("face_mesh").values.tolist(), index=d1.index).rename(
+        columns=lambda x: "fm_{}".format(x + 1)
+    )
+    df = d1.join(d2)
+    for col in df.columns:
+        if col not in ["label", "status"]:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return len(df)
+
+
+def fetch_all(db_queries):
+    from sqlmodel import Session, select
+
+    RegisteredCases = db_queries.RegisteredCases
+    with Session(db_queries.engine) as session:
+        rows = session.exec(
+            select(RegisteredCases.id, RegisteredCases.face_mesh_blob)
+            .where(RegisteredCases.submitted_by == "admin")
+            .where(RegisteredCases.status == "NF")
+        ).all()
+    matrix = db_queries.landmark_store.stack_landmarks(row[1] for row in rows)
+    return len(matrix)
+
+
+def streaming(db_queries):
+    _, matrix = db_queries.fetch_landmarks(
+        db_queries.RegisteredCases, "NF", submitted_by="admin"
+    )
+    return len(matrix)
+
+
+LOADERS = {"legacy": legacy, "fetch_all": fetch_all, "streaming": streaming}
+
+
+def _rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_loader(name, db_path, queue):
+    os.environ["FMP_DB_PATH"] = db_path
+    from pages.helper import db_queries
+
+    import pandas  # noqa: F401 - imported up front so it is not part of the measurement
+
+    rss_before = _rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = LOADERS[name](db_queries)
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    queue.put(
+        {
+            "loader": name,
+            "rows": rows,
+            "seconds": round(elapsed, 3),
+            "traced_peak_mb": round(traced_peak / 2**20, 1),
+            "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+        }
+    )
+
+
+def populate(db_path, n_rows, seed=0):
+    os.environ["FMP_DB_PATH"] = db_path
+    from pages.helper import db_queries
+    from pages.helper.data_models import RegisteredCases
+
+    db_queries.create_db()
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1)
+    for offset in range(0, n_rows, 1000):
+        meshes = rng.random((min(1000, n_rows - offset), 1434), dtype=np.float32)
+        db_queries.add_cases(
+            [
+                RegisteredCases(
+                    submitted_by="admin",
+                    name=f"case {offset + i}",
+                    father_name="-",
+                    age="10",
+                    complainant_mobile="0",
+                    complainant_name="-",
+                    face_mesh=json.dumps(mesh.tolist()),
+                    adhaar_card="-",
+                    birth_marks="-",
+                    address="-",
+                    last_seen="-",
+                    # One in five already found, so the status filter matters
+                    status="F" if (offset + i) % 5 == 0 else "NF",
+                    matched_with="",
+                    submitted_on=start + timedelta(seconds=offset + i),
+                )
+                for i, mesh in enumerate(meshes)
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Landmark loader time and memory")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--loaders", nargs="+", choices=sorted(LOADERS), default=list(LOADERS))
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    db_path = os.path.join(tempfile.mkdtemp(), "bench_loaders.db")
+    process = context.Process(target=populate, args=(db_path, args.rows))
+    process.start()
+    process.join()
+
+    results = []
+    for name in args.loaders:
+        queue = context.Queue()
+        process = context.Process(target=run_loader, args=(name, db_path, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    if args.json:
+        print(json.dumps({"rows": args.rows, "results": results}, indent=2))
+        return 0
+    for result in results:
+        print(
+            f"{result['loader']:10s} {result['rows']:7d} rows  {result['seconds']:7.2f}s  "
+            f"traced peak {result['traced_peak_mb']:7.1f} MB  RSS +{result['rss_growth_mb']:.1f} MB"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
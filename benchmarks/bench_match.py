@@ -0,0 +1,73 @@
+"""
+Throughput of match_algo.nearest_neighbors against the legacy per-row
+ball-tree loop, on synthetic face meshes.
+
+    python -m benchmarks.bench_match --registered 10000 --public 10000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from pages.helper.landmark_store import FACE_MESH_DIM
+from pages.helper.match_algo import nearest_neighbors
+
+
+def synthetic_meshes(n_registered, n_public, seed=0):
+    rng = np.random.default_rng(seed)
+    registered = rng.random((n_registered, FACE_MESH_DIM), dtype=np.float32)
+    # Public submissions are noisy copies of random registered cases
+    source = rng.integers(0, n_registered, size=n_public)
+    public = registered[source] + rng.normal(
+        0, 0.01, (n_public, FACE_MESH_DIM)
+    ).astype(np.float32)
+    return registered, public, source
+
+
+def legacy_match(registered, public):
+    from sklearn.neighbors import KNeighborsClassifier
+
+    knn = KNeighborsClassifier(n_neighbors=1, algorithm="ball_tree", weights="distance")
+    knn.fit(registered, list(range(len(registered))))
+    for row in public:
+        knn.kneighbors([row])
+        knn.predict([row])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--registered", type=int, default=10000)
+    parser.add_argument("--public", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument(
+        "--legacy-sample",
+        type=int,
+        default=200,
+        help="public rows timed through the legacy loop (0 to skip)",
+    )
+    args = parser.parse_args()
+
+    registered, public, source = synthetic_meshes(args.registered, args.public)
+
+    start = time.perf_counter()
+    indices, _ = nearest_neighbors(registered, public, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    accuracy = float(np.mean(indices[:, 0] == source))
+    print(
+        f"batched: {args.registered}x{args.public} in {elapsed:.2f}s "
+        f"({args.public / elapsed:,.0f} queries/s, top-1 accuracy {accuracy:.3f})"
+    )
+
+    if args.legacy_sample:
+        sample = public[: args.legacy_sample]
+        start = time.perf_counter()
+        legacy_match(registered, sample)
+        elapsed = time.perf_counter() - start
+        print(
+            f"legacy:  {len(sample)} queries in {elapsed:.2f}s "
+            f"({len(sample) / elapsed:,.0f} queries/s, fit included)"
+        )
+
+
+if __name__ == "__main__":
+    main()
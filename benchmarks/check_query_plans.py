@@ -0,0 +1,117 @@
+"""
+Checks that the hot db_queries filters are served by an index rather than a
+full table scan. Runs the real query functions against a scratch database,
+captures the SQL they emit and inspects SQLite's EXPLAIN QUERY PLAN.
+
+    python -m benchmarks.check_query_plans
+
+Exits non-zero if any query scans a case table, or if a paginated listing
+sorts its rows (USE TEMP B-TREE) instead of reading them in index order:
+a keyset page must cost O(page), not a sort of every matching row.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+# Must be set before db_queries is imported
+_scratch = tempfile.TemporaryDirectory()
+os.environ["FMP_DB_PATH"] = os.path.join(_scratch.name, "plans.db")
+
+from sqlalchemy import event  # noqa: E402
+
+from pages.helper import db_queries  # noqa: E402
+from pages.helper.data_models import PublicSubmissions, RegisteredCases  # noqa: E402
+
+HOT_QUERIES = {
+    "fetch_registered_cases": lambda: db_queries.fetch_registered_cases("admin", "All"),
+    "get_training_data": lambda: db_queries.get_training_data("admin"),
+    "fetch_landmarks(submitted_by)": lambda: db_queries.fetch_landmarks(
+        RegisteredCases, "NF", submitted_by="admin"
+    ),
+    "get_registered_cases_count": lambda: db_queries.get_registered_cases_count("admin", "NF"),
+    "get_dashboard_stats": lambda: db_queries.get_dashboard_stats("admin"),
+    "list_registered_cases_page": lambda: db_queries.list_registered_cases_page(
+        "admin", "All", after=(datetime(2025, 1, 1), "x")
+    ),
+    "list_registered_cases_page(status)": lambda: db_queries.list_registered_cases_page(
+        "admin", "Not Found", after=(datetime(2025, 1, 1), "x")
+    ),
+    "list_public_cases_page": lambda: db_queries.list_public_cases_page(
+        "Not Found", after=(datetime(2025, 1, 1), "x")
+    ),
+    "list_public_cases_page(all)": lambda: db_queries.list_public_cases_page(
+        "All", after=(datetime(2025, 1, 1), "x")
+    ),
+    "fetch_public_cases": lambda: db_queries.fetch_public_cases(False, "NF"),
+    "fetch_public_cases(train_data)": lambda: db_queries.fetch_public_cases(True, "NF"),
+    "get_table_fingerprint": lambda: db_queries.get_table_fingerprint(RegisteredCases, "NF"),
+    "get_submitter_fingerprints": lambda: db_queries.get_submitter_fingerprints(RegisteredCases, "NF"),
+    "get_table_fingerprint(submitted_by)": lambda: db_queries.get_table_fingerprint(
+        RegisteredCases, "NF", "admin"
+    ),
+    "fetch_match_queue": lambda: db_queries.fetch_match_queue(0.5),
+    "get_candidates_for_public": lambda: db_queries.get_candidates_for_public("x"),
+    "get_submission_faces": lambda: db_queries.get_submission_faces("x"),
+}
+# Keyset-paginated listings: these must also be served in index order
+PAGINATED = {name for name in HOT_QUERIES if name.startswith("list_")}
+CASE_TABLES = (RegisteredCases.__tablename__, PublicSubmissions.__tablename__)
+
+
+def capture(func):
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    # Schema setup/migrations are not part of the hot path being checked
+    create_db = db_queries.create_db
+    db_queries.create_db = lambda: None
+    for eng in (db_queries.engine, db_queries.read_engine):
+        event.listen(eng, "before_cursor_execute", _record)
+    try:
+        func()
+    finally:
+        for eng in (db_queries.engine, db_queries.read_engine):
+            event.remove(eng, "before_cursor_execute", _record)
+        db_queries.create_db = create_db
+    return statements
+
+
+def full_scans(plan_rows):
+    """Plan lines that scan a case table without any index."""
+    return [
+        detail
+        for *_, detail in plan_rows
+        if detail.startswith("SCAN")
+        and any(f" {table}" in detail for table in CASE_TABLES)
+        and "INDEX" not in detail
+    ]
+
+
+def sorts(plan_rows):
+    """Plan lines that sort rows in a temporary b-tree."""
+    return [detail for *_, detail in plan_rows if "USE TEMP B-TREE" in detail]
+
+
+def main():
+    db_queries.create_db()
+    conn = sqlite3.connect(db_queries.DB_PATH)
+    failures = 0
+    for name, func in HOT_QUERIES.items():
+        for statement, parameters in capture(func):
+            plan = conn.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+            problems = full_scans(plan)
+            if name in PAGINATED:
+                problems += sorts(plan)
+            print(f"{'FAIL' if problems else 'ok':4s} {name}: " + "; ".join(row[-1] for row in plan))
+            failures += bool(problems)
+    conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
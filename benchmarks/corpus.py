@@ -0,0 +1,232 @@
+"""
+Synthetic face-mesh corpus with known ground truth.
+
+Meshes have MediaPipe's shape: 478 landmarks x (x, y, z) in image-normalised
+coordinates. Every identity is a mean face plus a low-rank deformation (so
+identities differ the way real faces do, along a few correlated modes), and
+every photo of an identity adds landmark jitter and a random in-plane pose:
+position, size and roll of the face in the frame.
+
+- registered cases: one photo per identity, spread over STATIONS
+- public submissions: new photos of random registered identities, plus
+  distractors whose identity was never registered
+
+    python -m benchmarks.corpus --registered 10000 --out /tmp/corpus.db
+
+writes the scratch database and <out>.truth.json, mapping each public
+submission id to the registered case id it shows (null for distractors).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+
+NUM_LANDMARKS = 478
+STATIONS = ["station-%02d" % i for i in range(8)]
+CORPUS_CONFIG = {
+    "modes": 24,  # identity deformation modes
+    "identity_scale": 0.006,  # landmark displacement per unit of a mode
+    "jitter": 0.01,  # per-photo landmark noise
+    "max_roll": 0.35,  # radians
+    "found_ratio": 0.2,  # registered cases already marked found
+    "distractor_ratio": 0.2,  # public submissions of unregistered people
+}
+BATCH_SIZE = 1000
+
+
+def mean_face(rng) -> np.ndarray:
+    """(478, 3) face-like layout: points on an oval, denser towards the centre."""
+    angle = rng.uniform(0, 2 * np.pi, NUM_LANDMARKS)
+    radius = np.sqrt(rng.uniform(0, 1, NUM_LANDMARKS))
+    x = 0.5 + 0.16 * radius * np.cos(angle)
+    y = 0.5 + 0.22 * radius * np.sin(angle)
+    # Nose forward, edges back, like MediaPipe's relative depth
+    z = -0.05 * (1 - radius**2)
+    return np.stack([x, y, z], axis=1)
+
+
+# Identity numbers of people who were never registered start here
+DISTRACTOR_BASE = 10**9
+START = datetime(2025, 1, 1)
+
+
+class Corpus:
+    """
+    Deterministic generator of identities and photos of them.
+
+    Identity i is the same face for a given seed however many identities are
+    generated, or in which order, so later batches can show earlier people.
+    """
+
+    def __init__(self, seed: int = 0, config: dict = CORPUS_CONFIG):
+        self.seed = seed
+        self.config = config
+        rng = np.random.default_rng(seed)
+        self.mean = mean_face(rng)
+        self.modes = rng.normal(0, 1, (config["modes"], NUM_LANDMARKS, 3))
+
+    def identities(self, numbers) -> np.ndarray:
+        """(n, 478, 3) neutral-pose faces of the people `numbers`."""
+        weights = np.empty((len(numbers), self.config["modes"]))
+        for row, number in enumerate(numbers):
+            rng = np.random.default_rng((self.seed, int(number)))
+            weights[row] = rng.normal(0, self.config["identity_scale"], self.config["modes"])
+        return self.mean + np.einsum("nm,mpc->npc", weights, self.modes)
+
+    def photos(self, faces: np.ndarray, rng) -> np.ndarray:
+        """(n, 1434) float32 landmarks of one new photo of each face."""
+        n = len(faces)
+        points = faces + rng.normal(0, self.config["jitter"], faces.shape)
+        roll = rng.uniform(-self.config["max_roll"], self.config["max_roll"], n)
+        cos, sin = np.cos(roll), np.sin(roll)
+        rotation = np.zeros((n, 3, 3))
+        rotation[:, 0, 0], rotation[:, 0, 1] = cos, -sin
+        rotation[:, 1, 0], rotation[:, 1, 1] = sin, cos
+        rotation[:, 2, 2] = 1
+        centre = points.mean(axis=1, keepdims=True)
+        scale = rng.uniform(0.6, 1.4, (n, 1, 1))
+        shift = rng.uniform(-0.15, 0.15, (n, 1, 3)) * [1, 1, 0]
+        points = np.einsum("npc,nkc->npk", points - centre, rotation) * scale + centre + shift
+        return points.reshape(n, -1).astype(np.float32)
+
+
+def _face_mesh_json(row: np.ndarray) -> str:
+    # Six decimals is finer than MediaPipe's own precision and keeps rows small
+    return json.dumps(np.round(row.astype(np.float64), 6).tolist())
+
+
+def registered_case_id(seed: int, number: int) -> str:
+    return str(uuid.UUID(int=(seed << 64) + number))
+
+
+def populate_registered(n_registered: int, seed: int = 0, config: dict = CORPUS_CONFIG):
+    """Registers identities 0..n_registered-1, round-robin over STATIONS."""
+    from pages.helper import db_queries
+    from pages.helper.data_models import RegisteredCases
+
+    db_queries.create_db()
+    corpus = Corpus(seed, config)
+    rng = np.random.default_rng((seed, 0))
+    for offset in range(0, n_registered, BATCH_SIZE):
+        numbers = range(offset, min(offset + BATCH_SIZE, n_registered))
+        photos = corpus.photos(corpus.identities(numbers), rng)
+        db_queries.add_cases(
+            [
+                RegisteredCases(
+                    id=registered_case_id(seed, number),
+                    submitted_by=STATIONS[number % len(STATIONS)],
+                    name=f"case {number}",
+                    father_name="-",
+                    age=str(5 + number % 60),
+                    complainant_name="-",
+                    complainant_mobile="0000000000",
+                    face_mesh=_face_mesh_json(row),
+                    adhaar_card="-",
+                    birth_marks="-",
+                    address="-",
+                    last_seen="-",
+                    status="F" if rng.random() < config["found_ratio"] else "NF",
+                    matched_with="",
+                    submitted_on=START + timedelta(minutes=number),
+                )
+                for number, row in zip(numbers, photos)
+            ]
+        )
+
+
+def populate_public(n_public: int, n_registered: int, seed: int = 0, batch: int = 0, config: dict = CORPUS_CONFIG) -> dict:
+    """
+    Adds public sightings of registered identities, plus distractors.
+
+    Each `batch` draws different people and photos and is submitted after
+    the previous ones, so batches > 0 look like new arrivals to match().
+
+    Returns:
+        dict - public submission id -> registered case id it shows, or None
+    """
+    from pages.helper import db_queries
+    from pages.helper.data_models import PublicSubmissions
+
+    corpus = Corpus(seed, config)
+    rng = np.random.default_rng((seed, 1, batch))
+    numbers = rng.integers(0, n_registered, n_public)
+    # The first distractor_ratio of every batch shows people nobody registered
+    n_distractors = int(n_public * config["distractor_ratio"])
+    numbers[:n_distractors] = DISTRACTOR_BASE + batch * n_public + np.arange(n_distractors)
+    submitted_from = START + timedelta(minutes=2 * n_registered, days=batch)
+
+    truth = {}
+    for offset in range(0, n_public, BATCH_SIZE):
+        chunk = numbers[offset:offset + BATCH_SIZE]
+        photos = corpus.photos(corpus.identities(chunk), rng)
+        # Ids are assigned here: committed rows are expired and detached
+        ids = [str(uuid.uuid4()) for _ in chunk]
+        db_queries.add_cases(
+            [
+                PublicSubmissions(
+                    id=public_id,
+                    submitted_by="public",
+                    face_mesh=_face_mesh_json(row),
+                    location="-",
+                    mobile="0000000000",
+                    status="NF",
+                    birth_marks="-",
+                    submitted_on=submitted_from + timedelta(seconds=offset + i),
+                )
+                for i, (public_id, row) in enumerate(zip(ids, photos))
+            ]
+        )
+        for public_id, number in zip(ids, chunk):
+            truth[public_id] = None if number >= DISTRACTOR_BASE else registered_case_id(seed, int(number))
+    return truth
+
+
+def populate(n_registered: int, n_public: int = None, seed: int = 0, config: dict = CORPUS_CONFIG) -> dict:
+    """
+    Fills the database at FMP_DB_PATH (set it before importing db_queries)
+    with a corpus.
+
+    Args:
+        n_registered: int - registered cases, one identity each
+        n_public: int - public submissions, defaults to n_registered // 10
+        seed: int
+
+    Returns:
+        dict - public submission id -> registered case id it shows, or None
+    """
+    if n_public is None:
+        n_public = max(1, n_registered // 10)
+    populate_registered(n_registered, seed, config)
+    return populate_public(n_public, n_registered, seed, config=config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a synthetic face-mesh database")
+    parser.add_argument("--registered", type=int, default=10000)
+    parser.add_argument("--public", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="scratch database path (must not exist)")
+    args = parser.parse_args()
+
+    if os.path.exists(args.out):
+        print(f"{args.out} already exists")
+        return 1
+    os.environ["FMP_DB_PATH"] = os.path.abspath(args.out)
+    start = time.perf_counter()
+    truth = populate(args.registered, args.public, args.seed)
+    with open(args.out + ".truth.json", "w", encoding="utf-8") as file:
+        json.dump(truth, file)
+    print(
+        f"{args.registered} registered, {len(truth)} public "
+        f"({sum(v is None for v in truth.values())} distractors) in {time.perf_counter() - start:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+"""
+Reproducible benchmark suite on synthetic corpora (benchmarks/corpus.py).
+
+For every scale (registered cases; public submissions are a tenth of that)
+a fresh scratch database is generated in its own process, then these
+scenarios run against it:
+
+- loaders: the JSON-to-DataFrame training loader the app started with,
+  the JSON face_mesh column parsed with numpy, db_queries.fetch_landmarks
+  and descriptor.load_descriptors
+- match: match_algo.match full (cold and with warm indexes) and
+  incremental after a batch of new public submissions, with precision and
+  recall against the corpus ground truth
+- listing: the All Cases page queries, counts, dashboard stats and the
+  match queue (after match, so the queue reads a populated candidate table)
+- train: train_model.train for one station, forced and up to date
+
+Everything is offline: no camera, GPU or Gemini key, and the LLM backend is
+forced to the stub.
+
+    python -m benchmarks.suite --scales 1000 10000 --out results.json
+    python -m benchmarks.suite --scales 100000 --scenarios match train
+    python -m benchmarks.suite --compare before.json after.json
+
+Each scale's scratch directory is removed when it finishes, unless --keep
+is given; a scale whose process dies or exceeds --timeout is reported with
+an error instead of a result.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = [1000, 10000, 100000]
+# The legacy DataFrame loader needs minutes and gigabytes beyond this
+LEGACY_MAX_ROWS = 20000
+# Seconds between liveness checks while waiting for a scale's report
+POLL_SECONDS = 5.0
+
+
+def _measure(func, repeat: int = 1, trace: bool = False) -> dict:
+    """
+    Median/min/max seconds of `repeat` calls. With `trace`, one more call
+    runs under tracemalloc for its peak allocation (tracing slows it, so it
+    is not timed).
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        seconds.append(time.perf_counter() - start)
+    result = {
+        "seconds": round(statistics.median(seconds), 5),
+        "min_s": round(min(seconds), 5),
+        "max_s": round(max(seconds), 5),
+        "repeat": repeat,
+    }
+    if isinstance(value, int):
+        result["rows"] = value
+    if trace:
+        tracemalloc.start()
+        func()
+        result["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return result
+
+
+# ----------------------- SCENARIOS -----------------------
+# Each takes (context, repeat) and returns {case name: measurement}
+
+
+def loaders(context, repeat):
+    import pandas as pd
+
+    from pages.helper import db_queries, descriptor
+
+    station = context["station"]
+
+    def json_dataframe():
+        # get_train_data before face meshes were stored as blobs
+        rows = db_queries.get_training_data(station)
+        frame = pd.DataFrame(rows, columns=["label", "face_mesh"])
+        frame["face_mesh"] = frame["face_mesh"].apply(json.loads)
+        meshes = pd.DataFrame(frame.pop("face_mesh").values.tolist(), index=frame.index)
+        frame = frame.join(meshes.rename(columns=lambda x: "fm_{}".format(x + 1)))
+        for column in frame.columns:
+            if column != "label":
+                frame[column] = pd.to_numeric(frame[column], errors="coerce")
+        return len(frame)
+
+    def json_numpy():
+        rows = db_queries.fetch_public_cases(train_data=True, status="NF")
+        return len(np.array([json.loads(face_mesh) for _, face_mesh in rows], dtype=np.float32))
+
+    def landmarks():
+        return len(db_queries.fetch_landmarks(db_queries.RegisteredCases, "NF")[0])
+
+    def descriptors():
+        return len(descriptor.load_descriptors(db_queries.RegisteredCases, "NF")[0])
+
+    cases = {"json_numpy_public": json_numpy, "fetch_landmarks": landmarks, "load_descriptors": descriptors}
+    if context["registered"] <= LEGACY_MAX_ROWS:
+        cases = {"json_dataframe_station": json_dataframe, **cases}
+    # Descriptors are computed and stored on the first call; time both
+    results = {}
+    for name, func in cases.items():
+        if name == "load_descriptors":
+            results["load_descriptors_cold"] = _measure(func, 1)
+        results[name] = _measure(func, repeat, trace=True)
+    return results
+
+
+def listing(context, repeat):
+    from pages.helper import db_queries, match_algo
+
+    station = context["station"]
+    # Run without the match scenario: seed the candidates it would have
+    # written, untimed, so match_queue isn't timed on an empty table
+    if not db_queries.fetch_match_queue(limit=1):
+        match_algo.match(mode="full")
+
+    def deep_page(pages=10):
+        after = None
+        for _ in range(pages):
+            page = db_queries.list_registered_cases_page(station, "All", after=after)
+            if not page:
+                break
+            after = (page[-1].submitted_on, page[-1].id)
+        return len(page)
+
+    cases = {
+        "registered_page_1": lambda: len(db_queries.list_registered_cases_page(station, "All")),
+        "registered_page_10": deep_page,
+        "registered_not_found_page": lambda: len(
+            db_queries.list_registered_cases_page(station, "Not Found")
+        ),
+        "public_page_1": lambda: len(db_queries.list_public_cases_page("All")),
+        "fetch_registered_cases": lambda: len(db_queries.fetch_registered_cases(station, "All")),
+        "registered_count": lambda: db_queries.get_registered_cases_count(station, "NF"),
+        "dashboard_stats": lambda: db_queries.get_dashboard_stats(station, days=3650) and 1,
+        "match_queue": lambda: len(db_queries.fetch_match_queue(limit=50)),
+    }
+    return {name: _measure(func, repeat) for name, func in cases.items()}
+
+
+def _match_quality(result, truth, matchable) -> dict:
+    """Precision/recall of match()'s best-within-threshold pairs."""
+    predicted = {public_id: reg_id for reg_id, public_ids in result.items() for public_id in public_ids}
+    correct = sum(truth.get(public_id) == reg_id for public_id, reg_id in predicted.items())
+    expected = sum(truth[public_id] in matchable for public_id in truth)
+    return {
+        "predicted": len(predicted),
+        "precision": round(correct / len(predicted), 4) if predicted else None,
+        "recall": round(correct / expected, 4) if expected else None,
+    }
+
+
+def match(context, repeat):
+    from benchmarks import corpus
+    from pages.helper import db_queries, match_algo, model_cache
+
+    truth = context["truth"]
+    matchable = set(db_queries.fetch_landmarks(db_queries.RegisteredCases, "NF")[0])
+
+    def full():
+        return match_algo.match(mode="full")
+
+    results = {}
+    # Cold: indexes rebuilt from the database (snapshots dropped too)
+    model_cache.invalidate()
+    shutil.rmtree(model_cache.SNAPSHOT_DIR, ignore_errors=True)
+    outcome = {}
+    results["full_cold"] = _measure(lambda: outcome.update(full()), 1)
+    results["full_cold"].update(_match_quality(outcome["result"], truth, matchable))
+    results["full_warm"] = _measure(full, repeat)
+
+    # A batch of new sightings, then the incremental run the worker does
+    batch = max(1, context["public"] // 100)
+    truth.update(corpus.populate_public(batch, context["registered"], context["seed"], batch=1))
+    outcome = {}
+    results["incremental"] = _measure(lambda: outcome.update(match_algo.match(mode="incremental")), 1)
+    results["incremental"]["new_public"] = batch
+    results["incremental"]["mode"] = outcome["mode"]
+    return results
+
+
+def train(context, repeat):
+    from pages.helper import train_model
+
+    station = context["station"]
+    outcome = {}
+    results = {"forced": _measure(lambda: outcome.update(train_model.train(station, force=True)), repeat)}
+    results["forced"]["status"] = outcome["status"]
+    results["up_to_date"] = _measure(lambda: train_model.train(station), repeat)
+    return results
+
+
+# In run order: listing reads the candidates match writes
+SCENARIOS = {"loaders": loaders, "match": match, "listing": listing, "train": train}
+
+
+# ----------------------- RUNNER -----------------------
+
+
+def run_scale(scale, args, queue):
+    """Generates one corpus and runs the selected scenarios (in a child process)."""
+    # --timeout terminates the process; exit through the finally below
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    directory = tempfile.mkdtemp(prefix=f"fmp-bench-{scale}-")
+    try:
+        queue.put(_run_scale(scale, args, directory))
+    finally:
+        if args.keep:
+            print(f"[BENCH] scale {scale} kept in {directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def _run_scale(scale, args, directory):
+    os.environ["FMP_DB_PATH"] = os.path.join(directory, "bench.db")
+    os.environ["FMP_LLM_BACKEND"] = "stub"
+    os.environ["FMP_METRICS"] = "0"
+    from benchmarks import corpus
+    from pages.helper import db_queries, descriptor
+
+    public = max(1, scale // 10)
+    start = time.perf_counter()
+    truth = corpus.populate(scale, public, seed=args.seed)
+    generated = time.perf_counter() - start
+    # match() never fits the descriptor model itself; the worker's
+    # rebuild_index job does, here it is done up front
+    start = time.perf_counter()
+    descriptor.fit_model()
+    fitted = time.perf_counter() - start
+
+    context = {
+        "registered": scale,
+        "public": public,
+        "seed": args.seed,
+        "truth": truth,
+        # Cases are spread evenly, so per-station scenarios see scale / len(STATIONS) rows
+        "station": corpus.STATIONS[0],
+    }
+    report = {
+        "scale": scale,
+        "public": public,
+        "generate_s": round(generated, 2),
+        "fit_descriptor_s": round(fitted, 2),
+        "db_mb": round(os.path.getsize(db_queries.DB_PATH) / 2**20, 1),
+        "scenarios": {},
+    }
+    for name in [name for name in SCENARIOS if name in args.scenarios]:
+        try:
+            report["scenarios"][name] = SCENARIOS[name](context, args.repeat)
+        except Exception as e:
+            report["scenarios"][name] = {"error": f"{type(e).__name__}: {e}"}
+    # Pooled connections hold the database open; close them before the
+    # directory is removed (Windows refuses to delete open files)
+    db_queries.engine.dispose()
+    db_queries.read_engine.dispose()
+    return report
+
+
+def _wait_for_report(scale, process, queue, timeout):
+    """
+    The report of `process`, or {"scale", "error"} if it exits without one
+    or runs longer than `timeout` seconds (then it is terminated).
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        wait = POLL_SECONDS
+        if deadline is not None:
+            wait = max(0.1, min(wait, deadline - time.monotonic()))
+        try:
+            return queue.get(timeout=wait)
+        except queue_module.Empty:
+            pass
+        if not process.is_alive():
+            # The report may have landed between the timeout and the check
+            try:
+                return queue.get(timeout=1.0)
+            except queue_module.Empty:
+                return {"scale": scale, "error": f"process exited with code {process.exitcode}"}
+        if deadline is not None and time.monotonic() > deadline:
+            process.terminate()
+            return {"scale": scale, "error": f"timed out after {timeout}s"}
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "match_backend": os.getenv("FMP_MATCH_BACKEND", "brute"),
+    }
+
+
+def _flatten(report: dict) -> dict:
+    """{(scale, scenario, case): seconds} of a suite result file."""
+    flat = {}
+    for scale in report["scales"]:
+        for scenario, cases in scale.get("scenarios", {}).items():
+            for case, result in cases.items():
+                if isinstance(result, dict) and "seconds" in result:
+                    flat[(scale["scale"], scenario, case)] = result["seconds"]
+    return flat
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path, encoding="utf-8") as file:
+        before = _flatten(json.load(file))
+    with open(after_path, encoding="utf-8") as file:
+        after = _flatten(json.load(file))
+    print(f"{'scale':>7s}  {'scenario/case':42s} {'before':>10s} {'after':>10s} {'speedup':>8s}")
+    for key in sorted(before.keys() & after.keys()):
+        scale, scenario, case = key
+        speedup = before[key] / after[key] if after[key] else float("inf")
+        print(
+            f"{scale:7d}  {scenario + '/' + case:42s} {before[key]:10.4f} {after[key]:10.4f} {speedup:7.2f}x"
+        )
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{key[0]:7d}  {key[1] + '/' + key[2]:42s} only in {'before' if key in before else 'after'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite on synthetic corpora")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--timeout", type=float, default=0, help="seconds per scale (default: no limit)")
+    parser.add_argument("--keep", action="store_true", help="keep each scale's scratch database")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two reports")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    report = {"environment": environment(), "repeat": args.repeat, "seed": args.seed, "scales": []}
+    context = multiprocessing.get_context("spawn")
+    for scale in args.scales:
+        queue = context.Queue()
+        process = context.Process(target=run_scale, args=(scale, args, queue))
+        process.start()
+        result = _wait_for_report(scale, process, queue, args.timeout)
+        process.join()
+        report["scales"].append(result)
+        status = f"failed: {result['error']}" if "error" in result else "done"
+        print(f"[BENCH] scale {scale} {status}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
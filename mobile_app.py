@@ -2,13 +2,17 @@ import uuid
 import json
 
 import streamlit as st
-import uuid
-import json
-import numpy as np
 
-from pages.helper import db_queries
+from pages.helper import db_queries, image_store, jobs, video_ingest
 from pages.helper.data_models import PublicSubmissions
-from pages.helper.utils import image_obj_to_numpy, extract_face_mesh_landmarks
+from pages.helper.utils import (
+    CROWD_WORKING_SIDE,
+    WORKING_SIDE,
+    extract_all_faces,
+    extract_face_mesh_landmarks,
+    image_obj_to_numpy,
+    image_quality_issue,
+)
 from pages.helper.streamlit_helpers import require_login
 
 st.set_page_config("Mobile UI/ Public", initial_sidebar_state="collapsed")
@@ -20,24 +24,45 @@ st.title("Make a submission")
 image_col, form_col = st.columns(2)
 image_obj = None
 save_flag = 0
+unique_id = None
+face_mesh = None
+faces = []
 
 with image_col:
     image_obj = st.file_uploader(
-        "Image", type=["jpg", "jpeg", "png"], key="user_submission"
+        "Image or video",
+        type=["jpg", "jpeg", "png", *video_ingest.VIDEO_EXTENSIONS],
+        key="user_submission",
     )
-    if image_obj:
-        import uuid
-
+    is_video = image_obj is not None and image_obj.name.lower().endswith(
+        video_ingest.VIDEO_EXTENSIONS
+    )
+    all_faces = st.toggle(
+        "Crowd / CCTV photo", help="Find and submit every face in the image"
+    )
+    if image_obj and is_video:
+        st.video(image_obj)
+        st.caption("Every face in the clip is extracted after you submit.")
+    elif image_obj:
         unique_id = str(uuid.uuid4())
 
         with st.spinner("Processing..."):
-            uploaded_file_path = "./resources/" + str(unique_id) + ".jpg"
-            with open(uploaded_file_path, "wb") as output_temporary_file:
-                output_temporary_file.write(image_obj.read())
-
             st.image(image_obj, width=200)
-            image_numpy = image_obj_to_numpy(image_obj)
-            face_mesh = extract_face_mesh_landmarks(image_numpy)
+            image_obj.seek(0)
+            image_numpy = image_obj_to_numpy(
+                image_obj, CROWD_WORKING_SIDE if all_faces else WORKING_SIDE
+            )
+            issue = image_quality_issue(image_numpy)
+            if issue:
+                st.error(issue)
+            elif all_faces:
+                faces = extract_all_faces(image_numpy)
+                if faces:
+                    st.info(f"Found {len(faces)} face(s) in the image.")
+                else:
+                    st.error("Couldn't find any face in the image. Please try another image.")
+            else:
+                face_mesh = extract_face_mesh_landmarks(image_numpy)
 
 if image_obj:
     with form_col.form(key="new_user_submission"):
@@ -60,13 +85,42 @@ if image_obj:
             status="NF",
         )
 
-        if submit_bt:
-            db_queries.new_public_case(public_submission_details)
+        if submit_bt and is_video:
+            image_obj.seek(0)
+            # Decoding a clip takes a while; the worker stores its faces
+            jobs.submit(
+                "video",
+                path=video_ingest.save_upload(image_obj),
+                details={
+                    "submitted_by": name,
+                    "location": address,
+                    "email": email,
+                    "mobile": mobile_number,
+                    "birth_marks": birth_marks,
+                },
+                delete_after=True,
+            )
+            save_flag = 1
+            st.info("Thank you — the video is being processed.")
+        elif submit_bt and not faces and face_mesh is None:
+            st.error("Nothing to submit: no usable face was found in the image.")
+        elif submit_bt:
+            # The image is stored once, on submit, not on every rerun
+            image_obj.seek(0)
+            content_hash = image_store.store_file(image_obj)
+            if all_faces:
+                # One row per face; the worker matches them all in one batch
+                db_queries.new_public_faces(
+                    public_submission_details,
+                    [dict(face, image_hash=content_hash) for face in faces],
+                )
+            else:
+                db_queries.new_public_case(public_submission_details)
+                db_queries.save_case_images([(unique_id, content_hash)])
             save_flag = 1
 
-            # GenAI alert preview for public submitter
+            # GenAI alert preview for public submitter, drafted in the background
             try:
-                from pages.helper.genai_agent import generate_alert
                 gen_case = {
                     "id": unique_id,
                     "name": public_submission_details.submitted_by or "Anonymous",
@@ -76,16 +130,8 @@ if image_obj:
                     "submitted_by": public_submission_details.submitted_by,
                     "phone": public_submission_details.mobile,
                 }
-                alert_obj = generate_alert(gen_case)
-                # Save preview to file (or db)
-                try:
-                    db_queries.save_public_alert_preview(unique_id, json.dumps(alert_obj))
-                except Exception:
-                    with open(f"./resources/{unique_id}_public_alert.json", "w", encoding="utf-8") as fo:
-                        fo.write(json.dumps(alert_obj, ensure_ascii=False, indent=2))
-                st.info("Thank you — alert preview created.")
-                st.write("Alert Preview:")
-                st.write(alert_obj.get("short", alert_obj.get("text", str(alert_obj))))
+                jobs.submit("public_alert", case_id=unique_id, case=gen_case)
+                st.info("Thank you — an alert preview is being prepared.")
             except Exception as e:
                 st.warning(f"Alert preview generation failed: {str(e)}")
 
@@ -1,31 +1,8 @@
 import streamlit as st
 from datetime import datetime
 from pages.helper.data_models import RegisteredCases
-from pages.helper import db_queries
-from dotenv import load_dotenv
-import os
-import google.generativeai as genai
-
-# ========== Load environment variables ==========
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not GEMINI_API_KEY:
-    st.error("⚠ GEMINI_API_KEY is missing in .env file.")
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
-
-# ========== Helper Function to Call Gemini ==========
-def generate_ai_alert(prompt: str) -> str:
-    """
-    Calls Google Gemini API to generate a missing person alert text.
-    """
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        return f"[AI Generation Failed] {str(e)}"
+from pages.helper import db_queries, jobs
+from pages.helper.streamlit_helpers import JOB_MISSING, wait_for_job
 
 # ========== Streamlit UI ==========
 st.title("Register New Missing Person Case")
@@ -64,30 +41,26 @@ if submit_btn:
         birth_marks=birth_marks,
         matched_with=None
     )
-    case_id = db_queries.register_new_case(case)
-
-    # Generate AI alert using Gemini
-    prompt = f"""
-    Create a concise but impactful public missing person alert based on this case:
-    Name: {name}
-    Age: {age}
-    Last Seen: {last_seen}
-    Birth Marks: {birth_marks}
-    Please write in a way suitable for WhatsApp and social media posting.
-    """
-
-    alert_text = generate_ai_alert(prompt)
-
-    # Save alert to DB
     try:
-        db_queries.save_alert(case.id, alert_text)
-    except Exception as e:
-        st.error(f"Failed to save AI alert to DB: {e}")
+        case_id = db_queries.register_new_case(case)
+    except ValueError as e:
+        st.error(f"Case not registered. {e}")
+    else:
+        st.success("✅ Case registered successfully!")
+
+        # Generate the AI alert in the background worker
+        st.session_state["alert_job"] = jobs.submit(
+            "case_alert",
+            case_id=case_id,
+            case={"name": name, "age": age, "last_seen": last_seen, "birth_marks": birth_marks},
+        )
 
-    # Show results
-    st.success("✅ Case registered successfully!")
-    if "AI Generation Failed" in alert_text:
-        st.warning(alert_text)
+if "alert_job" in st.session_state:
+    job = wait_for_job(st.session_state["alert_job"], "alert_job")
+    if job is None:
+        st.info("Drafting AI alert...")
+    elif job.status in ("failed", JOB_MISSING):
+        st.warning(f"[AI Generation Failed] {job.error}")
     else:
         st.subheader("AI-generated Alert")
-        st.write(alert_text)
+        st.write(jobs.job_result(job)["alert"])
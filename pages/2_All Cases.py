@@ -1,65 +1,57 @@
 import streamlit as st
-from pages.helper import db_queries
+from pages.helper import db_queries, image_store
 from pages.helper.streamlit_helpers import require_login
 
+PAGE_SIZE = 20
 
-def case_viewer(case):
-    case = list(case)
-    case_id = case.pop(0)
-    matched_with_id = case.pop(-1)
-    matched_with_details = None
 
+def status_label(value):
+    return "Found" if value == "F" else "Not Found"
+
+
+def show_image(image_col, case_id, image_hashes):
+    image_file = image_store.open_image(case_id, hashes=image_hashes)
+    if image_file is None:
+        image_col.warning("No image")
+        return
     try:
-        matched_with_id = matched_with_id.replace("{", "").replace("}", "")
-    except:
-        matched_with_id = None
+        with image_file:
+            image_col.image(
+                image_file.read(),
+                width=120,
+                use_container_width=False,
+            )
+    except Exception:
+        image_col.warning("Couldn't load image")
 
-    if matched_with_id:
-        matched_with_details = db_queries.get_public_case_detail(matched_with_id)
 
+def case_viewer(case, image_hashes):
     data_col, image_col, matched_with_col = st.columns(3)
-    for text, value in zip(["Name", "Age", "Status", "Last Seen", "Phone"], case):
-        if value == "F":
-            value = "Found"
-        elif value == "NF":
-            value = "Not Found"
-        data_col.write(f"{text}: {value}")
-
-    image_col.image(
-        f"./resources/{case_id}.jpg",
-        width=120,
-        use_container_width=False,
-    )
-
-    if matched_with_details:
-        matched_with_col.write(f"Location: {matched_with_details[0][0]}")
-        matched_with_col.write(f"Submitted By: {matched_with_details[0][1]}")
-        matched_with_col.write(f"Mobile: {matched_with_details[0][2]}")
-        matched_with_col.write(f"Birth Marks: {matched_with_details[0][3]}")
+    data_col.write(f"Name: {case.name}")
+    data_col.write(f"Age: {case.age}")
+    data_col.write(f"Status: {status_label(case.status)}")
+    data_col.write(f"Last Seen: {case.last_seen}")
+
+    show_image(image_col, case.id, image_hashes)
+
+    if case.match_mobile is not None:
+        matched_with_col.write(f"Location: {case.match_location}")
+        matched_with_col.write(f"Submitted By: {case.match_submitted_by}")
+        matched_with_col.write(f"Mobile: {case.match_mobile}")
+        matched_with_col.write(f"Birth Marks: {case.match_birth_marks}")
     st.write("---")
 
 
-def public_case_viewer(case: list) -> None:
-    case = list(case)
-    case_id = str(case.pop(0))
-
+def public_case_viewer(case, image_hashes) -> None:
     data_col, image_col, _ = st.columns(3)
-    for text, value in zip(
-        ["Status", "Location", "Mobile", "Birth Marks", "Submitted on", "Submitted by"],
-        case,
-    ):
-        if text == "Status":
-            value = "Found" if value == "F" else "Not Found"
-        data_col.write(f"{text}: {value}")
+    data_col.write(f"Status: {status_label(case.status)}")
+    data_col.write(f"Location: {case.location}")
+    data_col.write(f"Mobile: {case.mobile}")
+    data_col.write(f"Birth Marks: {case.birth_marks}")
+    data_col.write(f"Submitted on: {case.submitted_on}")
+    data_col.write(f"Submitted by: {case.submitted_by}")
 
-    try:
-        image_col.image(
-            f"./resources/{case_id}.jpg",
-            width=120,
-            use_container_width=False,
-        )
-    except Exception:
-        st.warning("Couldn't load image")
+    show_image(image_col, case.id, image_hashes)
 
     st.write("---")
 
@@ -70,7 +62,10 @@ if "login_status" not in st.session_state or not st.session_state["login_status"
 else:
     # Extract proper submitted_by value
     user = st.session_state.user
-    submitted_by = user.get("name") or user.get("email") or str(user)
+    if isinstance(user, dict):
+        submitted_by = user.get("name") or user.get("email") or str(user)
+    else:
+        submitted_by = str(user)
 
     st.title("View Submitted Cases")
 
@@ -78,23 +73,48 @@ else:
     status = status_col.selectbox(
         "Filter", options=["All", "Not Found", "Found", "Public Cases"]
     )
-    date = date_col.date_input("Date")
+    date_range = date_col.date_input("Date", value=[])
+    start_date = date_range[0] if len(date_range) > 0 else None
+    end_date = date_range[1] if len(date_range) > 1 else start_date
+
+    # Keyset pagination: one (submitted_on, id) cursor per page visited,
+    # reset whenever the filters change
+    filters = (status, start_date, end_date)
+    if st.session_state.get("all_cases_filters") != filters:
+        st.session_state["all_cases_filters"] = filters
+        st.session_state["all_cases_cursors"] = [None]
+    cursors = st.session_state["all_cases_cursors"]
 
     st.write("---")
 
+    # Fetch one extra row to know whether a next page exists
     if status == "Public Cases":
-        # Fetch both Found and Not Found public cases
-        cases_data = db_queries.fetch_public_cases(False, "F") + \
-                     db_queries.fetch_public_cases(False, "NF")
-        if not cases_data:
-            st.info("No public cases found.")
-        else:
-            for case in cases_data:
-                public_case_viewer(case)
+        cases_data = db_queries.list_public_cases_page(
+            "All", None, start_date, end_date, cursors[-1], PAGE_SIZE + 1
+        )
+        viewer, empty_message = public_case_viewer, "No public cases found."
+    else:
+        cases_data = db_queries.list_registered_cases_page(
+            submitted_by, status, start_date, end_date, cursors[-1], PAGE_SIZE + 1
+        )
+        viewer, empty_message = case_viewer, "No registered cases found."
+
+    has_next = len(cases_data) > PAGE_SIZE
+    cases_data = cases_data[:PAGE_SIZE]
+
+    if not cases_data:
+        st.info(empty_message)
     else:
-        cases_data = db_queries.fetch_registered_cases(submitted_by, status)
-        if not cases_data:
-            st.info("No registered cases found.")
-        else:
-            for case in cases_data:
-                case_viewer(case)
+        # Image hashes for the whole page in one lookup
+        image_hashes = db_queries.get_case_image_hashes([case.id for case in cases_data])
+        for case in cases_data:
+            viewer(case, image_hashes)
+
+    prev_col, page_col, next_col = st.columns(3)
+    page_col.write(f"Page {len(cursors)}")
+    if prev_col.button("Previous", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next", disabled=not has_next):
+        cursors.append((cases_data[-1].submitted_on, cases_data[-1].id))
+        st.rerun()
@@ -1,66 +1,105 @@
 import streamlit as st
-from pages.helper import db_queries
-from dotenv import load_dotenv
-import os
-import google.generativeai as genai
+from pages.helper import db_queries, image_store, jobs
+from pages.helper.streamlit_helpers import JOB_MISSING, wait_for_job
 
-# Load environment variables
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+st.title("Match Registered & Public Cases")
 
-if not GEMINI_API_KEY:
-    st.error("⚠ GEMINI_API_KEY not found in .env file")
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
+QUEUE_SIZE = 20
 
-st.title("Match Registered & Public Cases")
 
-# Fetch NF registered cases
-registered_cases = db_queries.fetch_registered_cases(submitted_by="admin", status="Not Found")
-public_cases = db_queries.fetch_public_cases(train_data=False, status="NF")
+def show_image(image_col, case_id, image_hashes):
+    image_file = image_store.open_image(case_id, hashes=image_hashes)
+    if image_file is None:
+        image_col.warning("No image")
+        return
+    try:
+        with image_file:
+            image_col.image(image_file.read(), width=120, use_container_width=False)
+    except Exception:
+        image_col.warning("Couldn't load image")
+
+
+def confirm_match(reg_case_id, pub_case_id):
+    db_queries.update_found_status(reg_case_id, pub_case_id)
+    # Every confirmed match is a new label for the score curve
+    jobs.submit("calibrate_scores", dedupe=True)
+    # Explanation and witness summary are generated by the background worker
+    st.session_state["explain_job"] = jobs.submit(
+        "explain_match", registered_id=reg_case_id, public_id=pub_case_id
+    )
+
+
+def show_explanation(job_id):
+    job = wait_for_job(job_id, "explain_job")
+    if job is None:
+        st.info("Match saved. Generating AI explanations...")
+    elif job.status in ("failed", JOB_MISSING):
+        st.warning(f"Match saved, but AI generation failed: {job.error}")
+    else:
+        result = jobs.job_result(job)
+        st.success("Cases matched and AI explanations saved.")
+        st.subheader("AI Match Explanation")
+        st.write(result["match_explanation"])
+        st.subheader("AI Witness Summary")
+        st.write(result["witness_summary"])
+
 
-if not registered_cases or not public_cases:
-    st.warning("No cases available for matching.")
+# Review the logged-in officer's own cases by default
+user = st.session_state.get("user")
+if isinstance(user, dict):
+    user = user.get("name") or user.get("email")
+
+scope_col, score_col, refresh_col = st.columns(3)
+scope = scope_col.selectbox(
+    "Cases", options=["My cases", "All stations"] if user else ["All stations"]
+)
+submitted_by = user if scope == "My cases" else None
+min_score = score_col.slider("Minimum score", 0.0, 1.0, 0.5, 0.05)
+if refresh_col.button("Refresh candidates"):
+    st.session_state["match_job"] = jobs.submit("match", dedupe=True, mode="incremental")
+
+if "match_job" in st.session_state:
+    match_job = wait_for_job(st.session_state["match_job"], "match_job")
+    if match_job is not None:
+        if match_job.status in ("failed", JOB_MISSING):
+            st.warning(match_job.error)
+        elif "skipped" in (jobs.job_result(match_job) or {}):
+            st.info(jobs.job_result(match_job)["skipped"])
+        st.session_state.pop("match_job", None)
+
+if "explain_job" in st.session_state:
+    show_explanation(st.session_state["explain_job"])
+
+# Ranked queue, precomputed by match_algo.match() in the background worker
+queue = db_queries.fetch_match_queue(
+    min_score=min_score, submitted_by=submitted_by, limit=QUEUE_SIZE
+)
+
+if not queue:
+    st.warning("No match candidates to review. Refresh candidates after new submissions.")
 else:
-    reg_case_id = st.selectbox("Select Registered Case", [r[0] for r in registered_cases])
-    pub_case_id = st.selectbox("Select Public Case", [p[0] for p in public_cases])
-
-    if st.button("Mark as Match"):
-        db_queries.update_found_status(reg_case_id, pub_case_id)
-
-        try:
-            # Fetch case details
-            reg_details = db_queries.get_registered_case_detail(reg_case_id)
-            pub_details = db_queries.get_public_case_detail(pub_case_id)
-
-            # 1️⃣ Match explanation
-            prompt_exp = f"""
-            You are an investigator. Based on the following two reports,
-            explain concisely why these cases are a probable match.
-
-            Registered Case: {reg_details}
-            Public Submission: {pub_details}
-            """
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            match_response = model.generate_content(prompt_exp)
-            match_explanation = match_response.text.strip()
-            db_queries.save_match_explanation(reg_case_id, match_explanation)
-
-            # 2️⃣ Witness summary
-            prompt_summary = f"""
-            Summarize the witness/public submission details in a clear, concise way for law enforcement.
-            Public Submission: {pub_details}
-            """
-            witness_response = model.generate_content(prompt_summary)
-            witness_summary = witness_response.text.strip()
-            db_queries.save_witness_summary(reg_case_id, witness_summary)
-
-            # ✅ Success display
-            st.success("Cases matched and AI explanations saved.")
-            st.subheader("AI Match Explanation")
-            st.write(match_explanation)
-            st.subheader("AI Witness Summary")
-            st.write(witness_summary)
-
-        except Exception as e:
-            st.warning(f"Match saved, but AI generation failed: {e}")
+    image_hashes = db_queries.get_case_image_hashes(
+        [row.registered_id for row in queue] + [row.public_id for row in queue]
+    )
+    confirmed = None
+    for row in queue:
+        reg_col, pub_col, score_col = st.columns(3)
+        reg_col.write(f"Name: {row.name}")
+        reg_col.write(f"Age: {row.age}")
+        reg_col.write(f"Last Seen: {row.last_seen}")
+        show_image(reg_col, row.registered_id, image_hashes)
+
+        pub_col.write(f"Location: {row.location}")
+        pub_col.write(f"Birth Marks: {row.birth_marks}")
+        pub_col.write(f"Submitted on: {row.submitted_on}")
+        show_image(pub_col, row.public_id, image_hashes)
+
+        score_col.metric("Score", f"{row.score:.2f}")
+        score_col.write(f"Distance: {row.distance:.4f}")
+        if score_col.button("Mark as Match", key=f"match_{row.registered_id}_{row.public_id}"):
+            confirmed = (row.registered_id, row.public_id)
+        st.write("---")
+
+    if confirmed is not None:
+        confirm_match(*confirmed)
+        st.rerun()
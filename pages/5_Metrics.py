@@ -0,0 +1,50 @@
+import streamlit as st
+from pages.helper import metrics
+
+if not st.session_state.get("login_status") or st.session_state.get("role") != "Admin":
+    st.write("You don't have access to this page")
+else:
+    st.title("Metrics")
+    st.caption("Merged from every app and worker process. Latencies cover recent calls.")
+
+    if st.button("Refresh"):
+        st.rerun()
+
+    collected = metrics.collect()
+    histograms = collected["histograms"]
+    counters = collected["counters"]
+
+    if not histograms and not counters:
+        st.info("No metrics recorded yet.")
+    else:
+        st.subheader("Latency (ms)")
+        prefix_filter = st.selectbox(
+            "Area", options=["All"] + sorted({name.split(".")[0] for name in histograms})
+        )
+        rows = [
+            {
+                "Metric": name,
+                "Calls": h["count"],
+                "p50": round(h["p50"] * 1000, 2),
+                "p95": round(h["p95"] * 1000, 2),
+                "p99": round(h["p99"] * 1000, 2),
+                "Max": round(h["max"] * 1000, 2),
+            }
+            for name, h in sorted(histograms.items(), key=lambda item: -item[1]["p95"])
+            if prefix_filter == "All" or name.startswith(prefix_filter + ".")
+        ]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+        st.subheader("Counters")
+        st.dataframe(
+            [{"Counter": name, "Total": value} for name, value in sorted(counters.items())],
+            use_container_width=True,
+            hide_index=True,
+        )
+
+        st.download_button(
+            "Download Prometheus text",
+            metrics.prometheus_text(collected),
+            file_name="metrics.prom",
+            mime="text/plain",
+        )
@@ -0,0 +1,286 @@
+"""
+Nearest-neighbour backends for match_algo.
+
+Every backend has the same interface: `fit(features)` once, then
+`query(queries, k)` returning (indices, distances) arrays of shape (M, k),
+closest first, with euclidean distances.
+
+- "brute": exact, blocked NumPy matrix multiplies. The reference backend.
+- "tree": sklearn ball tree / kd tree. Exact, but trees degrade towards
+  brute force (or worse) at high dimension.
+- "graph": approximate nearest-neighbour graph searched with a best-first
+  beam, HNSW-style. Uses hnswlib when it is installed, otherwise a pure
+  NumPy navigable small world graph (a single layer, built by inserting
+  one node at a time).
+
+The backend used by match() comes from the FMP_MATCH_BACKEND environment
+variable (default "brute"), and FMP_MATCH_BACKEND_PARAMS holds a JSON object
+of constructor parameters, e.g. '{"ef": 128}'.
+"""
+import heapq
+import json
+import os
+
+import numpy as np
+
+
+def blocked_knn(features, queries, k=1, chunk_size=1024, sq_norms=None):
+    """
+    Exact k nearest rows of `features` for every row of `queries`.
+
+    Distances are computed blockwise as |q|^2 + |f|^2 - 2 q.f, so each block
+    is a single matrix multiply and memory stays at chunk_size x N.
+
+    Returns:
+        (indices, distances) - two (M, k) ndarrays, closest first
+    """
+    features = np.asarray(features, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    k = min(k, len(features))
+    if sq_norms is None:
+        sq_norms = np.einsum("ij,ij->i", features, features)
+
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    distances = np.empty((len(queries), k), dtype=np.float32)
+    for start in range(0, len(queries), chunk_size):
+        block = queries[start : start + chunk_size]
+        sq = np.einsum("ij,ij->i", block, block)[:, None] + sq_norms[None, :]
+        sq -= 2.0 * (block @ features.T)
+        np.maximum(sq, 0.0, out=sq)
+
+        if k < len(features):
+            top = np.argpartition(sq, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(len(features)), sq.shape)
+        top_sq = np.take_along_axis(sq, top, axis=1)
+        order = np.argsort(top_sq, axis=1)
+        indices[start : start + len(block)] = np.take_along_axis(top, order, axis=1)
+        distances[start : start + len(block)] = np.sqrt(
+            np.take_along_axis(top_sq, order, axis=1)
+        )
+    return indices, distances
+
+
+class MatcherBackend:
+    """Base class; subclasses implement fit() and query()."""
+
+    name = None
+    exact = True
+
+    def __init__(self, **params):
+        self.params = params
+        self.size = 0
+
+    def fit(self, features, sq_norms=None):
+        raise NotImplementedError
+
+    def query(self, queries, k=1):
+        raise NotImplementedError
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the fitted index."""
+        return 0
+
+
+class BruteForceBackend(MatcherBackend):
+    name = "brute"
+
+    def fit(self, features, sq_norms=None):
+        self.features = np.asarray(features, dtype=np.float32)
+        self.sq_norms = (
+            sq_norms if sq_norms is not None else np.einsum("ij,ij->i", self.features, self.features)
+        )
+        self.size = len(self.features)
+        return self
+
+    def query(self, queries, k=1):
+        return blocked_knn(
+            self.features,
+            queries,
+            k,
+            self.params.get("chunk_size", 1024),
+            self.sq_norms,
+        )
+
+    def nbytes(self):
+        return self.features.nbytes + self.sq_norms.nbytes
+
+
+class SklearnTreeBackend(MatcherBackend):
+    name = "tree"
+
+    def fit(self, features, sq_norms=None):
+        from sklearn.neighbors import NearestNeighbors
+
+        self.index = NearestNeighbors(
+            algorithm=self.params.get("algorithm", "ball_tree"),
+            leaf_size=self.params.get("leaf_size", 40),
+        ).fit(np.asarray(features, dtype=np.float32))
+        self.size = len(features)
+        return self
+
+    def query(self, queries, k=1):
+        distances, indices = self.index.kneighbors(
+            np.asarray(queries, dtype=np.float32), n_neighbors=min(k, self.size)
+        )
+        return indices.astype(np.int64), distances.astype(np.float32)
+
+    def nbytes(self):
+        tree = self.index._tree
+        return sum(array.nbytes for array in tree.get_arrays())
+
+
+class GraphBackend(MatcherBackend):
+    """
+    Approximate search over a navigable neighbour graph.
+
+    With hnswlib installed this is its HNSW index. Without it, a single
+    layer navigable small world graph is built in NumPy: nodes are inserted
+    in random order, each one linked to the m closest nodes a beam search
+    (width ef_construction) finds among those already inserted, with links
+    made both ways and every node's list cut back to its 2*m closest. The
+    links made while the graph is still sparse span long distances, which
+    is what lets a greedy search from the first node reach any region.
+    Building costs about N * ef_construction * m distance evaluations in
+    Python loops, so it is much slower than hnswlib and only meant for
+    small corpora and tests; recall is not guaranteed, measure it with
+    recall_at_k().
+
+    Params:
+        m: int - links per inserted node
+        ef: int - beam width at query time; larger is slower and more accurate
+        ef_construction: int - beam width while building (default 200 with
+            hnswlib, 64 for the slower NumPy graph)
+        use_hnswlib: bool - use hnswlib when installed (default True)
+        seed: int - insertion order of the NumPy graph
+    """
+
+    name = "graph"
+    exact = False
+
+    def fit(self, features, sq_norms=None):
+        self.features = np.asarray(features, dtype=np.float32)
+        self.size = len(self.features)
+        self.m = self.params.get("m", 16)
+        self.ef = self.params.get("ef", 64)
+        self.hnsw = None
+        if self.params.get("use_hnswlib", True):
+            try:
+                import hnswlib
+            except ImportError:
+                hnswlib = None
+            if hnswlib is not None:
+                self.hnsw = hnswlib.Index(space="l2", dim=self.features.shape[1])
+                self.hnsw.init_index(
+                    max_elements=max(self.size, 1),
+                    M=self.m,
+                    ef_construction=self.params.get("ef_construction", 200),
+                )
+                self.hnsw.add_items(self.features, np.arange(self.size))
+                return self
+
+        self.graph = [np.empty(0, dtype=np.int64) for _ in range(self.size)]
+        if self.size == 0:
+            return self
+        order = np.random.default_rng(self.params.get("seed", 0)).permutation(self.size)
+        self.entry = int(order[0])
+        ef_construction = self.params.get("ef_construction", 64)
+        max_degree = 2 * self.m
+        visits = np.zeros(self.size, dtype=np.int64)
+        for generation, node in enumerate(order[1:].tolist(), start=1):
+            nearest, _ = self._search(self.features[node], self.m, ef_construction, visits, generation)
+            self.graph[node] = np.asarray(nearest, dtype=np.int64)
+            for neighbour in nearest:
+                links = np.append(self.graph[neighbour], node)
+                if len(links) > max_degree:
+                    distances = np.linalg.norm(
+                        self.features[links] - self.features[neighbour], axis=1
+                    )
+                    links = links[np.argsort(distances)[:max_degree]]
+                self.graph[neighbour] = links
+        return self
+
+    def _search(self, query, k, ef, visits, generation):
+        """
+        Best-first beam search from the entry node: (k closest nodes, distances).
+
+        Nodes with visits[node] == generation were already seen, so one
+        visits array serves a whole batch of searches.
+        """
+        ef = max(ef, k)
+        visits[self.entry] = generation
+        distance = float(np.linalg.norm(self.features[self.entry] - query))
+        candidates = [(distance, self.entry)]
+        results = [(-distance, self.entry)]  # max-heap of the best ef so far
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if distance > -results[0][0] and len(results) >= ef:
+                break
+            neighbours = self.graph[node]
+            neighbours = neighbours[visits[neighbours] != generation]
+            if len(neighbours) == 0:
+                continue
+            visits[neighbours] = generation
+            distances = np.linalg.norm(self.features[neighbours] - query, axis=1)
+            for neighbour, neighbour_distance in zip(neighbours.tolist(), distances.tolist()):
+                if len(results) < ef or neighbour_distance < -results[0][0]:
+                    heapq.heappush(candidates, (neighbour_distance, neighbour))
+                    heapq.heappush(results, (-neighbour_distance, neighbour))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        best = sorted((-d, node) for d, node in results)[:k]
+        return [node for _, node in best], [d for d, _ in best]
+
+    def query(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, self.size)
+        if self.hnsw is not None:
+            self.hnsw.set_ef(max(self.ef, k))
+            labels, sq_distances = self.hnsw.knn_query(queries, k=k)
+            return labels.astype(np.int64), np.sqrt(sq_distances).astype(np.float32)
+
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        if k == 0:
+            return indices, distances
+        # Per call rather than per backend: fitted backends are shared across threads
+        visits = np.zeros(self.size, dtype=np.int64)
+        for row, query in enumerate(queries):
+            indices[row], distances[row] = self._search(query, k, self.ef, visits, row + 1)
+        return indices, distances
+
+    def nbytes(self):
+        if self.hnsw is not None:
+            # hnswlib keeps the vectors plus roughly 2*M links per element
+            return self.features.nbytes + self.size * self.m * 2 * 4
+        return self.features.nbytes + sum(edges.nbytes for edges in self.graph)
+
+
+BACKENDS = {
+    backend.name: backend for backend in (BruteForceBackend, SklearnTreeBackend, GraphBackend)
+}
+
+
+def get_backend(name: str = None, **params) -> MatcherBackend:
+    """
+    Creates an (unfitted) backend.
+
+    Args:
+        name: str - one of BACKENDS; defaults to FMP_MATCH_BACKEND or "brute"
+        params: constructor parameters; default to FMP_MATCH_BACKEND_PARAMS
+    """
+    if name is None:
+        name = os.getenv("FMP_MATCH_BACKEND", "brute")
+        if not params:
+            params = json.loads(os.getenv("FMP_MATCH_BACKEND_PARAMS", "{}"))
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown match backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**params)
+
+
+def recall_at_k(backend: MatcherBackend, exact: MatcherBackend, queries, k: int = 10) -> float:
+    """Fraction of the exact top-k neighbours that `backend` also returns."""
+    found, _ = backend.query(queries, k)
+    expected, _ = exact.query(queries, k)
+    hits = sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(found, expected))
+    return hits / expected.size if expected.size else 1.0
@@ -0,0 +1,232 @@
+"""
+Offline bulk ingestion of cases from a folder of images plus a CSV.
+
+    python -m pages.helper.bulk_ingest --table registered --csv cases.csv --images ./photos
+
+Every CSV row needs an `image` column naming a file in --images; the other
+columns are parsed into the RegisteredCases/PublicSubmissions fields of the
+same name (unknown columns are ignored, an optional `id` column is kept).
+Rows with a blank required field or a value that doesn't parse are reported
+and skipped, and are picked up again once the CSV is fixed. Landmarks are
+extracted in a process pool, rows are inserted one batch per transaction
+and their images are streamed into the image_store once the insert has
+committed. Finished images are appended to `<csv>.progress`, so an
+interrupted run picks up where it left off when started again. Rows without
+an `id` get one derived from their table and image name, and rows whose id
+is already stored are not inserted again, so a run interrupted between an
+insert and its progress write doesn't duplicate those cases.
+"""
+import argparse
+import csv
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from uuid import NAMESPACE_URL, uuid5
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from pages.helper import db_queries, image_store
+from pages.helper.data_models import PublicSubmissions, RegisteredCases
+
+TABLES = {"registered": RegisteredCases, "public": PublicSubmissions}
+# Namespace of the ids derived for CSV rows without one
+ID_NAMESPACE = uuid5(NAMESPACE_URL, "face-missing-person/bulk-ingest")
+
+
+def _extract(image_path: str):
+    """Runs in a worker process; each worker keeps its own FaceMesh graph."""
+    from pages.helper.utils import extract_batch, image_obj_to_numpy
+
+    try:
+        with open(image_path, "rb") as image_file:
+            image = image_obj_to_numpy(image_file)
+        return extract_batch([image])[0]
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def _read_progress(progress_path: str) -> set:
+    if not os.path.isfile(progress_path):
+        return set()
+    with open(progress_path, encoding="utf-8") as file:
+        return {line.rstrip("\n") for line in file if line.strip()}
+
+
+def _batches(rows, batch_size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Filled in by ingest itself, never read from the CSV
+GENERATED_FIELDS = ("face_mesh", "face_mesh_blob", "descriptor_blob", "descriptor_version")
+PARSERS = {datetime: datetime.fromisoformat, int: int, float: float}
+
+
+def parse_row(model, row: dict) -> dict:
+    """
+    Model fields of one CSV row, parsed and checked against the table.
+
+    Blank values become None; the status is filled in when missing, and so
+    is the id, derived from the table and the row's image name so that
+    ingesting the same row twice gives the same id.
+
+    Raises:
+        ValueError - naming the first field that is missing or invalid
+    """
+    columns = model.__table__.columns
+    fields = {}
+    for key, value in row.items():
+        if key not in model.model_fields or key in GENERATED_FIELDS:
+            continue
+        value = (value or "").strip() or None
+        if value is None:
+            continue
+        parse = PARSERS.get(model.model_fields[key].annotation)
+        try:
+            fields[key] = parse(value) if parse else value
+        except ValueError:
+            raise ValueError(f"{key}: can't parse {value!r}")
+        length = getattr(columns[key].type, "length", None)
+        if length and isinstance(fields[key], str) and len(fields[key]) > length:
+            raise ValueError(f"{key}: longer than {length} characters")
+    fields["id"] = fields.get("id") or str(uuid5(ID_NAMESPACE, f"{model.__tablename__}/{row['image']}"))
+    fields["status"] = fields.get("status") or "NF"
+
+    for column in columns:
+        required = not column.nullable and column.default is None
+        if required and column.name not in GENERATED_FIELDS and column.name not in fields:
+            raise ValueError(f"{column.name}: required")
+    return fields
+
+
+def _insert(model, rows: list) -> list:
+    """
+    Inserts (csv row, fields, face mesh) rows in one transaction, or one by
+    one if the batch is refused, so a single bad row can't fail the rest.
+
+    Returns:
+        list - the rows that were inserted
+    """
+    def records(rows):
+        return [model(face_mesh=json.dumps(face_mesh), **fields) for _, fields, face_mesh in rows]
+
+    try:
+        db_queries.add_cases(records(rows))
+        return rows
+    except (SQLAlchemyError, ValueError):
+        if len(rows) == 1:
+            print(f"[INGEST] Couldn't insert {rows[0][0]['image']}, skipping")
+            traceback.print_exc()
+            return []
+    return [inserted for row in rows for inserted in _insert(model, [row])]
+
+
+def ingest(table: str, csv_path: str, images_dir: str, workers: int = None, batch_size: int = 200):
+    """
+    Ingests every not-yet-processed CSV row.
+
+    Args:
+        table: str - "registered" or "public"
+        csv_path: str - case metadata, one row per image
+        images_dir: str - folder the `image` column is relative to
+        workers: int - landmark extraction processes (default: CPU count)
+        batch_size: int - rows per insert transaction
+
+    Returns:
+        dict - {"status": bool, "message": str, "inserted": int, "skipped": int,
+            "invalid": int - rows that failed parse_row, retried on the next run,
+            "existing": int - rows already stored by an interrupted run}
+    """
+    model = TABLES[table]
+    progress_path = csv_path + ".progress"
+    done = _read_progress(progress_path)
+    db_queries.create_db()
+
+    inserted = skipped = invalid = existing = 0
+    with open(csv_path, newline="", encoding="utf-8") as csv_file, ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor, open(progress_path, "a", encoding="utf-8") as progress:
+        reader = csv.DictReader(csv_file)
+        pending = (row for row in reader if row["image"] not in done)
+        for batch in _batches(pending, batch_size):
+            # Bad rows are reported and left out of the progress file, so
+            # they are retried once the CSV is fixed
+            valid = []
+            for row in batch:
+                try:
+                    valid.append((row, parse_row(model, row)))
+                except ValueError as e:
+                    print(f"[INGEST] Invalid row for {row['image']}: {e}")
+                    invalid += 1
+
+            # Inserted by a run that stopped before writing its progress:
+            # only their images are (re)stored
+            stored_ids = db_queries.existing_case_ids(model, [fields["id"] for _, fields in valid])
+            resumed = [(row, fields, None) for row, fields in valid if fields["id"] in stored_ids]
+            new = [(row, fields) for row, fields in valid if fields["id"] not in stored_ids]
+            existing += len(resumed)
+
+            paths = [os.path.join(images_dir, row["image"]) for row, _ in new]
+            meshes = executor.map(_extract, paths, chunksize=max(1, len(paths) // 32))
+            rows = []
+            for (row, fields), path, face_mesh in zip(new, paths, meshes):
+                if face_mesh is None:
+                    print(f"[INGEST] No face found in {path}, skipping")
+                    skipped += 1
+                    continue
+                rows.append((row, fields, face_mesh))
+
+            stored = _insert(model, rows) if rows else []
+            skipped += len(rows) - len(stored)
+            inserted += len(stored)
+            # Images only for committed rows, so a failed insert leaves no orphan files
+            image_hashes = []
+            for row, fields, _ in stored + resumed:
+                try:
+                    with open(os.path.join(images_dir, row["image"]), "rb") as image_file:
+                        image_hashes.append((fields["id"], image_store.store_file(image_file)))
+                except OSError:
+                    traceback.print_exc()
+            if image_hashes:
+                db_queries.save_case_images(image_hashes)
+
+            progress.write("".join(row["image"] + "\n" for row, _ in valid))
+            progress.flush()
+            print(f"[INGEST] {inserted} inserted, {skipped} skipped, {invalid} invalid, {existing} already stored")
+
+    if (inserted or existing) and model is db_queries.PublicSubmissions:
+        # Same as a single new_public_case(): score the new rows in the background
+        db_queries.enqueue_job("match", {"mode": "incremental"}, dedupe=True)
+
+    return {
+        "status": True,
+        "message": f"Inserted {inserted} cases, skipped {skipped}, {invalid} invalid rows, {existing} already stored",
+        "inserted": inserted,
+        "skipped": skipped,
+        "invalid": invalid,
+        "existing": existing,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-register cases from images + CSV")
+    parser.add_argument("--table", choices=sorted(TABLES), required=True)
+    parser.add_argument("--csv", required=True, help="CSV with an `image` column")
+    parser.add_argument("--images", required=True, help="folder containing the images")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    result = ingest(
+        args.table, args.csv, args.images, args.workers, args.batch_size
+    )
+    print(result["message"])
@@ -1,26 +1,55 @@
 from uuid import uuid4
 from datetime import datetime
+from sqlalchemy import Index
 from sqlmodel import Field, create_engine, SQLModel
 
 
 class PublicSubmissions(SQLModel, table=True):
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # Keyset pages, newest first: ORDER BY submitted_on DESC, id DESC
+        Index("ix_publicsubmissions_status_submitted_on_id", "status", "submitted_on", "id"),
+        Index("ix_publicsubmissions_submitted_on_id", "submitted_on", "id"),
+        Index("ix_publicsubmissions_parent_id", "parent_id"),
+        {"extend_existing": True},
+    )
 
     id: str = Field(
         primary_key=True, default_factory=lambda: str(uuid4()), nullable=False
     )
     submitted_by: str = Field(max_length=128, nullable=True)
     face_mesh: str = Field(nullable=False)  # JSON string of face mesh landmarks
+    face_mesh_blob: bytes = Field(default=None, nullable=True)  # float32 x 1434 landmarks
+    descriptor_blob: bytes = Field(default=None, nullable=True)  # float32 aligned descriptor
+    descriptor_version: str = Field(default=None, max_length=16, nullable=True)
     location: str = Field(max_length=128, nullable=True)
     mobile: str = Field(max_length=10, nullable=False)
     email: str = Field(max_length=64, nullable=True)
     status: str = Field(max_length=16, nullable=False)  # e.g., "F", "NF"
     birth_marks: str = Field(max_length=512, nullable=True)
     submitted_on: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    # Multi-face uploads: one row per face, the extra faces point at the
+    # upload's first row
+    parent_id: str = Field(default=None, nullable=True)
+    face_index: int = Field(default=None, nullable=True)
+    face_box: str = Field(default=None, nullable=True)  # JSON [x0, y0, x1, y1], image-normalised
 
 
 class RegisteredCases(SQLModel, table=True):
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index("ix_registeredcases_status_submitted_by", "status", "submitted_by"),
+        Index("ix_registeredcases_status_submitted_on", "status", "submitted_on"),
+        # Keyset pages of one submitter, newest first: ORDER BY
+        # submitted_on DESC, id DESC, with and without a status filter
+        Index(
+            "ix_registeredcases_submitted_by_status_submitted_on_id",
+            "submitted_by",
+            "status",
+            "submitted_on",
+            "id",
+        ),
+        Index("ix_registeredcases_submitted_by_submitted_on_id", "submitted_by", "submitted_on", "id"),
+        {"extend_existing": True},
+    )
 
     id: str = Field(
         primary_key=True, default_factory=lambda: str(uuid4()), nullable=False
@@ -35,6 +64,9 @@ class RegisteredCases(SQLModel, table=True):
     last_seen: str = Field(max_length=64, nullable=True)
     address: str = Field(max_length=512, nullable=True)
     face_mesh: str = Field(nullable=False)  # JSON string of face mesh landmarks
+    face_mesh_blob: bytes = Field(default=None, nullable=True)  # float32 x 1434 landmarks
+    descriptor_blob: bytes = Field(default=None, nullable=True)  # float32 aligned descriptor
+    descriptor_version: str = Field(default=None, max_length=16, nullable=True)
     submitted_on: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     status: str = Field(max_length=16, nullable=False)  # "F" = Found, "NF" = Not Found
     birth_marks: str = Field(max_length=512, nullable=True)
@@ -47,6 +79,82 @@ class RegisteredCases(SQLModel, table=True):
     witness_summary: str = Field(nullable=True)        # AI witness statement summary
 
 
+class MatchWatermarks(SQLModel, table=True):
+    """Last rowid processed by match() for each case table."""
+
+    __table_args__ = {"extend_existing": True}
+
+    table_name: str = Field(primary_key=True, max_length=64, nullable=False)
+    # SQLite rowids follow commit order; client-side submitted_on stamps don't
+    last_rowid: int = Field(default=None, nullable=True)
+    index_version: int = Field(default=0, nullable=False)
+    updated_on: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class MatchCandidates(SQLModel, table=True):
+    """Ranked nearest-neighbour pairs materialized by match_algo.match()."""
+
+    __table_args__ = (
+        Index("ix_matchcandidates_score", "score"),
+        Index("ix_matchcandidates_public_id_registered_rank", "public_id", "registered_rank"),
+        {"extend_existing": True},
+    )
+
+    registered_id: str = Field(primary_key=True, nullable=False)
+    public_id: str = Field(primary_key=True, nullable=False)
+    distance: float = Field(nullable=False)
+    score: float = Field(nullable=False)  # 0-1, 0.5 at the match threshold
+    registered_rank: int = Field(default=None, nullable=True)  # rank among the public case's candidates
+    public_rank: int = Field(default=None, nullable=True)  # rank among the registered case's candidates
+    computed_on: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class Jobs(SQLModel, table=True):
+    """Background work (matching, index rebuilds, GenAI calls) run by pages.helper.jobs."""
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_on", "status", "created_on"),
+        Index("ix_jobs_kind_status", "kind", "status"),
+        {"extend_existing": True},
+    )
+
+    id: str = Field(
+        primary_key=True, default_factory=lambda: str(uuid4()), nullable=False
+    )
+    kind: str = Field(max_length=32, nullable=False)  # key of jobs.JOB_HANDLERS
+    params: str = Field(default="{}", nullable=False)  # JSON object
+    status: str = Field(default="queued", max_length=16, nullable=False)  # queued, running, done, failed
+    progress: float = Field(default=0.0, nullable=False)  # 0-1
+    message: str = Field(default=None, max_length=256, nullable=True)  # latest progress note
+    result: str = Field(default=None, nullable=True)  # JSON, set when done
+    error: str = Field(default=None, nullable=True)  # set when failed
+    worker: str = Field(default=None, max_length=64, nullable=True)
+    created_on: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    started_on: datetime = Field(default=None, nullable=True)
+    finished_on: datetime = Field(default=None, nullable=True)
+
+
+class LLMCache(SQLModel, table=True):
+    """GenAI responses keyed by a hash of (model, temperature, max_tokens, prompt)."""
+
+    __table_args__ = {"extend_existing": True}
+
+    prompt_hash: str = Field(primary_key=True, max_length=64, nullable=False)
+    model: str = Field(max_length=64, nullable=False)
+    response: str = Field(nullable=False)
+    created_on: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class CaseImages(SQLModel, table=True):
+    """Content hash of the image stored for a registered or public case."""
+
+    __table_args__ = {"extend_existing": True}
+
+    case_id: str = Field(primary_key=True, nullable=False)
+    content_hash: str = Field(max_length=64, nullable=False, index=True)
+    created_on: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
 if __name__ == "__main__":
     sqlite_url = "sqlite:///sqlite_database.db"
     engine = create_engine(sqlite_url)
@@ -1,43 +1,294 @@
+import json
 import os
 import sqlite3
+from datetime import datetime, timedelta
 from sqlmodel import create_engine, Session, select, SQLModel
-from sqlalchemy import or_
-from pages.helper.data_models import RegisteredCases, PublicSubmissions
+from sqlalchemy import and_, bindparam, case, event, func, inspect, literal_column, or_, text, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from pages.helper.data_models import (
+    RegisteredCases,
+    PublicSubmissions,
+    MatchWatermarks,
+    MatchCandidates,
+    Jobs,
+    LLMCache,
+    CaseImages,
+)
+from pages.helper import landmark_store, metrics
 
 # --- Absolute DB path ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-sqlite_url = f"sqlite:///{os.path.join(BASE_DIR, 'sqlite_database.db')}"
-engine = create_engine(sqlite_url)
+DB_PATH = os.getenv("FMP_DB_PATH", os.path.join(BASE_DIR, "sqlite_database.db"))
+sqlite_url = f"sqlite:///{DB_PATH}"
+
+# --- SQLite performance profile ---
+# Home.py and mobile_app.py write to the same file from separate processes.
+# WAL lets readers run alongside a writer, and busy_timeout makes a second
+# writer wait for the lock instead of failing. Any entry can be overridden
+# with an FMP_SQLITE_<NAME> environment variable, e.g.
+# FMP_SQLITE_CACHE_SIZE=-131072.
+ENGINE_PROFILE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # safe with WAL, skips an fsync per commit
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative = KiB, i.e. 64 MiB per connection
+    "busy_timeout": 5000,  # ms
+    "temp_store": "MEMORY",
+    "pool_size": 5,
+    "max_overflow": 10,
+}
+_ENGINE_OPTIONS = ("pool_size", "max_overflow")
+
+
+def _engine_profile(overrides: dict = None) -> dict:
+    profile = {}
+    for name, default in ENGINE_PROFILE.items():
+        value = os.getenv(f"FMP_SQLITE_{name.upper()}", default)
+        profile[name] = int(value) if isinstance(default, int) else value
+    profile.update(overrides or {})
+    return profile
+
+
+def make_engine(url: str = sqlite_url, read_only: bool = False, profile: dict = None):
+    """
+    Create a SQLite engine with the performance profile applied on connect.
+
+    Args:
+        url: str - SQLAlchemy sqlite URL
+        read_only: bool - connections refuse writes (PRAGMA query_only), for
+            listing pages that must never take the write lock
+        profile: dict - overrides for ENGINE_PROFILE entries
+    """
+    profile = _engine_profile(profile)
+    new_engine = create_engine(
+        url,
+        pool_size=profile["pool_size"],
+        max_overflow=profile["max_overflow"],
+        connect_args={
+            "timeout": profile["busy_timeout"] / 1000,
+            "check_same_thread": False,
+        },
+    )
+    pragmas = {k: v for k, v in profile.items() if k not in _ENGINE_OPTIONS}
+    if read_only:
+        pragmas["query_only"] = "ON"
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return new_engine
+
+
+engine = make_engine()
+read_engine = make_engine(read_only=True)
+
+# Callbacks run with a table name (and the submitter whose rows changed,
+# when known) whenever rows in that table change
+_change_hooks = []
+
+
+def register_change_hook(hook):
+    """
+    Register `hook(table_name, submitted_by)` to be called after case rows
+    change. submitted_by is None when the change is not tied to one user.
+    """
+    if hook not in _change_hooks:
+        _change_hooks.append(hook)
+
+
+def _notify_change(*models, submitters=None):
+    for model in models:
+        for submitted_by in submitters or [None]:
+            for hook in _change_hooks:
+                try:
+                    hook(model.__tablename__, submitted_by)
+                except Exception as e:
+                    print(f"[DB] Change hook failed for {model.__tablename__}: {e}")
 
 
 def create_db():
     """Create the database tables if not exist."""
     try:
         SQLModel.metadata.create_all(engine)
+        migrate_columns()
+        migrate_face_mesh_blobs()
+        migrate_indexes()
     except Exception as e:
         print(f"[DB] Error creating tables: {e}")
 
 
+def migrate_columns():
+    """
+    Add nullable columns declared in data_models that an existing table lacks.
+
+    create_all() never alters tables that already exist.
+    """
+    inspector = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                )
+            print(f"[DB] Added {column.name} column to {table.name}")
+
+
+def migrate_face_mesh_blobs(batch_size: int = 500):
+    """
+    One-shot migration from JSON face meshes to float32 landmark blobs.
+
+    Backfills face_mesh_blob from the JSON text. Rows whose mesh can't be
+    decoded get an empty blob so they are not retried on every startup.
+    """
+    for model in (RegisteredCases, PublicSubmissions):
+        table = model.__tablename__
+        migrated = 0
+        with Session(engine) as session:
+            while True:
+                rows = session.exec(
+                    select(model.id, model.face_mesh)
+                    .where(model.face_mesh_blob.is_(None))
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                session.execute(
+                    model.__table__.update()
+                    .where(model.__table__.c.id == bindparam("row_id"))
+                    .values(face_mesh_blob=bindparam("blob")),
+                    [
+                        {
+                            "row_id": row_id,
+                            "blob": landmark_store.pack_face_mesh_json(face_mesh) or b"",
+                        }
+                        for row_id, face_mesh in rows
+                    ],
+                )
+                session.commit()
+                migrated += len(rows)
+        if migrated:
+            print(f"[DB] Migrated {migrated} face meshes in {table} to blobs")
+
+
+# Indexes an earlier schema declared, superseded by wider ones
+OBSOLETE_INDEXES = (
+    "ix_publicsubmissions_status_submitted_on",
+    "ix_registeredcases_submitted_by_status_submitted_on",
+)
+
+
+def migrate_indexes():
+    """
+    Create indexes declared in data_models that an existing database lacks,
+    and drop the OBSOLETE_INDEXES it still has.
+
+    create_all() only creates indexes together with new tables, so databases
+    created before an index was declared need this.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        for name in OBSOLETE_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def submitter_filter(column, submitted_by: str):
+    """
+    Exact-or-prefix match on a submitter column.
+
+    Expressed as a range rather than LIKE/ILIKE so SQLite can seek the
+    (status, submitted_by) index instead of scanning the table.
+    """
+    return and_(column >= submitted_by, column < submitted_by + "\U0010ffff")
+
+
+def row_sequence(model):
+    """
+    SQLite rowid of `model`'s table, as a column expression.
+
+    SQLite has one writer at a time and gives every insert max(rowid) + 1,
+    so rowids increase in commit order, unlike submitted_on, which is
+    stamped when the object is built and can be set by the caller. Case rows
+    are never deleted, so rowids are not reused.
+    """
+    return literal_column(f"{model.__tablename__}.rowid")
+
+
+def _fill_face_mesh_blob(record):
+    if record.face_mesh_blob is None:
+        record.face_mesh_blob = landmark_store.pack_face_mesh_json(record.face_mesh) or b""
+
+
+def _require_face_mesh(record):
+    """Fills the landmark blob, refusing records without usable landmarks."""
+    _fill_face_mesh_blob(record)
+    if not record.face_mesh_blob:
+        raise ValueError("No face landmarks: the face mesh is missing or malformed")
+
+
 # ----------------------- CASE REGISTRATION -----------------------
 
 def register_new_case(case_details: RegisteredCases) -> str:
+    _require_face_mesh(case_details)
     with Session(engine) as session:
         session.add(case_details)
         session.commit()
         session.refresh(case_details)
-        return case_details.id
+    _notify_change(RegisteredCases, submitters=[case_details.submitted_by])
+    return case_details.id
 
 
-def fetch_registered_cases(submitted_by: str, status: str):
-    """Fetch registered cases filtered by submitter and status."""
+def add_cases(records: list):
+    """
+    Insert many RegisteredCases/PublicSubmissions rows in one transaction.
+
+    Rows of the same table are flushed together, so SQLAlchemy batches them
+    into executemany inserts.
+    """
+    submitters = {}
+    for record in records:
+        _require_face_mesh(record)
+        submitters.setdefault(type(record), set()).add(record.submitted_by)
+    with Session(engine) as session:
+        session.add_all(records)
+        session.commit()
+    for model, model_submitters in submitters.items():
+        _notify_change(model, submitters=model_submitters)
+
+
+def existing_case_ids(model, ids: list) -> set:
+    """The ids among `ids` that already have a `model` row."""
+    if not ids:
+        return set()
+    with Session(engine) as session:
+        return set(session.exec(select(model.id).where(model.id.in_(ids))).all())
+
+
+def _status_values(status: str) -> list:
+    """Maps the UI status filter ("All", "Found", "Not Found") to stored codes."""
     if status == "All":
-        status = ["F", "NF"]
+        return ["F", "NF"]
     elif status == "Found":
-        status = ["F"]
+        return ["F"]
     elif status == "Not Found":
-        status = ["NF"]
+        return ["NF"]
+    return [status]
 
-    with Session(engine) as session:
+
+def fetch_registered_cases(submitted_by: str, status: str):
+    """Fetch registered cases filtered by submitter and status."""
+    status = _status_values(status)
+
+    with Session(read_engine) as session:
         result = session.exec(
             select(
                 RegisteredCases.id,
@@ -47,13 +298,8 @@ def fetch_registered_cases(submitted_by: str, status: str):
                 RegisteredCases.last_seen,
                 RegisteredCases.matched_with,
             )
-            .where(
-                or_(
-                    RegisteredCases.submitted_by == submitted_by,
-                    RegisteredCases.submitted_by.ilike(f"%{submitted_by}%")
-                )
-            )
             .where(RegisteredCases.status.in_(status))
+            .where(submitter_filter(RegisteredCases.submitted_by, submitted_by))
         ).all()
         return result
 
@@ -77,20 +323,100 @@ def get_training_data(submitted_by: str):
 # ----------------------- PUBLIC CASE HANDLING -----------------------
 
 def new_public_case(public_case_details: PublicSubmissions):
+    _require_face_mesh(public_case_details)
     with Session(engine) as session:
         session.add(public_case_details)
+        # Score the new submission in the background, in the same transaction
+        _enqueue_job(session, "match", {"mode": "incremental"}, dedupe=True)
+        session.commit()
+    _notify_change(PublicSubmissions)
+
+
+def new_public_faces(
+    public_case_details: PublicSubmissions, faces: list, first_index: int = 0, queue_match: bool = True
+) -> list:
+    """
+    Saves a multi-face upload: one PublicSubmissions row per detected face.
+
+    The first face is stored on `public_case_details` itself; every other
+    face gets a copy of its details, stamped with its own submitted_on,
+    with parent_id set to its id, and shares its stored image unless the
+    face brings its own. All rows are
+    committed with a single incremental match job, so the worker scores
+    every face in one batch, unless `queue_match` is False.
+
+    Args:
+        public_case_details: PublicSubmissions - the upload, face_mesh unset
+        faces: list of dicts with "landmarks" (flat list), "box" and
+            optionally "image_hash" (image_store hash of this face's image)
+        first_index: int - face_index of faces[0]; above 0 the faces are
+            added to an upload saved earlier, and public_case_details only
+            supplies the details and parent id
+        queue_match: bool - enqueue the incremental match job; False when
+            the caller runs match() itself right after saving
+
+    Returns:
+        list - ids of the saved rows, in `faces` order
+
+    Raises:
+        ValueError - if a face has no usable landmarks; nothing is saved
+    """
+    details = public_case_details.model_dump(
+        exclude={"id", "submitted_on", "face_mesh", "face_mesh_blob", "parent_id", "face_index", "face_box"}
+    )
+    records = []
+    for face_index, face in enumerate(faces, start=first_index):
+        record = public_case_details if face_index == 0 else PublicSubmissions(**details)
+        record.face_mesh = json.dumps(face["landmarks"])
+        record.face_mesh_blob = landmark_store.pack_landmarks(face["landmarks"])
+        _require_face_mesh(record)
+        record.face_index = face_index
+        record.face_box = json.dumps(face["box"])
+        if face_index > 0:
+            record.parent_id = public_case_details.id
+        records.append(record)
+    ids = [record.id for record in records]
+
+    with Session(engine) as session:
+        parent_image = session.get(CaseImages, public_case_details.id)
+        session.add_all(records)
+        for face_id, face in zip(ids, faces):
+            content_hash = face.get("image_hash")
+            if content_hash is None and parent_image is not None and face_id != public_case_details.id:
+                content_hash = parent_image.content_hash
+            if content_hash is not None:
+                session.merge(CaseImages(case_id=face_id, content_hash=content_hash))
+        if queue_match:
+            _enqueue_job(session, "match", {"mode": "incremental"}, dedupe=True)
         session.commit()
+    _notify_change(PublicSubmissions)
+    return ids
+
+
+def get_submission_faces(submission_id: str):
+    """Every face row of the upload `submission_id`, first face first."""
+    with Session(read_engine) as session:
+        return session.exec(
+            select(PublicSubmissions)
+            .where(
+                or_(
+                    PublicSubmissions.id == submission_id,
+                    PublicSubmissions.parent_id == submission_id,
+                )
+            )
+            .order_by(PublicSubmissions.face_index)
+        ).all()
 
 
 def fetch_public_cases(train_data: bool, status: str):
     if train_data:
-        with Session(engine) as session:
+        with Session(read_engine) as session:
             return session.exec(
                 select(PublicSubmissions.id, PublicSubmissions.face_mesh)
                 .where(PublicSubmissions.status == status)
             ).all()
 
-    with Session(engine) as session:
+    with Session(read_engine) as session:
         return session.exec(
             select(
                 PublicSubmissions.id,
@@ -105,8 +431,49 @@ def fetch_public_cases(train_data: bool, status: str):
         ).all()
 
 
-def get_public_case_detail(case_id: str):
+LANDMARK_CHUNK_SIZE = 1000
+
+
+def fetch_landmarks(model, status: str = None, after_rowid: int = None, until_rowid: int = None, submitted_by: str = None):
+    """
+    Fetch the ids and landmark matrix of cases in `model`'s table.
+
+    Rows are streamed from SQLite in chunks of LANDMARK_CHUNK_SIZE and copied
+    into a float32 matrix preallocated from a COUNT of the same filter, so
+    peak memory stays at the matrix plus one chunk.
+
+    Args:
+        model: RegisteredCases or PublicSubmissions
+        status: str - optional status filter, e.g. "NF"
+        after_rowid: int - only rows committed after this one (row_sequence)
+        until_rowid: int - only rows up to and including this one
+        submitted_by: str - only rows submitted by this user
+
+    Returns:
+        (list of ids, (N, 1434) float32 ndarray)
+    """
+    conditions = [func.length(model.face_mesh_blob) == landmark_store.BLOB_SIZE]
+    if status:
+        conditions.append(model.status == status)
+    if after_rowid is not None:
+        conditions.append(row_sequence(model) > after_rowid)
+    if until_rowid is not None:
+        conditions.append(row_sequence(model) <= until_rowid)
+    if submitted_by is not None:
+        conditions.append(model.submitted_by == submitted_by)
+
     with Session(engine) as session:
+        expected = session.exec(select(func.count()).select_from(model).where(*conditions)).one()
+        rows = session.exec(
+            select(model.id, model.face_mesh_blob)
+            .where(*conditions)
+            .execution_options(yield_per=LANDMARK_CHUNK_SIZE)
+        )
+        return landmark_store.fill_landmarks(rows, expected)
+
+
+def get_public_case_detail(case_id: str):
+    with Session(read_engine) as session:
         return session.exec(
             select(
                 PublicSubmissions.location,
@@ -118,7 +485,7 @@ def get_public_case_detail(case_id: str):
 
 
 def get_registered_case_detail(case_id: str):
-    with Session(engine) as session:
+    with Session(read_engine) as session:
         return session.exec(
             select(
                 RegisteredCases.name,
@@ -131,12 +498,156 @@ def get_registered_case_detail(case_id: str):
 
 
 def list_public_cases():
-    with Session(engine) as session:
+    with Session(read_engine) as session:
         return session.exec(select(PublicSubmissions)).all()
 
 
+# ----------------------- PAGINATED LISTINGS -----------------------
+
+def _date_range_filter(column, start_date=None, end_date=None):
+    """Inclusive [start_date, end_date] filter on a datetime column."""
+    conditions = []
+    if start_date is not None:
+        conditions.append(column >= datetime.combine(start_date, datetime.min.time()))
+    if end_date is not None:
+        conditions.append(
+            column < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        )
+    return and_(*conditions) if conditions else None
+
+
+def _keyset_filter(model, after):
+    """
+    Rows strictly after the (submitted_on, id) cursor, newest first.
+
+    A row-value comparison, so SQLite seeks the (..., submitted_on, id)
+    index to the cursor instead of filtering row by row.
+    """
+    submitted_on, row_id = after
+    return tuple_(model.submitted_on, model.id) < tuple_(submitted_on, row_id)
+
+
+def _page_status_filter(model, status: str):
+    """
+    Status condition of a listing page, or None for "All". Cases are only
+    ever "F" or "NF", so "All" needs no condition, and leaving it out lets
+    SQLite walk the (..., submitted_on, id) index in page order instead of
+    merging two status ranges with a sort.
+    """
+    if status == "All":
+        return None
+    values = _status_values(status)
+    return model.status == values[0] if len(values) == 1 else model.status.in_(values)
+
+
+def list_registered_cases_page(submitted_by: str, status: str = "All", start_date=None, end_date=None, after=None, limit: int = 20):
+    """
+    One page of registered cases, newest first, with matched public case details.
+
+    Args:
+        submitted_by: str - exact submitter
+        status: str - "All", "Found" or "Not Found"
+        start_date, end_date: date - optional inclusive submitted_on range
+        after: (submitted_on, id) of the last row of the previous page
+        limit: int - page size
+
+    Every page is a seek on the (submitted_by[, status], submitted_on, id)
+    index followed by `limit` rows in index order: no sort, whatever the
+    page number.
+
+    Returns:
+        list of rows with id, name, age, status, last_seen, submitted_on and
+        the matched public case's match_location, match_submitted_by,
+        match_mobile and match_birth_marks (None when unmatched)
+    """
+    matched = PublicSubmissions.__table__.alias("matched")
+    query = (
+        select(
+            RegisteredCases.id,
+            RegisteredCases.name,
+            RegisteredCases.age,
+            RegisteredCases.status,
+            RegisteredCases.last_seen,
+            RegisteredCases.submitted_on,
+            matched.c.location.label("match_location"),
+            matched.c.submitted_by.label("match_submitted_by"),
+            matched.c.mobile.label("match_mobile"),
+            matched.c.birth_marks.label("match_birth_marks"),
+        )
+        # Older rows stored matched_with wrapped in braces
+        .outerjoin(matched, matched.c.id == func.trim(RegisteredCases.matched_with, "{}"))
+        .where(RegisteredCases.submitted_by == submitted_by)
+    )
+    status_filter = _page_status_filter(RegisteredCases, status)
+    if status_filter is not None:
+        query = query.where(status_filter)
+    date_filter = _date_range_filter(RegisteredCases.submitted_on, start_date, end_date)
+    if date_filter is not None:
+        query = query.where(date_filter)
+    if after is not None:
+        query = query.where(_keyset_filter(RegisteredCases, after))
+    query = query.order_by(
+        RegisteredCases.submitted_on.desc(), RegisteredCases.id.desc()
+    ).limit(limit)
+
+    with Session(read_engine) as session:
+        return session.exec(query).all()
+
+
+def list_public_cases_page(status: str = "All", submitted_by: str = None, start_date=None, end_date=None, after=None, limit: int = 20):
+    """
+    One page of public submissions, newest first.
+
+    Args:
+        status: str - "All", "Found" or "Not Found"
+        submitted_by: str - optional exact submitter filter
+        start_date, end_date: date - optional inclusive submitted_on range
+        after: (submitted_on, id) of the last row of the previous page
+        limit: int - page size
+
+    Pages walk the ([status,] submitted_on, id) index without a sort.
+    """
+    query = select(
+        PublicSubmissions.id,
+        PublicSubmissions.status,
+        PublicSubmissions.location,
+        PublicSubmissions.mobile,
+        PublicSubmissions.birth_marks,
+        PublicSubmissions.submitted_on,
+        PublicSubmissions.submitted_by,
+    )
+    status_filter = _page_status_filter(PublicSubmissions, status)
+    if status_filter is not None:
+        query = query.where(status_filter)
+    if submitted_by:
+        query = query.where(PublicSubmissions.submitted_by == submitted_by)
+    date_filter = _date_range_filter(PublicSubmissions.submitted_on, start_date, end_date)
+    if date_filter is not None:
+        query = query.where(date_filter)
+    if after is not None:
+        query = query.where(_keyset_filter(PublicSubmissions, after))
+    query = query.order_by(
+        PublicSubmissions.submitted_on.desc(), PublicSubmissions.id.desc()
+    ).limit(limit)
+
+    with Session(read_engine) as session:
+        return session.exec(query).all()
+
+
 # ----------------------- STATUS & MATCHING -----------------------
 
+def get_confirmed_matches() -> list:
+    """(registered id, public id) of every match a reviewer confirmed."""
+    with Session(engine) as session:
+        return session.exec(
+            # Older rows stored matched_with wrapped in braces
+            select(RegisteredCases.id, func.trim(RegisteredCases.matched_with, "{}")).where(
+                RegisteredCases.status == "F",
+                func.trim(RegisteredCases.matched_with, "{}") != "",
+            )
+        ).all()
+
+
 def update_found_status(register_case_id: str, public_case_id: str):
     with Session(engine) as session:
         registered_case = session.exec(
@@ -150,21 +661,491 @@ def update_found_status(register_case_id: str, public_case_id: str):
         ).one()
         public_case.status = "F"
 
+        # Both cases are resolved, so neither belongs in the review queue
+        session.execute(
+            MatchCandidates.__table__.delete().where(
+                or_(
+                    MatchCandidates.registered_id == str(register_case_id),
+                    MatchCandidates.public_id == str(public_case_id),
+                )
+            )
+        )
+        submitted_by = registered_case.submitted_by
         session.commit()
+    _notify_change(RegisteredCases, submitters=[submitted_by])
+    _notify_change(PublicSubmissions)
 
 
-def get_registered_cases_count(submitted_by: str, status: str):
-    create_db()
-    with Session(engine) as session:
+def get_registered_cases_count(submitted_by: str, status: str) -> int:
+    with Session(read_engine) as session:
         return session.exec(
-            select(RegisteredCases)
+            select(func.count())
+            .select_from(RegisteredCases)
             .where(RegisteredCases.submitted_by == submitted_by)
             .where(RegisteredCases.status == status)
+        ).one()
+
+
+def get_dashboard_stats(submitted_by: str, days: int = 30) -> dict:
+    """
+    Case counts for the Home.py dashboard, computed with COUNT(*) in SQL.
+
+    Args:
+        submitted_by: str
+        days: int - how many days back the per-day breakdown covers
+
+    Returns:
+        dict - {
+            "status_counts": dict - status -> number of cases
+            "daily": list - (day "YYYY-MM-DD", status, count), oldest first
+        }
+    """
+    day = func.date(RegisteredCases.submitted_on)
+    since = datetime.utcnow() - timedelta(days=days)
+    with Session(read_engine) as session:
+        status_counts = session.exec(
+            select(RegisteredCases.status, func.count())
+            .where(RegisteredCases.submitted_by == submitted_by)
+            .group_by(RegisteredCases.status)
+        ).all()
+        daily = session.exec(
+            select(day, RegisteredCases.status, func.count())
+            .where(RegisteredCases.submitted_by == submitted_by)
+            .where(RegisteredCases.submitted_on >= since)
+            .group_by(day, RegisteredCases.status)
+            .order_by(day)
+        ).all()
+    return {
+        "status_counts": {status: count for status, count in status_counts},
+        "daily": [tuple(row) for row in daily],
+    }
+
+
+def get_latest_submitted_on(model):
+    """Latest submitted_on in `model`'s table, or None if it is empty."""
+    with Session(engine) as session:
+        return session.exec(select(func.max(model.submitted_on))).one()
+
+
+def get_table_fingerprint(model, status: str, submitted_by: str = None):
+    """(row count, last rowid) of `model` rows with `status`, optionally of one submitter."""
+    query = select(func.count(), func.max(row_sequence(model))).where(model.status == status)
+    if submitted_by is not None:
+        query = query.where(model.submitted_by == submitted_by)
+    with Session(engine) as session:
+        count, last_rowid = session.exec(query).one()
+    return count, last_rowid
+
+
+def get_submitter_fingerprints(model, status: str) -> dict:
+    """submitted_by -> (row count, last rowid) of `model` rows with `status`."""
+    with Session(engine) as session:
+        rows = session.exec(
+            select(model.submitted_by, func.count(), func.max(row_sequence(model)))
+            .where(model.status == status)
+            .group_by(model.submitted_by)
+        ).all()
+    return {submitted_by: (count, last_rowid) for submitted_by, count, last_rowid in rows}
+
+
+def count_landmarks(model) -> int:
+    """Number of `model` rows with a usable landmark blob."""
+    with Session(engine) as session:
+        return session.exec(
+            select(func.count()).where(
+                func.length(model.face_mesh_blob) == landmark_store.BLOB_SIZE
+            )
+        ).one()
+
+
+def fetch_descriptors(model, version: str, status: str = None, after_rowid: int = None, until_rowid: int = None, submitted_by: str = None):
+    """
+    Fetch stored descriptors of `model` rows, split by whether they are current.
+
+    Takes the same filters as fetch_landmarks. Rows whose descriptor was
+    computed by another descriptor model version (or never) come back with
+    their landmark blob instead, so the caller can recompute them.
+
+    Returns:
+        (current, stale) - lists of (id, descriptor_blob) and (id, face_mesh_blob)
+    """
+    is_current = and_(model.descriptor_version == version, model.descriptor_blob.is_not(None))
+    # Only read the (much larger) landmark blob for rows that need recomputing
+    query = select(
+        model.id,
+        case((is_current, model.descriptor_blob), else_=None),
+        case((is_current, None), else_=model.face_mesh_blob),
+    ).where(func.length(model.face_mesh_blob) == landmark_store.BLOB_SIZE)
+    if status:
+        query = query.where(model.status == status)
+    if after_rowid is not None:
+        query = query.where(row_sequence(model) > after_rowid)
+    if until_rowid is not None:
+        query = query.where(row_sequence(model) <= until_rowid)
+    if submitted_by is not None:
+        query = query.where(model.submitted_by == submitted_by)
+
+    current, stale = [], []
+    with Session(engine) as session:
+        for row_id, descriptor_blob, face_mesh_blob in session.exec(query):
+            if face_mesh_blob is None:
+                current.append((row_id, descriptor_blob))
+            else:
+                stale.append((row_id, face_mesh_blob))
+    return current, stale
+
+
+def save_descriptors(model, descriptors: list, version: str):
+    """Store (id, descriptor_blob) pairs computed by descriptor model `version`."""
+    if not descriptors:
+        return
+    with Session(engine) as session:
+        session.execute(
+            model.__table__.update()
+            .where(model.__table__.c.id == bindparam("row_id"))
+            .values(descriptor_blob=bindparam("blob"), descriptor_version=version),
+            [{"row_id": row_id, "blob": blob} for row_id, blob in descriptors],
+        )
+        session.commit()
+
+
+# ----------------------- MATCH WATERMARKS -----------------------
+
+def get_match_watermark(table_name: str):
+    with Session(engine) as session:
+        return session.get(MatchWatermarks, table_name)
+
+
+def reset_match_watermarks():
+    """Forget all watermarks so the next match() run is a full rebuild."""
+    with Session(engine) as session:
+        session.execute(MatchWatermarks.__table__.delete())
+        session.commit()
+
+
+def save_match_watermark(table_name: str, last_rowid: int, index_version: int):
+    with Session(engine) as session:
+        watermark = session.get(MatchWatermarks, table_name) or MatchWatermarks(
+            table_name=table_name
+        )
+        watermark.last_rowid = last_rowid
+        watermark.index_version = index_version
+        watermark.updated_on = datetime.utcnow()
+        session.add(watermark)
+        session.commit()
+
+
+# ----------------------- MATCH CANDIDATES -----------------------
+
+# Ids per IN (...) when clearing reranked rows, below SQLite's variable limit
+RANK_CHUNK_SIZE = 500
+
+
+def save_match_candidates(candidates: list, replace_all: bool = False, reranked_registered=(), reranked_public=()):
+    """
+    Upsert ranked candidate pairs.
+
+    Args:
+        candidates: list of dicts with registered_id, public_id, distance,
+            score, registered_rank and public_rank (ranks may be None)
+        replace_all: bool - drop every stored candidate first (full rebuild)
+        reranked_registered: registered ids whose public ranks `candidates`
+            recomputes in full; their stored public ranks are cleared first
+        reranked_public: public ids whose registered ranks `candidates`
+            recomputes in full, likewise
+    """
+    table = MatchCandidates.__table__
+    computed_on = datetime.utcnow()
+    with Session(engine) as session:
+        if replace_all:
+            session.execute(table.delete())
+        reranked = (
+            (table.c.registered_id, "public_rank", list(reranked_registered)),
+            (table.c.public_id, "registered_rank", list(reranked_public)),
+        )
+        for column, rank, ids in reranked:
+            for start in range(0, len(ids), RANK_CHUNK_SIZE):
+                chunk = ids[start:start + RANK_CHUNK_SIZE]
+                session.execute(table.update().where(column.in_(chunk)).values({rank: None}))
+        if candidates:
+            statement = sqlite_insert(table)
+            # A pair seen from only one direction keeps the other rank it had
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.registered_id, table.c.public_id],
+                set_={
+                    "distance": statement.excluded.distance,
+                    "score": statement.excluded.score,
+                    "registered_rank": func.coalesce(
+                        statement.excluded.registered_rank, table.c.registered_rank
+                    ),
+                    "public_rank": func.coalesce(
+                        statement.excluded.public_rank, table.c.public_rank
+                    ),
+                    "computed_on": statement.excluded.computed_on,
+                },
+            )
+            session.execute(
+                statement,
+                [dict(candidate, computed_on=computed_on) for candidate in candidates],
+            )
+        # Pairs of reranked rows that dropped out of both top-k lists
+        for column, _, ids in reranked:
+            for start in range(0, len(ids), RANK_CHUNK_SIZE):
+                session.execute(
+                    table.delete()
+                    .where(column.in_(ids[start:start + RANK_CHUNK_SIZE]))
+                    .where(table.c.registered_rank.is_(None))
+                    .where(table.c.public_rank.is_(None))
+                )
+        session.commit()
+
+
+def get_rank_boundaries(side: str) -> dict:
+    """
+    Size and reach of every case's stored top-k list.
+
+    Args:
+        side: str - "registered" for each registered case's ranked public
+            submissions, "public" for each public submission's ranked
+            registered cases
+
+    Returns:
+        dict - case id -> (candidates ranked, largest distance among them)
+    """
+    if side == "registered":
+        case_id, rank = MatchCandidates.registered_id, MatchCandidates.public_rank
+    else:
+        case_id, rank = MatchCandidates.public_id, MatchCandidates.registered_rank
+    with Session(engine) as session:
+        rows = session.exec(
+            select(case_id, func.count(), func.max(MatchCandidates.distance))
+            .where(rank.is_not(None))
+            .group_by(case_id)
         ).all()
+    return {row_id: (count, distance) for row_id, count, distance in rows}
+
+
+def fetch_match_queue(min_score: float = 0.0, submitted_by: str = None, limit: int = 50):
+    """
+    Open candidate pairs for review, best score first.
+
+    Only pairs where both cases are still "NF" are returned, with the
+    fields the match page shows.
+    """
+    query = (
+        select(
+            MatchCandidates.registered_id,
+            MatchCandidates.public_id,
+            MatchCandidates.distance,
+            MatchCandidates.score,
+            MatchCandidates.registered_rank,
+            MatchCandidates.public_rank,
+            RegisteredCases.name,
+            RegisteredCases.age,
+            RegisteredCases.last_seen,
+            RegisteredCases.submitted_by,
+            PublicSubmissions.location,
+            PublicSubmissions.birth_marks,
+            PublicSubmissions.submitted_on,
+        )
+        .join(RegisteredCases, RegisteredCases.id == MatchCandidates.registered_id)
+        .join(PublicSubmissions, PublicSubmissions.id == MatchCandidates.public_id)
+        .where(MatchCandidates.score >= min_score)
+        .where(RegisteredCases.status == "NF")
+        .where(PublicSubmissions.status == "NF")
+    )
+    if submitted_by:
+        query = query.where(RegisteredCases.submitted_by == submitted_by)
+    query = query.order_by(MatchCandidates.score.desc()).limit(limit)
+    with Session(read_engine) as session:
+        return session.exec(query).all()
+
+
+def get_candidates_for_public(public_id: str, limit: int = 10):
+    """Registered cases ranked for one public submission, best first."""
+    with Session(read_engine) as session:
+        return session.exec(
+            select(MatchCandidates)
+            .where(MatchCandidates.public_id == public_id)
+            .order_by(MatchCandidates.score.desc())
+            .limit(limit)
+        ).all()
+
+
+def get_candidates_for_registered(registered_id: str, limit: int = 10):
+    """Public submissions ranked for one registered case, best first."""
+    with Session(read_engine) as session:
+        return session.exec(
+            select(MatchCandidates)
+            .where(MatchCandidates.registered_id == registered_id)
+            .order_by(MatchCandidates.score.desc())
+            .limit(limit)
+        ).all()
+
+
+# ----------------------- JOBS -----------------------
+
+def _enqueue_job(session, kind: str, params: dict, dedupe: bool) -> str:
+    params_json = json.dumps(params or {}, sort_keys=True)
+    if dedupe:
+        # A queued job with the same parameters will pick up this work too
+        queued = session.exec(
+            select(Jobs.id)
+            .where(Jobs.kind == kind)
+            .where(Jobs.status == "queued")
+            .where(Jobs.params == params_json)
+        ).first()
+        if queued is not None:
+            return queued
+    job = Jobs(kind=kind, params=params_json)
+    session.add(job)
+    return job.id
+
+
+def enqueue_job(kind: str, params: dict = None, dedupe: bool = False) -> str:
+    """
+    Adds a job for the worker and returns its id.
+
+    Args:
+        kind: str - one of jobs.JOB_HANDLERS
+        params: dict - JSON-serialisable handler arguments
+        dedupe: bool - reuse an identical job that is still queued
+    """
+    with Session(engine) as session:
+        job_id = _enqueue_job(session, kind, params, dedupe)
+        session.commit()
+    return job_id
+
+
+def claim_next_job(worker: str):
+    """
+    Marks the oldest queued job as running for `worker` and returns it, or
+    None if the queue is empty.
+
+    The claim is a conditional UPDATE, so concurrent workers never run the
+    same job.
+    """
+    with Session(engine) as session:
+        while True:
+            job_id = session.exec(
+                select(Jobs.id)
+                .where(Jobs.status == "queued")
+                .order_by(Jobs.created_on)
+                .limit(1)
+            ).first()
+            if job_id is None:
+                return None
+            claimed = session.execute(
+                Jobs.__table__.update()
+                .where(Jobs.id == job_id)
+                .where(Jobs.status == "queued")
+                .values(status="running", worker=worker, started_on=datetime.utcnow())
+            ).rowcount
+            session.commit()
+            if claimed:
+                return session.get(Jobs, job_id)
+
+
+def update_job_progress(job_id: str, progress: float, message: str = None):
+    with Session(engine) as session:
+        session.execute(
+            Jobs.__table__.update()
+            .where(Jobs.id == job_id)
+            .values(progress=progress, message=message)
+        )
+        session.commit()
+
+
+def finish_job(job_id: str, result=None, error: str = None):
+    """Stores the outcome of a running job: `result` if it succeeded, else `error`."""
+    values = {"finished_on": datetime.utcnow()}
+    if error is None:
+        values.update(status="done", progress=1.0, result=json.dumps(result, default=str))
+    else:
+        values.update(status="failed", error=error)
+    with Session(engine) as session:
+        session.execute(Jobs.__table__.update().where(Jobs.id == job_id).values(**values))
+        session.commit()
+
+
+def requeue_stale_jobs(started_before) -> int:
+    """Puts jobs left "running" by a worker that died back in the queue."""
+    with Session(engine) as session:
+        count = session.execute(
+            Jobs.__table__.update()
+            .where(Jobs.status == "running")
+            .where(Jobs.started_on < started_before)
+            .values(status="queued", worker=None, started_on=None, progress=0.0)
+        ).rowcount
+        session.commit()
+    return count
+
+
+def purge_finished_jobs(finished_before) -> int:
+    with Session(engine) as session:
+        count = session.execute(
+            Jobs.__table__.delete()
+            .where(Jobs.status.in_(["done", "failed"]))
+            .where(Jobs.finished_on < finished_before)
+        ).rowcount
+        session.commit()
+    return count
+
+
+def get_job(job_id: str):
+    with Session(read_engine) as session:
+        return session.get(Jobs, job_id)
+
+
+def list_jobs(status: str = None, limit: int = 50):
+    """Most recent jobs first, optionally only those with `status`."""
+    query = select(Jobs)
+    if status:
+        query = query.where(Jobs.status == status)
+    with Session(read_engine) as session:
+        return session.exec(query.order_by(Jobs.created_on.desc()).limit(limit)).all()
+
+
+# ----------------------- CASE IMAGES -----------------------
+
+def save_case_images(case_hashes: list):
+    """Upsert (case_id, content_hash) pairs for stored case images."""
+    with Session(engine) as session:
+        for case_id, content_hash in case_hashes:
+            case_image = session.get(CaseImages, case_id) or CaseImages(case_id=case_id)
+            case_image.content_hash = content_hash
+            session.add(case_image)
+        session.commit()
+
+
+def get_case_image_hashes(case_ids: list) -> dict:
+    """case_id -> content_hash for the given cases, in a single query."""
+    if not case_ids:
+        return {}
+    with Session(read_engine) as session:
+        rows = session.exec(
+            select(CaseImages.case_id, CaseImages.content_hash).where(
+                CaseImages.case_id.in_(case_ids)
+            )
+        ).all()
+    return dict(rows)
 
 
 # ----------------------- GENAI EXTRA COLUMNS -----------------------
 
+def get_llm_response(prompt_hash: str):
+    """Cached GenAI response for `prompt_hash`, or None."""
+    with Session(read_engine) as session:
+        cached = session.get(LLMCache, prompt_hash)
+        return cached.response if cached is not None else None
+
+
+def save_llm_response(prompt_hash: str, model: str, response: str):
+    with Session(engine) as session:
+        session.merge(LLMCache(prompt_hash=prompt_hash, model=model, response=response))
+        session.commit()
+
+
 def save_alert(case_id: str, alert_text: str):
     with Session(engine) as session:
         case = session.exec(
@@ -201,6 +1182,12 @@ def save_witness_summary(case_id: str, witness_summary: str):
         session.commit()
 
 
+# Time every query function (db.<name> in the metrics)
+metrics.instrument_module(
+    globals(), "db", skip={"make_engine", "register_change_hook", "submitter_filter", "row_sequence"}
+)
+
+
 if __name__ == "__main__":
     create_db()
     print("[DB] Tables ready.")
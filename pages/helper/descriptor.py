@@ -0,0 +1,249 @@
+"""
+Compact face descriptors built from MediaPipe face mesh landmarks.
+
+Raw landmarks are in image-normalised coordinates, so the distance between
+two meshes depends on where the face sits in the photo, how large it is and
+how the head is turned. A descriptor removes that before matching:
+
+1. select points - drop the 10 iris landmarks and/or the noisy z axis
+2. align - orthogonal Procrustes onto a canonical mesh (translation, scale
+   and rotation removed; every shape ends up with unit norm)
+3. reduce - project onto the top PCA components of the stored corpus
+
+The fitted model (canonical mesh + PCA basis) is saved next to the database.
+Descriptors are stored per row with the model version that produced them,
+and rows are recomputed lazily when the model changes. Reading never fits:
+match() queues a rebuild_index job when needs_refit() says so, or refit with:
+
+    python -m pages.helper.descriptor --fit
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from pages.helper import db_queries, landmark_store
+
+DESCRIPTOR_CONFIG = {
+    "use_z": False,  # MediaPipe's z is a relative depth estimate, much noisier than x/y
+    "drop_iris": True,  # refine_landmarks adds 10 iris points that move with gaze
+    "n_components": 96,
+}
+# Below this many stored meshes PCA is not fitted; descriptors are then the
+# full aligned shape
+MIN_FIT_ROWS = 4 * DESCRIPTOR_CONFIG["n_components"]
+MAX_FIT_ROWS = 20000
+IRIS_START = 468
+MODEL_PATH = os.path.join(os.path.dirname(db_queries.DB_PATH), "descriptor_model.npz")
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+
+def select_points(meshes, config=DESCRIPTOR_CONFIG) -> np.ndarray:
+    """(N, 1434) flat landmarks -> (N, P, 2 or 3) points kept by `config`."""
+    points = np.asarray(meshes, dtype=np.float32).reshape(-1, landmark_store.NUM_LANDMARKS, 3)
+    if config["drop_iris"]:
+        points = points[:, :IRIS_START]
+    if not config["use_z"]:
+        points = points[:, :, :2]
+    return points
+
+
+def normalize_shapes(points: np.ndarray) -> np.ndarray:
+    """Removes translation and scale: centred, unit Frobenius norm."""
+    centred = points - points.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centred.reshape(len(centred), -1), axis=1)
+    return centred / np.maximum(norms, 1e-12)[:, None, None]
+
+
+def align(points: np.ndarray, canonical: np.ndarray) -> np.ndarray:
+    """
+    Rotates every normalised shape in `points` onto `canonical`.
+
+    Orthogonal Procrustes, batched: R = U V^T from the SVD of X^T C, with
+    the last singular vector flipped where needed so R is a rotation and
+    never a mirror image.
+    """
+    shapes = normalize_shapes(points)
+    cross = np.einsum("npi,pj->nij", shapes, canonical)
+    u, _, vt = np.linalg.svd(cross)
+    sign = np.sign(np.linalg.det(u @ vt))
+    u[:, :, -1] *= sign[:, None]
+    return np.einsum("npi,nij->npj", shapes, u @ vt)
+
+
+class DescriptorModel:
+    """Canonical mesh plus optional PCA basis; maps landmarks to descriptors."""
+
+    def __init__(self, canonical, mean=None, components=None, config=DESCRIPTOR_CONFIG):
+        self.canonical = np.asarray(canonical, dtype=np.float32)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.components = None if components is None else np.asarray(components, dtype=np.float32)
+        self.config = dict(config)
+        digest = hashlib.sha1(json.dumps(self.config, sort_keys=True).encode())
+        for array in (self.canonical, self.mean, self.components):
+            if array is not None:
+                digest.update(array.tobytes())
+        self.version = digest.hexdigest()[:16]
+
+    @property
+    def dim(self) -> int:
+        if self.components is not None:
+            return len(self.components)
+        return self.canonical.size
+
+    @classmethod
+    def fit(cls, meshes, config=DESCRIPTOR_CONFIG, iterations: int = 3):
+        """
+        Fits on a (N, 1434) corpus: generalised Procrustes for the canonical
+        mesh, then PCA on the aligned shapes when the corpus is large enough.
+        """
+        points = select_points(meshes, config)
+        canonical = normalize_shapes(points[:1])[0]
+        for _ in range(iterations):
+            canonical = normalize_shapes(align(points, canonical).mean(axis=0, keepdims=True))[0]
+        if len(points) < MIN_FIT_ROWS:
+            return cls(canonical, config=config)
+
+        flat = align(points, canonical).reshape(len(points), -1)
+        mean = flat.mean(axis=0)
+        _, _, vt = np.linalg.svd(flat - mean, full_matrices=False)
+        return cls(canonical, mean, vt[: config["n_components"]], config)
+
+    def transform(self, meshes) -> np.ndarray:
+        """(N, 1434) landmarks -> (N, dim) float32 descriptors."""
+        flat = align(select_points(meshes, self.config), self.canonical).reshape(len(meshes), -1)
+        if self.components is not None:
+            flat = (flat - self.mean) @ self.components.T
+        return np.ascontiguousarray(flat, dtype=np.float32)
+
+    def save(self, path: str = MODEL_PATH):
+        """Writes the model to a temporary file and renames it into place."""
+        arrays = {"canonical": self.canonical, "config": np.array(json.dumps(self.config))}
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH):
+        with np.load(path) as data:
+            return cls(
+                data["canonical"],
+                data["mean"] if "mean" in data else None,
+                data["components"] if "components" in data else None,
+                json.loads(str(data["config"])),
+            )
+
+
+def _corpus(limit: int = MAX_FIT_ROWS) -> np.ndarray:
+    _, registered = db_queries.fetch_landmarks(db_queries.RegisteredCases)
+    _, public = db_queries.fetch_landmarks(db_queries.PublicSubmissions)
+    corpus = np.concatenate([registered, public])
+    if len(corpus) > limit:
+        corpus = corpus[np.random.default_rng(0).choice(len(corpus), limit, replace=False)]
+    return corpus
+
+
+def fit_model(path: str = MODEL_PATH) -> DescriptorModel:
+    """
+    Refits the descriptor model on the stored corpus and makes it current.
+
+    Stored descriptors become stale and match watermarks are reset, so the
+    next match() run rebuilds against the new descriptors.
+    """
+    global _model, _model_mtime
+    corpus = _corpus()
+    if len(corpus) == 0:
+        return None
+    model = DescriptorModel.fit(corpus)
+    model.save(path)
+    with _model_lock:
+        _model = model
+        _model_mtime = os.path.getmtime(path)
+    db_queries.reset_match_watermarks()
+    return model
+
+
+def get_model() -> DescriptorModel:
+    """
+    Returns the current descriptor model, or None if none was fitted yet.
+
+    Only loads: fitting is fit_model()'s job, so a reader never refits (and
+    resets match watermarks) as a side effect.
+    """
+    global _model, _model_mtime
+    with _model_lock:
+        # Reload when another process (e.g. the worker) refitted it
+        mtime = os.path.getmtime(MODEL_PATH) if os.path.isfile(MODEL_PATH) else None
+        if mtime is not None and mtime != _model_mtime:
+            _model = DescriptorModel.load(MODEL_PATH)
+            _model_mtime = mtime
+        return _model
+
+
+def needs_refit(model: DescriptorModel) -> bool:
+    """
+    Whether fit_model() should run: no model yet, or one fitted before the
+    corpus reached MIN_FIT_ROWS (so without PCA) while enough meshes are
+    stored now.
+    """
+    if model is not None and model.components is not None:
+        return False
+    stored = db_queries.count_landmarks(db_queries.RegisteredCases) + db_queries.count_landmarks(
+        db_queries.PublicSubmissions
+    )
+    return stored > 0 if model is None else stored >= MIN_FIT_ROWS
+
+
+def load_descriptors(model_table, status: str = None, after_rowid: int = None, until_rowid: int = None, submitted_by: str = None, model: DescriptorModel = None):
+    """
+    (ids, (N, dim) float32 descriptors) for rows of `model_table`.
+
+    Takes the same filters as db_queries.fetch_landmarks. Missing or stale
+    descriptors are computed in one batch and stored for the next call.
+    `model` defaults to get_model(); callers that load several sets pass
+    the one they resolved, so every set has the same version and dimension.
+    """
+    model = model or get_model()
+    if model is None:
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    current, stale = db_queries.fetch_descriptors(
+        model_table, model.version, status, after_rowid, until_rowid, submitted_by
+    )
+    ids = [row_id for row_id, _ in current]
+    blobs = [blob for _, blob in current]
+    if stale:
+        fresh = model.transform(landmark_store.stack_landmarks(blob for _, blob in stale))
+        fresh_pairs = [(row_id, row.tobytes()) for (row_id, _), row in zip(stale, fresh)]
+        db_queries.save_descriptors(model_table, fresh_pairs, model.version)
+        ids += [row_id for row_id, _ in fresh_pairs]
+        blobs += [blob for _, blob in fresh_pairs]
+
+    if not blobs:
+        return ids, np.empty((0, model.dim), dtype=np.float32)
+    descriptors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), model.dim)
+    return ids, descriptors
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Face descriptor model maintenance")
+    parser.add_argument("--fit", action="store_true", help="refit on the stored corpus")
+    args = parser.parse_args()
+    if args.fit:
+        db_queries.create_db()
+        fitted = fit_model()
+        if fitted is None:
+            print("[DESCRIPTOR] No face meshes stored yet")
+        else:
+            print(f"[DESCRIPTOR] Fitted version {fitted.version} ({fitted.dim} dims)")
@@ -1,95 +1,326 @@
-import os
-import json
-from typing import List, Dict, Any
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not GEMINI_API_KEY:
-    raise ValueError("⚠ GEMINI_API_KEY not found in .env file")
-
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Safe wrapper to call Gemini
-def _call_llm(prompt: str, temperature: float = 0.2, max_tokens: int = 300) -> str:
-    """
-    Calls Google Gemini API and returns plain text.
-    """
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": temperature,
-                "max_output_tokens": max_tokens
-            }
-        )
-        return response.text.strip()
-    except Exception as e:
-        return f"[LLM ERROR] {str(e)}"
-
-# 1) Generate alert text (short, long, markdown). Return dict
-def generate_alert(case: Dict[str, Any], tone: str = "neutral") -> Dict[str, str]:
-    """
-    case: dict containing keys like name, last_seen, location, age, birth_marks, id, submitted_by
-    returns: dict with keys 'short', 'long', 'markdown'
-    """
-    prompt = (
-        "You are an assistant that composes concise public missing-person alerts for social media "
-        "and formal alerts for police. Keep short version < 200 characters. Provide a longer version "
-        "for formal posting and a markdown suitable for social sharing.\n\n"
-        f"Case data:\n{json.dumps(case, indent=2)}\n\n"
-        "Return JSON with keys: short, long, markdown. Only return valid JSON."
-    )
-
-    out = _call_llm(prompt, temperature=0.2, max_tokens=300)
-
-    try:
-        return json.loads(out)
-    except Exception:
-        short = f"Missing: {case.get('name','Unknown')}, last seen at {case.get('last_seen','unknown')}. Call {case.get('phone','-')}."
-        long = (
-            f"Missing Person Alert\nName: {case.get('name','Unknown')}\n"
-            f"Last seen: {case.get('last_seen','Unknown')} at {case.get('address','Unknown')}\n"
-            f"Age: {case.get('age','Unknown')}\nDescription: {case.get('description','-')}\n"
-            f"Contact: {case.get('submitted_by','-')} / {case.get('phone','-')}\n"
-        )
-        markdown = f"**Missing: {case.get('name','Unknown')}**  \nLast seen: {case.get('last_seen','Unknown')}  \nContact: {case.get('phone','-')}"
-        return {"short": short, "long": long, "markdown": markdown, "raw": out}
-
-# 2) Explain matches
-def explain_matches(case: Dict[str, Any], candidates: List[Dict[str, Any]]) -> str:
-    prompt = (
-        "You are an investigative assistant. Given a registered missing-person case and a list of candidate "
-        "public submissions with similarity scores, write a concise explanation why each candidate may match "
-        "the missing person (2 sentences max each). Then provide 3 recommended next verification steps.\n\n"
-        f"Case: {json.dumps(case, indent=2)}\n\n"
-        f"Candidates (showing up to 10): {json.dumps(candidates[:10], indent=2)}\n\nReturn plain text."
-    )
-    return _call_llm(prompt, temperature=0.2, max_tokens=400)
-
-# 3) Summarize witness text
-def summarize_witness(statement: str) -> Dict[str, Any]:
-    prompt = (
-        "Summarize the following witness statement into 3 concise bullet points, and extract entities: "
-        "people, places, times. Return JSON with keys: summary (list), persons (list), places (list), times (list).\n\n"
-        f"Statement:\n{statement}\n\nReturn only JSON."
-    )
-    out = _call_llm(prompt, temperature=0.2, max_tokens=300)
-    try:
-        return json.loads(out)
-    except Exception:
-        return {"summary": [statement[:200] + ("..." if len(statement) > 200 else "")], "persons": [], "places": [], "times": [], "raw": out}
-
-# 4) Prioritize leads
-def prioritize_leads(leads: List[Dict[str, Any]]) -> str:
-    prompt = (
-        "Rank these leads by actionability. Each lead has {id, score (higher is better), time_seconds_ago, witness_reliability (0-1)}. "
-        "Return a short list of ids in recommended order and three-line justification for the top lead.\n\n"
-        f"Leads:\n{json.dumps(leads, indent=2)}"
-    )
-    return _call_llm(prompt, temperature=0.2, max_tokens=250)
+"""
+GenAI helpers for alerts, match explanations and summaries.
+
+All prompts go through one LLMClient:
+
+- the backend (Gemini, or StubBackend for offline runs and tests) is
+  created once per process; Gemini model handles are kept per event loop
+- at most LLM_CONFIG["concurrency"] requests are in flight
+- every request has a timeout and is retried with exponential backoff
+- independent prompts fan out concurrently with complete_many()
+- successful responses are cached in SQLite by prompt hash, so
+  regenerating the same alert costs nothing
+
+FMP_LLM_BACKEND=stub selects the stub backend. Importing this module has
+no side effects: the SDK is imported and GEMINI_API_KEY is checked on the
+first call.
+"""
+import asyncio
+import hashlib
+import os
+import json
+import random
+import threading
+import weakref
+from typing import List, Dict, Any
+
+from pages.helper import db_queries, metrics
+
+LLM_CONFIG = {
+    "model": "gemini-1.5-flash",
+    "concurrency": 4,  # requests in flight per process
+    "timeout": 30.0,  # seconds per attempt
+    "retries": 3,  # extra attempts after a failure or timeout
+    "backoff": 1.0,  # seconds before the first retry, doubled each time
+}
+
+
+class GeminiBackend:
+    """
+    Google Gemini. The SDK is configured once; each event loop gets its own
+    GenerativeModel, because the model's async gRPC client is bound to the
+    loop that first used it and every asyncio.run() starts a new one.
+    """
+
+    def __init__(self, model_name: str = LLM_CONFIG["model"]):
+        # A submodule, so imported here rather than through lazy_import: the
+        # SDK is loaded, and configured, when the first Gemini client is created
+        import google.generativeai as genai
+        from dotenv import load_dotenv
+
+        # Load environment variables
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("⚠ GEMINI_API_KEY not found in .env file")
+        genai.configure(api_key=api_key)
+
+        self.genai = genai
+        self.model_name = model_name
+        self._models = weakref.WeakKeyDictionary()
+
+    def _model(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._models:
+            self._models[loop] = self.genai.GenerativeModel(self.model_name)
+        return self._models[loop]
+
+    async def generate(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        response = await self._model().generate_content_async(
+            prompt,
+            generation_config={
+                "temperature": temperature,
+                "max_output_tokens": max_tokens
+            }
+        )
+        return response.text.strip()
+
+
+class StubBackend:
+    """
+    Local stand-in for Gemini: no network, deterministic answers.
+
+    Args:
+        responses: dict - prompt -> text; other prompts get a placeholder
+        delay: float - seconds each call takes
+        failures: int - number of initial calls that raise, to exercise retries
+    """
+
+    model_name = "stub"
+
+    def __init__(self, responses: dict = None, delay: float = 0.0, failures: int = 0):
+        self.responses = responses or {}
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+
+    async def generate(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise RuntimeError("stub failure")
+        if prompt in self.responses:
+            return self.responses[prompt]
+        return f"[stub {hashlib.sha256(prompt.encode()).hexdigest()[:8]}]"
+
+
+class LLMClient:
+    """
+    Async LLM client with a concurrency limit, timeouts, retries and a cache.
+
+    Args:
+        backend: object with `model_name` and `async generate(prompt,
+            temperature, max_tokens)`
+        config: dict - overrides for LLM_CONFIG
+        use_cache: bool - read and write the LLMCache table
+    """
+
+    def __init__(self, backend, config: dict = None, use_cache: bool = True):
+        self.backend = backend
+        self.config = {**LLM_CONFIG, **(config or {})}
+        self.use_cache = use_cache
+        # asyncio primitives belong to one event loop; each asyncio.run() gets its own
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.config["concurrency"])
+        return self._semaphores[loop]
+
+    def prompt_hash(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        key = json.dumps([self.backend.model_name, temperature, max_tokens, prompt])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    async def complete(self, prompt: str, temperature: float = 0.2, max_tokens: int = 300) -> str:
+        """Response text for `prompt`. Raises once every retry has failed."""
+        prompt_hash = self.prompt_hash(prompt, temperature, max_tokens)
+        if self.use_cache:
+            cached = db_queries.get_llm_response(prompt_hash)
+            if cached is not None:
+                metrics.increment("llm.cache_hits")
+                return cached
+            metrics.increment("llm.cache_misses")
+
+        async with self._semaphore():
+            for attempt in range(self.config["retries"] + 1):
+                try:
+                    with metrics.timed("llm.request"):
+                        text = await asyncio.wait_for(
+                            self.backend.generate(prompt, temperature, max_tokens),
+                            self.config["timeout"],
+                        )
+                    break
+                except Exception:
+                    if attempt == self.config["retries"]:
+                        raise
+                    metrics.increment("llm.retries")
+                    # Exponential backoff with jitter, so parallel retries spread out
+                    delay = self.config["backoff"] * 2 ** attempt
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+        if self.use_cache:
+            db_queries.save_llm_response(prompt_hash, self.backend.model_name, text)
+        return text
+
+    async def complete_many(self, prompts: List[str], temperature: float = 0.2, max_tokens: int = 300) -> List[Any]:
+        """
+        Runs independent prompts concurrently. Returns one entry per prompt,
+        in order: the text, or the exception that prompt failed with.
+        """
+        return await asyncio.gather(
+            *(self.complete(prompt, temperature, max_tokens) for prompt in prompts),
+            return_exceptions=True,
+        )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Process-wide client, so the SDK is configured only once."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if os.getenv("FMP_LLM_BACKEND") == "stub":
+                backend = StubBackend()
+            else:
+                backend = GeminiBackend()
+            _client = LLMClient(backend)
+        return _client
+
+
+def _error_text(error: Exception) -> str:
+    return f"[LLM ERROR] {str(error) or type(error).__name__}"
+
+
+# Safe wrapper to call Gemini
+@metrics.timed("llm.call")
+def _call_llm(prompt: str, temperature: float = 0.2, max_tokens: int = 300) -> str:
+    """
+    Calls the LLM and returns plain text, or "[LLM ERROR] ..." on failure.
+    """
+    try:
+        return asyncio.run(get_client().complete(prompt, temperature, max_tokens))
+    except Exception as e:
+        return _error_text(e)
+
+
+def _call_llm_many(prompts: List[str], temperature: float = 0.2, max_tokens: int = 300) -> List[str]:
+    """_call_llm for several independent prompts, sent concurrently."""
+    try:
+        results = asyncio.run(get_client().complete_many(prompts, temperature, max_tokens))
+    except Exception as e:
+        return [_error_text(e)] * len(prompts)
+    return [_error_text(r) if isinstance(r, Exception) else r for r in results]
+
+# 1) Generate alert text (short, long, markdown). Return dict
+def generate_alert(case: Dict[str, Any], tone: str = "neutral") -> Dict[str, str]:
+    """
+    case: dict containing keys like name, last_seen, location, age, birth_marks, id, submitted_by
+    returns: dict with keys 'short', 'long', 'markdown'
+    """
+    prompt = (
+        "You are an assistant that composes concise public missing-person alerts for social media "
+        "and formal alerts for police. Keep short version < 200 characters. Provide a longer version "
+        "for formal posting and a markdown suitable for social sharing.\n\n"
+        f"Case data:\n{json.dumps(case, indent=2)}\n\n"
+        "Return JSON with keys: short, long, markdown. Only return valid JSON."
+    )
+
+    out = _call_llm(prompt, temperature=0.2, max_tokens=300)
+
+    try:
+        return json.loads(out)
+    except Exception:
+        short = f"Missing: {case.get('name','Unknown')}, last seen at {case.get('last_seen','unknown')}. Call {case.get('phone','-')}."
+        long = (
+            f"Missing Person Alert\nName: {case.get('name','Unknown')}\n"
+            f"Last seen: {case.get('last_seen','Unknown')} at {case.get('address','Unknown')}\n"
+            f"Age: {case.get('age','Unknown')}\nDescription: {case.get('description','-')}\n"
+            f"Contact: {case.get('submitted_by','-')} / {case.get('phone','-')}\n"
+        )
+        markdown = f"**Missing: {case.get('name','Unknown')}**  \nLast seen: {case.get('last_seen','Unknown')}  \nContact: {case.get('phone','-')}"
+        return {"short": short, "long": long, "markdown": markdown, "raw": out}
+
+# 2) Explain matches
+def explain_matches(case: Dict[str, Any], candidates: List[Dict[str, Any]]) -> str:
+    prompt = (
+        "You are an investigative assistant. Given a registered missing-person case and a list of candidate "
+        "public submissions with similarity scores, write a concise explanation why each candidate may match "
+        "the missing person (2 sentences max each). Then provide 3 recommended next verification steps.\n\n"
+        f"Case: {json.dumps(case, indent=2)}\n\n"
+        f"Candidates (showing up to 10): {json.dumps(candidates[:10], indent=2)}\n\nReturn plain text."
+    )
+    return _call_llm(prompt, temperature=0.2, max_tokens=400)
+
+# 3) Summarize witness text
+def summarize_witness(statement: str) -> Dict[str, Any]:
+    prompt = (
+        "Summarize the following witness statement into 3 concise bullet points, and extract entities: "
+        "people, places, times. Return JSON with keys: summary (list), persons (list), places (list), times (list).\n\n"
+        f"Statement:\n{statement}\n\nReturn only JSON."
+    )
+    out = _call_llm(prompt, temperature=0.2, max_tokens=300)
+    try:
+        return json.loads(out)
+    except Exception:
+        return {"summary": [statement[:200] + ("..." if len(statement) > 200 else "")], "persons": [], "places": [], "times": [], "raw": out}
+
+# 4) Prioritize leads
+def prioritize_leads(leads: List[Dict[str, Any]]) -> str:
+    prompt = (
+        "Rank these leads by actionability. Each lead has {id, score (higher is better), time_seconds_ago, witness_reliability (0-1)}. "
+        "Return a short list of ids in recommended order and three-line justification for the top lead.\n\n"
+        f"Leads:\n{json.dumps(leads, indent=2)}"
+    )
+    return _call_llm(prompt, temperature=0.2, max_tokens=250)
+
+# 5) Public alert text for a newly registered case
+def draft_case_alert(case: Dict[str, Any]) -> str:
+    prompt = f"""
+    Create a concise but impactful public missing person alert based on this case:
+    Name: {case.get('name')}
+    Age: {case.get('age')}
+    Last Seen: {case.get('last_seen')}
+    Birth Marks: {case.get('birth_marks')}
+    Please write in a way suitable for WhatsApp and social media posting.
+    """
+    return _call_llm(prompt, temperature=0.2, max_tokens=300)
+
+# 6) Explain a confirmed match
+def _explain_match_prompt(registered_case: Any, public_submission: Any) -> str:
+    return f"""
+    You are an investigator. Based on the following two reports,
+    explain concisely why these cases are a probable match.
+
+    Registered Case: {registered_case}
+    Public Submission: {public_submission}
+    """
+
+def explain_match(registered_case: Any, public_submission: Any) -> str:
+    return _call_llm(_explain_match_prompt(registered_case, public_submission), temperature=0.2, max_tokens=300)
+
+# 7) Summarize a public submission for law enforcement
+def _summarize_submission_prompt(public_submission: Any) -> str:
+    return f"""
+    Summarize the witness/public submission details in a clear, concise way for law enforcement.
+    Public Submission: {public_submission}
+    """
+
+def summarize_submission(public_submission: Any) -> str:
+    return _call_llm(_summarize_submission_prompt(public_submission), temperature=0.2, max_tokens=300)
+
+# 8) Both of the above for a confirmed match, requested concurrently
+def match_report(registered_case: Any, public_submission: Any) -> Dict[str, str]:
+    match_explanation, witness_summary = _call_llm_many(
+        [
+            _explain_match_prompt(registered_case, public_submission),
+            _summarize_submission_prompt(public_submission),
+        ],
+        temperature=0.2,
+        max_tokens=300,
+    )
+    return {"match_explanation": match_explanation, "witness_summary": witness_summary}
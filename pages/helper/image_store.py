@@ -0,0 +1,193 @@
+"""
+Content-addressed store for case images.
+
+Originals live at resources/store/ab/cd/<sha256>.jpg and listing-size
+thumbnails at resources/thumbs/ab/cd/<sha256>.jpg. The two-level sharding
+keeps each directory small, and identical uploads share one file. The
+CaseImages table maps a case id to its content hash. Cases saved before the
+store existed are still read from the flat resources/{id}.jpg layout until
+they are backfilled with:
+
+    python -m pages.helper.image_store --backfill
+"""
+import hashlib
+import os
+import tempfile
+import traceback
+
+from PIL import Image, ImageOps
+
+from pages.helper import db_queries
+
+RESOURCES_DIR = "./resources"
+STORE_DIR = os.path.join(RESOURCES_DIR, "store")
+THUMB_DIR = os.path.join(RESOURCES_DIR, "thumbs")
+# Listing pages show 120px images; twice that stays sharp on HiDPI screens
+THUMBNAIL_SIZE = (240, 240)
+CHUNK_SIZE = 64 * 1024
+
+
+def _sharded_path(root: str, content_hash: str) -> str:
+    return os.path.join(root, content_hash[:2], content_hash[2:4], f"{content_hash}.jpg")
+
+
+def original_path(content_hash: str) -> str:
+    return _sharded_path(STORE_DIR, content_hash)
+
+
+def thumbnail_path(content_hash: str) -> str:
+    return _sharded_path(THUMB_DIR, content_hash)
+
+
+def make_thumbnail(source_path: str, target_path: str):
+    """Writes a JPEG thumbnail of `source_path` to `target_path` atomically."""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder downscale while decoding
+        image.draft("RGB", THUMBNAIL_SIZE)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail(THUMBNAIL_SIZE)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            image.save(tmp_file, format="JPEG", quality=85)
+    os.replace(tmp_path, target_path)
+
+
+def store_file(file_obj) -> str:
+    """
+    Streams `file_obj` into the store and returns its content hash.
+
+    The data is hashed while it is copied to a temporary file, which is then
+    renamed into its sharded location, or dropped if that content is already
+    stored. The thumbnail is generated at the same time.
+    """
+    os.makedirs(STORE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=STORE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                tmp_file.write(chunk)
+        content_hash = digest.hexdigest()
+        target = original_path(content_hash)
+        if os.path.isfile(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if not os.path.isfile(thumbnail_path(content_hash)):
+        try:
+            make_thumbnail(target, thumbnail_path(content_hash))
+        except Exception:
+            traceback.print_exc()
+    return content_hash
+
+
+def save_image(case_id: str, file_obj) -> str:
+    """Stores the image for `case_id` and records its hash. Returns the hash."""
+    content_hash = store_file(file_obj)
+    db_queries.save_case_images([(case_id, content_hash)])
+    return content_hash
+
+
+def _legacy_path(case_id: str) -> str:
+    return os.path.join(RESOURCES_DIR, f"{case_id}.jpg")
+
+
+def thumbnail_paths(case_ids: list, hashes: dict = None) -> dict:
+    """
+    case_id -> path of the image to show in listings, for a whole page at once.
+
+    Falls back to the legacy full-size file for cases without a stored hash.
+    `hashes` is a db_queries.get_case_image_hashes() result already fetched
+    for these cases.
+    """
+    if hashes is None:
+        hashes = db_queries.get_case_image_hashes(list(case_ids))
+    paths = {}
+    for case_id in case_ids:
+        content_hash = hashes.get(case_id)
+        if content_hash and os.path.isfile(thumbnail_path(content_hash)):
+            paths[case_id] = thumbnail_path(content_hash)
+        elif content_hash and os.path.isfile(original_path(content_hash)):
+            paths[case_id] = original_path(content_hash)
+        else:
+            paths[case_id] = _legacy_path(case_id)
+    return paths
+
+
+def open_image(case_id: str, thumbnail: bool = True, hashes: dict = None):
+    """
+    Opens a case image for streaming reads, or returns None if there is none.
+
+    Listing pages fetch `hashes` for the whole page with
+    db_queries.get_case_image_hashes() and pass it to every call, so a page
+    costs one lookup rather than one per image.
+
+    The caller owns the returned binary file object and must close it.
+    """
+    if hashes is None:
+        hashes = db_queries.get_case_image_hashes([case_id])
+    if thumbnail:
+        path = thumbnail_paths([case_id], hashes)[case_id]
+    else:
+        content_hash = hashes.get(case_id)
+        path = original_path(content_hash) if content_hash else _legacy_path(case_id)
+    if not os.path.isfile(path):
+        return None
+    return open(path, "rb")
+
+
+def backfill_legacy_images(remove_legacy: bool = False) -> int:
+    """
+    Moves flat resources/{id}.jpg files into the store and builds thumbnails.
+
+    Returns the number of images migrated.
+    """
+    migrated = []
+    pending = []
+    for name in os.listdir(RESOURCES_DIR):
+        path = os.path.join(RESOURCES_DIR, name)
+        case_id, ext = os.path.splitext(name)
+        if ext != ".jpg" or not os.path.isfile(path):
+            continue
+        try:
+            with open(path, "rb") as file_obj:
+                pending.append((case_id, store_file(file_obj)))
+        except Exception:
+            traceback.print_exc()
+            continue
+        if len(pending) >= 500:
+            db_queries.save_case_images(pending)
+            migrated += pending
+            pending = []
+    if pending:
+        db_queries.save_case_images(pending)
+        migrated += pending
+
+    if remove_legacy:
+        for case_id, _ in migrated:
+            os.remove(_legacy_path(case_id))
+    return len(migrated)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Case image store maintenance")
+    parser.add_argument(
+        "--backfill", action="store_true", help="migrate flat resources/{id}.jpg files"
+    )
+    parser.add_argument(
+        "--remove-legacy", action="store_true", help="delete flat files once migrated"
+    )
+    args = parser.parse_args()
+    if args.backfill:
+        db_queries.create_db()
+        print(f"[IMAGES] Migrated {backfill_legacy_images(args.remove_legacy)} images")
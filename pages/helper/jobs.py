@@ -0,0 +1,249 @@
+"""
+Background jobs, so long work does not run inside Streamlit scripts.
+
+Streamlit reruns a page on every widget interaction and blocks the session
+while the script runs. Pages instead add a row to the Jobs table with
+submit() and poll it with db_queries.get_job(); a separate worker process
+claims queued jobs, runs them and stores their progress, result or error:
+
+    python -m pages.helper.jobs --worker
+
+Every handler takes (params, progress) and returns a JSON-serialisable
+result. progress(fraction, message) records how far along the job is.
+Raising marks the job as failed with the exception message.
+"""
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from pages.helper import db_queries
+
+# Jobs still "running" after this long belong to a worker that died
+STALE_AFTER = timedelta(hours=1)
+# Finished jobs older than this are deleted when a worker starts
+KEEP_FINISHED = timedelta(days=7)
+
+
+def _llm_text(text: str) -> str:
+    # genai_agent returns failures as text rather than raising
+    if text.startswith("[LLM ERROR]"):
+        raise RuntimeError(text)
+    return text
+
+
+def run_match(params, progress):
+    from pages.helper import match_algo
+
+    progress(0.1, "Matching")
+    result = match_algo.match(mode=params.get("mode", "incremental"))
+    if result.get("skipped"):
+        # Expected on a fresh or sparse install; every public submission
+        # queues a match, so these must not pile up as failed jobs
+        return {"skipped": result["message"]}
+    if not result["status"]:
+        raise RuntimeError(result["message"])
+    return {"mode": result["mode"], "matched": len(result["result"])}
+
+
+def rebuild_index(params, progress):
+    """Refits the descriptor model (optional) and rebuilds the cached indexes."""
+    from pages.helper import descriptor, model_cache
+
+    fitted = None
+    if params.get("fit_descriptor"):
+        progress(0.1, "Fitting descriptor model")
+        fitted = descriptor.fit_model()
+    model_cache.invalidate()
+    sizes = {}
+    for step, model in enumerate((db_queries.RegisteredCases, db_queries.PublicSubmissions)):
+        progress(0.4 + 0.3 * step, f"Indexing {model.__tablename__}")
+        sizes[model.__tablename__] = len(model_cache.get_index(model, "NF", descriptor_model=fitted))
+    if fitted is not None:
+        # The score calibration holds distances of the previous version; it
+        # is queued first so the rematch below scores with the new one
+        submit("calibrate_scores", dedupe=True)
+        # Watermarks were reset, so this rematches everything with the new descriptors
+        submit("match", dedupe=True, mode="incremental")
+        # Trained station models hold descriptors of the previous version
+        from pages.helper import model_registry
+
+        for submitted_by in db_queries.get_submitter_fingerprints(db_queries.RegisteredCases, "NF"):
+            if model_registry.read_manifest(submitted_by) is not None:
+                submit("train", dedupe=True, submitted_by=submitted_by)
+    return sizes
+
+
+def calibrate_scores(params, progress):
+    """Refits the match score on confirmed matches (match_algo.fit_score_calibration)."""
+    from pages.helper import match_algo
+
+    progress(0.1, "Fitting match scores")
+    calibration = match_algo.fit_score_calibration()
+    if calibration is None:
+        return {"skipped": f"Fewer than {match_algo.MIN_CALIBRATION_PAIRS} confirmed matches"}
+    return calibration
+
+
+def train(params, progress):
+    from pages.helper import train_model
+
+    progress(0.1, "Training")
+    result = train_model.train(params["submitted_by"])
+    if not result["status"]:
+        raise RuntimeError(result["message"])
+    return result
+
+
+def case_alert(params, progress):
+    """Drafts and stores the public alert for a registered case."""
+    from pages.helper import genai_agent
+
+    progress(0.1, "Drafting alert")
+    alert_text = _llm_text(genai_agent.draft_case_alert(params["case"]))
+    db_queries.save_alert(params["case_id"], alert_text)
+    return {"alert": alert_text}
+
+
+def alert_preview(params, progress):
+    """Alert texts for a registered case, returned for preview and not stored."""
+    from pages.helper import genai_agent
+
+    progress(0.1, "Drafting alert")
+    return genai_agent.generate_alert(params["case"])
+
+
+def public_alert(params, progress):
+    """Alert preview for a public submission, written next to its image."""
+    from pages.helper import genai_agent
+
+    progress(0.1, "Drafting alert")
+    alert_obj = genai_agent.generate_alert(params["case"])
+    with open(f"./resources/{params['case_id']}_public_alert.json", "w", encoding="utf-8") as fo:
+        fo.write(json.dumps(alert_obj, ensure_ascii=False, indent=2))
+    return alert_obj
+
+
+def explain_match(params, progress):
+    """Match explanation and witness summary for a confirmed pair."""
+    from pages.helper import genai_agent
+
+    reg_case_id, pub_case_id = params["registered_id"], params["public_id"]
+    reg_details = db_queries.get_registered_case_detail(reg_case_id)
+    pub_details = db_queries.get_public_case_detail(pub_case_id)
+
+    progress(0.1, "Explaining match")
+    report = genai_agent.match_report(reg_details, pub_details)
+    match_explanation = _llm_text(report["match_explanation"])
+    witness_summary = _llm_text(report["witness_summary"])
+    db_queries.save_match_explanation(reg_case_id, match_explanation)
+    db_queries.save_witness_summary(reg_case_id, witness_summary)
+    return {"match_explanation": match_explanation, "witness_summary": witness_summary}
+
+
+def ingest_video(params, progress):
+    """
+    Faces of an uploaded clip, stored as one public submission. Every batch
+    is matched in this job: the match jobs it queues would only run once it
+    finishes.
+    """
+    from pages.helper import video_ingest
+
+    progress(0.0, "Decoding video")
+    try:
+        return video_ingest.ingest_video(
+            params["path"], params["details"], match_inline=True, progress=progress
+        )
+    finally:
+        if params.get("delete_after"):
+            try:
+                os.remove(params["path"])
+            except FileNotFoundError:
+                pass
+
+
+JOB_HANDLERS = {
+    "match": run_match,
+    "rebuild_index": rebuild_index,
+    "train": train,
+    "calibrate_scores": calibrate_scores,
+    "case_alert": case_alert,
+    "alert_preview": alert_preview,
+    "public_alert": public_alert,
+    "explain_match": explain_match,
+    "video": ingest_video,
+}
+
+
+def submit(kind: str, dedupe: bool = False, **params) -> str:
+    """Queues a job for the worker and returns its id."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}, expected one of {sorted(JOB_HANDLERS)}")
+    return db_queries.enqueue_job(kind, params, dedupe)
+
+
+def job_result(job):
+    """Decoded result of a finished job, or None."""
+    return json.loads(job.result) if job is not None and job.result else None
+
+
+def run_job(job):
+    """Runs one claimed job and records its outcome."""
+    def progress(fraction, message=None):
+        db_queries.update_job_progress(job.id, fraction, message)
+
+    print(f"[JOBS] Running {job.kind} {job.id}")
+    try:
+        result = JOB_HANDLERS[job.kind](json.loads(job.params), progress)
+    except Exception as e:
+        traceback.print_exc()
+        db_queries.finish_job(job.id, error=str(e) or type(e).__name__)
+        return
+    db_queries.finish_job(job.id, result=result)
+
+
+def run_worker(worker: str = None, poll_interval: float = 1.0, once: bool = False):
+    """
+    Claims and runs queued jobs until interrupted.
+
+    Args:
+        worker: str - name recorded on claimed jobs, defaults to host:pid
+        poll_interval: float - seconds to sleep while the queue is empty
+        once: bool - return as soon as the queue is empty
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    db_queries.create_db()
+    now = datetime.utcnow()
+    requeued = db_queries.requeue_stale_jobs(now - STALE_AFTER)
+    purged = db_queries.purge_finished_jobs(now - KEEP_FINISHED)
+    print(f"[JOBS] Worker {worker} started ({requeued} requeued, {purged} purged)")
+
+    while True:
+        job = db_queries.claim_next_job(worker)
+        if job is not None:
+            run_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Background job worker")
+    parser.add_argument("--worker", action="store_true", help="run the worker loop")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument("--submit", choices=sorted(JOB_HANDLERS), help="queue a job")
+    parser.add_argument("--params", default="{}", help="JSON parameters for --submit")
+    args = parser.parse_args()
+    if args.submit:
+        db_queries.create_db()
+        print(f"[JOBS] Queued {submit(args.submit, **json.loads(args.params))}")
+    if args.worker:
+        try:
+            run_worker(once=args.once)
+        except KeyboardInterrupt:
+            pass
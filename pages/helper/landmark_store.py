@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+
+# MediaPipe FaceMesh with refine_landmarks=True returns 478 (x, y, z) points
+NUM_LANDMARKS = 478
+FACE_MESH_DIM = NUM_LANDMARKS * 3
+LANDMARK_DTYPE = np.float32
+BLOB_SIZE = FACE_MESH_DIM * np.dtype(LANDMARK_DTYPE).itemsize
+
+
+def pack_landmarks(landmarks) -> bytes:
+    """
+    Packs a flat list/array of face mesh coordinates into a float32 blob.
+    Returns None when there is nothing to store or the length is wrong.
+    """
+    if landmarks is None:
+        return None
+    arr = np.asarray(landmarks, dtype=LANDMARK_DTYPE).reshape(-1)
+    if arr.size != FACE_MESH_DIM:
+        return None
+    return arr.tobytes()
+
+
+def pack_face_mesh_json(face_mesh: str) -> bytes:
+    """Packs the legacy JSON face mesh text into a float32 blob."""
+    if not face_mesh:
+        return None
+    try:
+        return pack_landmarks(json.loads(face_mesh))
+    except (ValueError, TypeError):
+        return None
+
+
+def unpack_landmarks(blob: bytes) -> np.ndarray:
+    """Returns a read-only (1434,) float32 view over a landmark blob."""
+    return np.frombuffer(blob, dtype=LANDMARK_DTYPE)
+
+
+def stack_landmarks(blobs) -> np.ndarray:
+    """
+    Stacks landmark blobs into a contiguous (N, 1434) float32 matrix.
+
+    A single bytes join + frombuffer keeps this to one copy, with no
+    per-row parsing.
+    """
+    blobs = list(blobs)
+    if not blobs:
+        return np.empty((0, FACE_MESH_DIM), dtype=LANDMARK_DTYPE)
+    return np.frombuffer(b"".join(blobs), dtype=LANDMARK_DTYPE).reshape(
+        len(blobs), FACE_MESH_DIM
+    )
+
+
+def fill_landmarks(rows, expected: int = 0):
+    """
+    Reads (id, blob) rows into a preallocated (N, 1434) float32 matrix.
+
+    Each blob is copied straight into its row, so peak memory is the matrix
+    plus whatever the row iterator buffers, instead of every blob held at
+    once and then joined. `expected` sizes the initial allocation (e.g. from
+    a COUNT); the matrix grows if more rows arrive and is trimmed to the
+    rows read.
+
+    Returns:
+        (list of ids, (N, 1434) float32 ndarray)
+    """
+    matrix = np.empty((max(expected, 1), FACE_MESH_DIM), dtype=LANDMARK_DTYPE)
+    ids = []
+    for row_id, blob in rows:
+        if len(ids) == len(matrix):
+            matrix = np.resize(matrix, (2 * len(matrix), FACE_MESH_DIM))
+        matrix[len(ids)] = unpack_landmarks(blob)
+        ids.append(row_id)
+    return ids, matrix[: len(ids)]
@@ -0,0 +1,50 @@
+"""
+Deferred imports for heavy modules.
+
+Streamlit runs each page as a fresh script, and autoscaled containers start
+cold, so every top-level import of mediapipe, the Gemini SDK and similar
+modules is paid before the first render, even on pages that never use them.
+
+    mp = lazy_import("mediapipe")
+
+returns a module object at once and runs the module's code on first
+attribute access. A module that is not installed only raises then, so
+optional dependencies do not break imports of the code that mentions them.
+
+Only use it for top-level packages. Finding a submodule
+("sklearn.neighbors") imports its parent package eagerly, so import those
+inside the function that needs them instead.
+"""
+import importlib.util
+import sys
+import types
+
+
+class _MissingModule(types.ModuleType):
+    """Stands in for a module that is not installed; raises on first use."""
+
+    def __init__(self, name, error):
+        super().__init__(name)
+        self._error = error
+
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError(f"{self.__name__} is required for this feature") from self._error
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Returns module `name`, executing it only on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    except ModuleNotFoundError as e:
+        return _MissingModule(name, e)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
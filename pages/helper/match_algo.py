@@ -1,127 +1,443 @@
-import os
-import pickle
 import json
+import os
+import tempfile
 import traceback
 import warnings
 from collections import defaultdict
 
-import pandas as pd
+
+warnings.filterwarnings(action="ignore")
+
+
 import numpy as np
 
+from pages.helper import ann_backends, db_queries, descriptor, metrics, model_cache
 
-warnings.filterwarnings(action="ignore")
+# Bump whenever the feature representation or distance changes, so stored
+# match watermarks are discarded and the next run is a full rebuild.
+# 3: watermarks are rowids instead of submitted_on
+MATCH_INDEX_VERSION = 3
+
+# "descriptor": Procrustes-aligned, PCA-reduced shapes (see descriptor.py)
+# "landmarks": raw 1434-dim MediaPipe coordinates
+MATCH_FEATURES = "descriptor"
+# Default match() threshold per feature kind. Aligned shapes have unit norm,
+# so descriptor distances are on a much smaller scale than raw ones.
+DISTANCE_THRESHOLDS = {"descriptor": 0.1, "landmarks": 3}
+# Candidates kept per case, in each direction, in the MatchCandidates table
+TOP_K = 5
+# Steepness of the fallback score curve around the threshold: a candidate at
+# half the threshold distance scores ~0.95, one at 1.5x the threshold ~0.05.
+# Hand picked; used until enough matches are confirmed to fit the curve
+SCORE_SLOPE = 6.0
+# Score curve fitted on confirmed matches (fit_score_calibration)
+CALIBRATION_PATH = os.path.join(os.path.dirname(db_queries.DB_PATH), "score_calibration.json")
+# Confirmed matches needed before the fitted curve replaces the fallback
+MIN_CALIBRATION_PAIRS = 20
+# L2 penalty on the standardised slope, so perfectly separated confirmed
+# pairs give a steep but finite curve
+CALIBRATION_PENALTY = 1e-2
 
 
-from pages.helper import db_queries
+def _load_features(model, status, after_rowid, until_rowid, features, descriptor_model):
+    if features == "descriptor":
+        return descriptor.load_descriptors(
+            model, status, after_rowid, until_rowid, model=descriptor_model
+        )
+    return db_queries.fetch_landmarks(model, status, after_rowid, until_rowid)
 
 
-def get_public_cases_data(status="NF"):
+def get_public_cases_data(status="NF", after_rowid=None, until_rowid=None, features=MATCH_FEATURES, descriptor_model=None):
+    """Returns (ids, (N, D) float32 features) for public submissions."""
     try:
-        result = db_queries.fetch_public_cases(train_data=True, status=status)
-        d1 = pd.DataFrame(result, columns=["label", "face_mesh"])
-        d1["face_mesh"] = d1["face_mesh"].apply(lambda x: json.loads(x))
-        d2 = pd.DataFrame(d1.pop("face_mesh").values.tolist(), index=d1.index).rename(
-            columns=lambda x: "fm_{}".format(x + 1)
+        return _load_features(
+            db_queries.PublicSubmissions, status, after_rowid, until_rowid, features, descriptor_model
         )
-        df = d1.join(d2)
-        # Ensure all columns except label are float
-        for col in df.columns:
-            if col != "label":
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        return df
-
     except Exception as e:
         traceback.print_exc()
         return None
 
 
-def get_registered_cases_data(status="NF"):
+def get_registered_cases_data(status="NF", after_rowid=None, until_rowid=None, features=MATCH_FEATURES, descriptor_model=None):
+    """Returns (ids, (N, D) float32 features) for registered cases."""
     try:
-        from pages.helper.db_queries import engine, RegisteredCases
-        import pandas as pd
-        import json
-        from sqlmodel import Session, select
-
-        with Session(engine) as session:
-            result = session.exec(
-                select(
-                    RegisteredCases.id,
-                    RegisteredCases.face_mesh,
-                    RegisteredCases.status,
-                )
-            ).all()
-            d1 = pd.DataFrame(result, columns=["label", "face_mesh", "status"])
-            if status:
-                d1 = d1[d1["status"] == status]
-            d1["face_mesh"] = d1["face_mesh"].apply(lambda x: json.loads(x))
-            d2 = pd.DataFrame(
-                d1.pop("face_mesh").values.tolist(), index=d1.index
-            ).rename(columns=lambda x: "fm_{}".format(x + 1))
-            df = d1.join(d2)
-            # Ensure all columns except label and status are float
-            for col in df.columns:
-                if col not in ["label", "status"]:
-                    df[col] = pd.to_numeric(df[col], errors="coerce")
-            return df
+        return _load_features(
+            db_queries.RegisteredCases, status, after_rowid, until_rowid, features, descriptor_model
+        )
     except Exception as e:
         traceback.print_exc()
         return None
 
 
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.preprocessing import LabelEncoder
+def nearest_neighbors(reg_features, pub_features, n_neighbors=1, chunk_size=1024, reg_sq_norms=None):
+    """
+    Finds the closest registered cases for every public submission in one pass.
+
+    Exact euclidean distances via ann_backends.blocked_knn.
+
+    Args:
+        reg_features: (N, D) ndarray of registered case features
+        pub_features: (M, D) ndarray of public submission features
+        n_neighbors: int - neighbours to return per public submission
+        chunk_size: int - public rows scored per block, bounds memory to
+            chunk_size x N distances
+        reg_sq_norms: (N,) ndarray - squared row norms of reg_features, if
+            already known (e.g. from a cached index)
+
+    Returns:
+        (indices, distances) - two (M, n_neighbors) ndarrays, closest first
+    """
+    return ann_backends.blocked_knn(
+        reg_features, pub_features, n_neighbors, chunk_size, reg_sq_norms
+    )
+
+
+def similarity_score(distances, distance_threshold, calibration=None):
+    """
+    Maps distances to 0-1 scores, higher is better.
+
+    With a `calibration` from fit_score_calibration(), the score is the
+    fitted probability that a candidate at that distance is the confirmed
+    match. Without one (too few confirmed matches so far) it is a fixed
+    logistic curve in distance / threshold, exactly 0.5 at the threshold,
+    which orders candidates but is not a probability.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    if calibration is not None:
+        return 1.0 / (1.0 + np.exp(-(calibration["intercept"] + calibration["slope"] * distances)))
+    ratio = distances / distance_threshold
+    return 1.0 / (1.0 + np.exp(SCORE_SLOPE * (ratio - 1.0)))
+
+
+def _fit_logistic(x, y, penalty=CALIBRATION_PENALTY, iterations=50):
+    """(intercept, slope) of P(y=1) = sigmoid(intercept + slope * x), by Newton's method."""
+    mean, scale = x.mean(), x.std() or 1.0
+    design = np.column_stack([np.ones_like(x), (x - mean) / scale])
+    weights = np.zeros(2)
+    ridge = np.diag([0.0, penalty])
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-design @ weights))
+        gradient = design.T @ (p - y) + ridge @ weights
+        hessian = (design * (p * (1 - p))[:, None]).T @ design + ridge
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    slope = weights[1] / scale
+    return float(weights[0] - slope * mean), float(slope)
+
+
+def fit_score_calibration(k=TOP_K, descriptor_model=None, path=CALIBRATION_PATH):
+    """
+    Fits similarity_score() on the matches reviewers confirmed.
+
+    Every confirmed (registered, public) pair contributes the candidate
+    list the review queue would have shown for that case: the registered
+    case's k nearest public submissions, labelled 1 for the confirmed one
+    and 0 for the others. A logistic regression on distance then gives the
+    probability that a candidate is the match. The result is saved to
+    `path` with the feature kind and descriptor version it holds for.
+
+    Returns:
+        dict - the calibration, or None with fewer than
+            MIN_CALIBRATION_PAIRS confirmed matches
+    """
+    descriptor_model = model_cache.resolve_descriptor_model(MATCH_FEATURES, descriptor_model)
+    pairs = dict(db_queries.get_confirmed_matches())
+    if len(pairs) < MIN_CALIBRATION_PAIRS:
+        return None
+    reg_ids, reg_features = _load_features(
+        db_queries.RegisteredCases, "F", None, None, MATCH_FEATURES, descriptor_model
+    )
+    pub_ids, pub_features = _load_features(
+        db_queries.PublicSubmissions, None, None, None, MATCH_FEATURES, descriptor_model
+    )
+    reg_rows = {row_id: i for i, row_id in enumerate(reg_ids)}
+    pub_rows = {row_id: i for i, row_id in enumerate(pub_ids)}
+    confirmed = [
+        (reg_rows[reg_id], pub_rows[pub_id])
+        for reg_id, pub_id in pairs.items()
+        if reg_id in reg_rows and pub_id in pub_rows
+    ]
+    if len(confirmed) < MIN_CALIBRATION_PAIRS:
+        return None
+
+    queries = reg_features[[reg_row for reg_row, _ in confirmed]]
+    indices, distances = ann_backends.blocked_knn(pub_features, queries, min(k, len(pub_ids)))
+    x, y = [], []
+    for (reg_row, pub_row), row_indices, row_distances in zip(confirmed, indices, distances):
+        # The confirmed submission counts once, whether or not it was in the top k
+        x.append(float(np.linalg.norm(reg_features[reg_row] - pub_features[pub_row])))
+        y.append(1.0)
+        for pub_index, distance in zip(row_indices, row_distances):
+            if pub_index != pub_row:
+                x.append(float(distance))
+                y.append(0.0)
+    intercept, slope = _fit_logistic(np.asarray(x), np.asarray(y))
+    calibration = {
+        "intercept": intercept,
+        "slope": slope,
+        "features": MATCH_FEATURES,
+        "descriptor_version": getattr(descriptor_model, "version", None),
+        "pairs": len(confirmed),
+        "candidates": len(x),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(calibration, file)
+    os.replace(tmp_path, path)
+    return calibration
+
+
+def load_score_calibration(descriptor_model=None, path=CALIBRATION_PATH):
+    """The saved calibration if it was fitted on the current features, else None."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            calibration = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if calibration.get("features") != MATCH_FEATURES:
+        return None
+    if calibration.get("descriptor_version") != getattr(descriptor_model, "version", None):
+        return None
+    return calibration
 
 
-def match(distance_threshold=3):
+def _collect_candidates(candidates, index, query_labels, query_features, k, reverse=False):
+    """
+    Adds the top-k neighbours in `index` (a model_cache.NeighborIndex, or the
+    ShardedIndex of registered cases, which searches each station's shard
+    and merges the top k) of every query row to `candidates`, keyed by
+    (registered_id, public_id).
+
+    Forward (public queries against the registered index) fills
+    registered_rank; reverse (registered queries against the public index)
+    fills public_rank.
+    """
+    if len(index) == 0 or len(query_features) == 0:
+        return
+    # Top-k neighbours for every query row, in one batch
+    with metrics.timed("match.query"):
+        labels, distances = index.query(query_features, k)
+    rank_field = "public_rank" if reverse else "registered_rank"
+    for query_label, row_labels, row_distances in zip(query_labels, labels, distances):
+        for rank, (index_label, distance) in enumerate(zip(row_labels, row_distances)):
+            if reverse:
+                key = (query_label, index_label)
+            else:
+                key = (index_label, query_label)
+            candidate = candidates.setdefault(
+                key,
+                {
+                    "registered_id": key[0],
+                    "public_id": key[1],
+                    "distance": float(distance),
+                    "registered_rank": None,
+                    "public_rank": None,
+                },
+            )
+            candidate[rank_field] = rank
+
+
+def _displaced(new_features, ids, features, boundaries, k):
+    """
+    Ids of the rows (ids, features) whose stored top-k list at least one of
+    `new_features` enters: closer than their k-th candidate, or the list is
+    not full yet. `boundaries` comes from db_queries.get_rank_boundaries().
+    """
+    if len(new_features) == 0 or len(ids) == 0:
+        return set()
+    _, nearest = ann_backends.blocked_knn(new_features, features, 1)
+    displaced = set()
+    for row_id, distance in zip(ids, nearest[:, 0].tolist()):
+        count, kth_distance = boundaries.get(row_id, (0, None))
+        if count < k or distance < kth_distance:
+            displaced.add(row_id)
+    return displaced
+
+
+def _rerank_counterparts(candidates, reg_index, pub_index, new_public_cases, new_registered_cases, k):
+    """
+    Recomputes the ranks that new rows displace in an incremental run.
+
+    A new public submission can enter the top k of any registered case
+    closer to it than that case's k-th candidate, whether or not the case is
+    among the submission's own top k. Those cases' public ranks are
+    recomputed against the whole public index; likewise the registered
+    ranks of public rows a new registered case displaces.
+
+    Returns:
+        dict - save_match_candidates() arguments naming the reranked rows
+    """
+    new_public_ids, new_public_features = new_public_cases
+    new_registered_ids, new_registered_features = new_registered_cases
+    affected_registered = _displaced(
+        new_public_features, reg_index.ids, reg_index.features,
+        db_queries.get_rank_boundaries("registered"), k,
+    ) - set(new_registered_ids)
+    affected_public = _displaced(
+        new_registered_features, pub_index.ids, pub_index.features,
+        db_queries.get_rank_boundaries("public"), k,
+    ) - set(new_public_ids)
+    _collect_candidates(candidates, pub_index, *reg_index.rows(affected_registered), k, reverse=True)
+    _collect_candidates(candidates, reg_index, *pub_index.rows(affected_public), k)
+    return {"reranked_registered": affected_registered, "reranked_public": affected_public}
+
+
+def _best_matches(candidates, distance_threshold):
+    """registered id -> public ids that are a rank-0 hit within the threshold."""
     matched_images = defaultdict(list)
-    public_cases_df = get_public_cases_data()
-    registered_cases_df = get_registered_cases_data()
+    for candidate in candidates.values():
+        best = candidate["registered_rank"] == 0 or candidate["public_rank"] == 0
+        if best and candidate["distance"] <= distance_threshold:
+            matched_images[candidate["registered_id"]].append(candidate["public_id"])
+    return matched_images
 
-    if public_cases_df is None or registered_cases_df is None:
-        return {"status": False, "message": "Couldn't connect to database"}
-    if len(public_cases_df) == 0 or len(registered_cases_df) == 0:
-        return {"status": False, "message": "No public or registered cases found"}
 
-    # Store original labels before encoding
-    original_reg_labels = registered_cases_df.iloc[:, 0].tolist()
-    original_pub_labels = public_cases_df.iloc[:, 0].tolist()
+def _load_watermark(table_name):
+    watermark = db_queries.get_match_watermark(table_name)
+    if watermark is None or watermark.index_version != MATCH_INDEX_VERSION:
+        return None
+    return watermark
 
-    # Prepare training data - use index positions as labels for the classifier
-    reg_features = registered_cases_df.iloc[:, 2:].values.astype(float)
 
-    # Create simple numeric labels for KNN (0, 1, 2, ...)
-    numeric_labels = list(range(len(reg_features)))
+def _until(index, watermark):
+    """
+    Rowid this run covers `index` up to. An index with no rows has no last
+    rowid; the previous watermark is kept then, rather than stored as None
+    (which would make the next incremental run treat every row as new).
+    """
+    if index.last_rowid is None and watermark is not None:
+        return watermark.last_rowid
+    return index.last_rowid
 
-    # Train KNN classifier with numeric labels
-    knn = KNeighborsClassifier(n_neighbors=1, algorithm="ball_tree", weights="distance")
-    knn.fit(reg_features, numeric_labels)
 
-    # For each public submission, find the closest registered case
-    for i, row in public_cases_df.iterrows():
-        pub_label = original_pub_labels[i]  # Original public case ID
-        face_encoding = np.array(row[1:]).astype(float)
+@metrics.timed("match.run")
+def match(distance_threshold=None, mode="incremental", top_k=TOP_K):
+    """
+    Matches public submissions against registered cases.
 
-        try:
-            # Get distances to nearest neighbors
-            closest_distances = knn.kneighbors([face_encoding])[0][0]
-            closest_distance = np.min(closest_distances)
-            print(f"Distance for case {pub_label}: {closest_distance}")
+    The top_k registered cases for every public submission, and the top_k
+    public submissions for every registered case, are stored with their
+    distance and similarity_score() (calibrated on confirmed matches once
+    there are enough of them) in the MatchCandidates table, which the
+    Match Cases page reads as a ranked review queue.
 
-            # Check if distance meets threshold criteria
-            if closest_distance <= distance_threshold:  # Lower distance = better match
-                # Get the index of the predicted registered case
-                predicted_idx = knn.predict([face_encoding])[0]
-                # Get the original UUID of the registered case
-                reg_label = original_reg_labels[predicted_idx]
-                # Store the match
-                matched_images[reg_label].append(pub_label)
-        except Exception as e:
-            print(f"Error processing public case {pub_label}: {str(e)}")
-            continue
+    Args:
+        distance_threshold: float - maximum feature distance for a match,
+            defaults to DISTANCE_THRESHOLDS[MATCH_FEATURES]
+        mode: str - "incremental" only scores rows committed since the last
+            run (new public rows against every registered case, and new
+            registered cases against every public submission); "full"
+            rematches everything and replaces the stored candidates.
+            Incremental falls back to full when no watermark exists or
+            MATCH_INDEX_VERSION changed.
+        top_k: int - candidates kept per case in each direction
 
-    return {"status": True, "result": matched_images}
+    The descriptor model is resolved once and used for every index and
+    loader of the run. match() never refits it: when descriptor.needs_refit()
+    a rebuild_index job is queued instead, and until a first model exists
+    the run fails.
+
+    Returns:
+        dict - {
+            "status": bool - whether the functional call was successful or not
+            "result": dict - registered case id -> list of public case ids
+                whose best candidate is within the threshold
+            "mode": str - mode that actually ran
+            "skipped": bool - set (with status False) when there is nothing
+                to match yet: no cases on one side, or no descriptor model
+        }
+    """
+    if distance_threshold is None:
+        distance_threshold = DISTANCE_THRESHOLDS[MATCH_FEATURES]
+    candidates = {}
+    reg_table = db_queries.RegisteredCases.__tablename__
+    pub_table = db_queries.PublicSubmissions.__tablename__
+
+    try:
+        descriptor_model = model_cache.resolve_descriptor_model(MATCH_FEATURES)
+        if MATCH_FEATURES == "descriptor" and descriptor.needs_refit(descriptor_model):
+            db_queries.enqueue_job("rebuild_index", {"fit_descriptor": True}, dedupe=True)
+            if descriptor_model is None:
+                return {"status": False, "skipped": True, "message": "Descriptor model not fitted yet, a refit is queued"}
+        # Both indexes are shared and only refitted when their cases change;
+        # the registered one is per station, so a new case refits one shard
+        reg_index = model_cache.get_index(
+            db_queries.RegisteredCases, "NF", MATCH_FEATURES, descriptor_model=descriptor_model
+        )
+        pub_index = model_cache.get_index(
+            db_queries.PublicSubmissions, "NF", MATCH_FEATURES, descriptor_model=descriptor_model
+        )
+        reg_watermark = _load_watermark(reg_table)
+        pub_watermark = _load_watermark(pub_table)
+        reg_until = _until(reg_index, reg_watermark)
+        pub_until = _until(pub_index, pub_watermark)
+    except Exception:
+        traceback.print_exc()
+        return {"status": False, "message": "Couldn't connect to database"}
+
+    if mode == "incremental" and (reg_watermark is None or pub_watermark is None):
+        mode = "full"
+    if mode == "full" and (len(pub_index) == 0 or len(reg_index) == 0):
+        return {"status": False, "skipped": True, "message": "No public or registered cases found"}
+
+    if mode == "full":
+        new_public_cases = (pub_index.ids, pub_index.features)
+        new_registered_cases = (reg_index.ids, reg_index.features)
+    else:
+        new_public_cases = get_public_cases_data(
+            after_rowid=pub_watermark.last_rowid, until_rowid=pub_until,
+            descriptor_model=descriptor_model,
+        )
+        new_registered_cases = get_registered_cases_data(
+            after_rowid=reg_watermark.last_rowid, until_rowid=reg_until,
+            descriptor_model=descriptor_model,
+        )
+    if new_public_cases is None or new_registered_cases is None:
+        return {"status": False, "message": "Couldn't connect to database"}
+
+    reranked = {}
+    try:
+        # New public submissions against every registered case ...
+        _collect_candidates(candidates, reg_index, *new_public_cases, top_k)
+        # ... and new registered cases against every public submission
+        _collect_candidates(candidates, pub_index, *new_registered_cases, top_k, reverse=True)
+        if mode == "incremental":
+            reranked = _rerank_counterparts(
+                candidates, reg_index, pub_index, new_public_cases, new_registered_cases, top_k
+            )
+    except Exception:
+        traceback.print_exc()
+        return {"status": False, "message": "Couldn't query the match indexes"}
+
+    rows = list(candidates.values())
+    metrics.increment("match.candidates", len(rows))
+    calibration = load_score_calibration(descriptor_model)
+    scores = similarity_score([row["distance"] for row in rows], distance_threshold, calibration)
+    for row, score in zip(rows, scores):
+        row["score"] = float(score)
+    try:
+        db_queries.save_match_candidates(rows, replace_all=mode == "full", **reranked)
+    except Exception:
+        traceback.print_exc()
+        return {"status": False, "message": "Couldn't save match candidates"}
+
+    # A refit in another process during the run reset the watermarks; keeping
+    # them reset makes the next run a full one with the new descriptors
+    current_model = model_cache.resolve_descriptor_model(MATCH_FEATURES)
+    if getattr(current_model, "version", None) == getattr(descriptor_model, "version", None):
+        db_queries.save_match_watermark(reg_table, reg_until, MATCH_INDEX_VERSION)
+        db_queries.save_match_watermark(pub_table, pub_until, MATCH_INDEX_VERSION)
+    return {"status": True, "result": _best_matches(candidates, distance_threshold), "mode": mode}
 
 
 if __name__ == "__main__":
-    result = match()
-    print(result)
+    import sys
+
+    if "--calibrate" in sys.argv:
+        print(fit_score_calibration())
+    else:
+        result = match(mode="full" if "--full" in sys.argv else "incremental")
+        print(result)
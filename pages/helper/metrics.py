@@ -0,0 +1,371 @@
+"""
+Lightweight timers, counters and histograms for the hot paths.
+
+    with metrics.timed("match.query"):
+        ...
+
+    @metrics.timed("extract.face_mesh")
+    def extract(...): ...
+
+    metrics.increment("llm.cache_hits")
+
+Each process (every Streamlit server, the job worker) keeps its own
+registry in memory and writes it to metrics/<host>-<pid>.json next to the
+database at most every FLUSH_SECONDS. At exit it folds its counter and
+histogram totals into metrics/retired.json and removes its own file; no
+other process ever removes it. The Metrics admin page and the Prometheus
+endpoint merge those files, so totals cover all processes, past and live:
+
+    python -m pages.helper.metrics --serve 9108     # Prometheus text
+    python -m pages.helper.metrics --json           # merged snapshot
+
+Histograms keep the last RESERVOIR_SIZE observations, so percentiles
+describe recent behaviour; observations of processes that have not written
+for STALE_SECONDS are left out of them. FMP_METRICS=0 turns recording off.
+"""
+import atexit
+import functools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Same location rule as db_queries.DB_PATH, without importing it (db_queries
+# itself is instrumented)
+METRICS_DIR = os.path.join(
+    os.path.dirname(
+        os.getenv(
+            "FMP_DB_PATH",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "sqlite_database.db"),
+        )
+    ),
+    "metrics",
+)
+ENABLED = os.getenv("FMP_METRICS", "1") != "0"
+RESERVOIR_SIZE = 2048
+FLUSH_SECONDS = 5.0
+# Recent observations of processes that stopped writing this long ago are
+# left out of percentiles (their totals still count)
+STALE_SECONDS = 24 * 3600
+# Totals of exited processes
+RETIRED_FILE = "retired.json"
+# Seconds an exiting process waits for RETIRED_FILE's lock, and the age at
+# which a lock left by a killed process is broken
+LOCK_TIMEOUT = 5.0
+LOCK_STALE_SECONDS = 60.0
+PERCENTILES = (50, 95, 99)
+
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+_last_flush = 0.0
+_process = f"{socket.gethostname()}-{os.getpid()}"
+
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+
+def increment(name: str, value: int = 1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    _maybe_flush()
+
+
+def observe(name: str, value: float):
+    """Records one observation (e.g. a latency in seconds) in histogram `name`."""
+    if not ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.observe(value)
+    _maybe_flush()
+
+
+class timed:
+    """Times a block or function into histogram `name` (seconds); failures also count `name.errors`."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self._start)
+        if exc_type is not None:
+            increment(f"{self.name}.errors")
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def instrument_module(namespace: dict, prefix: str, skip=()):
+    """
+    Wraps every public function defined in the module owning `namespace`
+    (pass globals()) with timed(f"{prefix}.{name}").
+    """
+    module_name = namespace["__name__"]
+    for name, value in list(namespace.items()):
+        if (
+            callable(value)
+            and getattr(value, "__module__", None) == module_name
+            and not isinstance(value, type)
+            and not name.startswith("_")
+            and name not in skip
+        ):
+            namespace[name] = timed(f"{prefix}.{name}")(value)
+
+
+def snapshot() -> dict:
+    """This process's metrics: counters plus raw recent histogram values."""
+    with _lock:
+        return {
+            "process": _process,
+            "updated": time.time(),
+            "counters": dict(_counters),
+            "histograms": {
+                name: {"count": h.count, "sum": h.total, "recent": list(h.recent)}
+                for name, h in _histograms.items()
+            },
+        }
+
+
+def _write_json(path: str, data: dict):
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Writes this process's snapshot to METRICS_DIR atomically."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(os.path.join(METRICS_DIR, f"{_process}.json"), snapshot())
+    except OSError as e:
+        print(f"[METRICS] Couldn't write metrics: {e}")
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= FLUSH_SECONDS:
+        flush()
+
+
+def _acquire_lock(lock_path: str) -> bool:
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+
+def retire():
+    """
+    Folds this process's totals into RETIRED_FILE, then removes its own file.
+
+    RETIRED_FILE lists the processes folded into it, and collect() skips
+    their files, so a reader racing the removal never counts a process
+    twice. If the lock can't be taken, the process file is simply left in
+    place; collect() still counts it.
+    """
+    if not (_counters or _histograms):
+        return
+    lock_path = os.path.join(METRICS_DIR, RETIRED_FILE + ".lock")
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        if not _acquire_lock(lock_path):
+            print("[METRICS] Couldn't lock retired totals, keeping the process file")
+            flush()
+            return
+        try:
+            retired_path = os.path.join(METRICS_DIR, RETIRED_FILE)
+            retired = _read_json(retired_path) or {"processes": [], "counters": {}, "histograms": {}}
+            current = snapshot()
+            for name, value in current["counters"].items():
+                retired["counters"][name] = retired["counters"].get(name, 0) + value
+            for name, h in current["histograms"].items():
+                total = retired["histograms"].setdefault(name, {"count": 0, "sum": 0.0})
+                total["count"] += h["count"]
+                total["sum"] += h["sum"]
+            # Only processes whose file may still be on disk need to be listed
+            files = set(os.listdir(METRICS_DIR))
+            retired["processes"] = [
+                process for process in retired["processes"] if f"{process}.json" in files
+            ] + [_process]
+            _write_json(retired_path, retired)
+            try:
+                os.remove(os.path.join(METRICS_DIR, f"{_process}.json"))
+            except FileNotFoundError:
+                pass
+        finally:
+            os.remove(lock_path)
+    except OSError as e:
+        print(f"[METRICS] Couldn't retire metrics: {e}")
+
+
+def collect() -> dict:
+    """
+    Merged metrics of every process: totals of live and exited processes,
+    percentiles of recent observations.
+
+    Never removes a file; only the owning process does (retire()).
+
+    Returns:
+        dict - {
+            "counters": {name: total},
+            "histograms": {name: {"count", "sum", "p50", "p95", "p99", "max"}}
+                percentiles and max are NaN for a histogram with no recent
+                observations
+        }
+    """
+    if _counters or _histograms:
+        flush()
+    counters, sums, counts, recent = {}, {}, {}, {}
+    now = time.time()
+    names = os.listdir(METRICS_DIR) if os.path.isdir(METRICS_DIR) else []
+    processes = []
+    for file_name in names:
+        if not file_name.endswith(".json") or file_name == RETIRED_FILE:
+            continue
+        data = _read_json(os.path.join(METRICS_DIR, file_name))
+        if data is not None:
+            processes.append(data)
+    # Read after the process files, so a process retired meanwhile is
+    # either skipped below or not counted in it yet
+    retired = _read_json(os.path.join(METRICS_DIR, RETIRED_FILE)) or {
+        "processes": [], "counters": {}, "histograms": {}
+    }
+    folded = set(retired["processes"])
+    for data in [retired] + [data for data in processes if data["process"] not in folded]:
+        for name, value in data["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+        for name, h in data["histograms"].items():
+            counts[name] = counts.get(name, 0) + h["count"]
+            sums[name] = sums.get(name, 0.0) + h["sum"]
+            values = recent.setdefault(name, [])
+            if "recent" in h and now - data["updated"] <= STALE_SECONDS:
+                values.extend(h["recent"])
+
+    histograms = {}
+    for name, values in recent.items():
+        summary = {"count": counts[name], "sum": sums[name]}
+        if values:
+            values = np.asarray(values)
+            summary["max"] = float(values.max())
+            for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                summary[f"p{p}"] = float(value)
+        else:
+            summary["max"] = float("nan")
+            summary.update({f"p{p}": float("nan") for p in PERCENTILES})
+        histograms[name] = summary
+    return {"counters": counters, "histograms": histograms}
+
+
+def _prometheus_name(name: str) -> str:
+    return "fmp_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text(collected: dict = None) -> str:
+    """Prometheus text exposition of collect(): counters and latency summaries."""
+    collected = collected or collect()
+    lines = []
+    for name, value in sorted(collected["counters"].items()):
+        metric = _prometheus_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, h in sorted(collected["histograms"].items()):
+        metric = _prometheus_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for p in PERCENTILES:
+            # Prometheus spells it NaN (no recent observations)
+            value = "NaN" if np.isnan(h[f"p{p}"]) else f'{h[f"p{p}"]:.6g}'
+            lines.append(f'{metric}{{quantile="{p / 100}"}} {value}')
+        lines += [f"{metric}_sum {h['sum']:.6g}", f"{metric}_count {h['count']}"]
+    return "\n".join(lines) + "\n"
+
+
+def serve(port: int = 9108):
+    """Serves prometheus_text() at http://<host>:<port>/metrics until interrupted."""
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    print(f"[METRICS] Serving on :{port}/metrics")
+    HTTPServer(("", port), Handler).serve_forever()
+
+
+if ENABLED:
+    # Readers (the CLI, the Prometheus endpoint) have nothing of their own to retire
+    atexit.register(retire)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export collected metrics")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="serve Prometheus text")
+    parser.add_argument("--json", action="store_true", help="print the merged snapshot")
+    args = parser.parse_args()
+    if args.serve:
+        try:
+            serve(args.serve)
+        except KeyboardInterrupt:
+            pass
+    elif args.json:
+        print(json.dumps(collect(), indent=2))
+    else:
+        print(prometheus_text(), end="")
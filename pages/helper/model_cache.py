@@ -0,0 +1,391 @@
+"""
+Process-wide cache of fitted neighbour indexes, one per (table, status,
+feature kind, shard).
+
+Streamlit reruns every page script on each interaction, but imported modules
+live for the whole server process, so the indexes held here are shared by
+every session. An index is rebuilt when the (row count, last rowid,
+descriptor version) fingerprint of its rows changes, or when db_queries
+reports a write through its change hooks. Built indexes are also snapshotted to disk so a fresh
+process can load them instead of refitting, and a station's shard is served
+from its trained model_registry model when that model is up to date.
+
+Registered cases are sharded by submitted_by (one shard per station or
+officer). The global index of a sharded table is a ShardedIndex over the
+shards: a query runs against every shard's own backend and the per-shard
+results are merged into the overall top k, so when one station registers a
+case only its shard is reloaded and refitted; the others are reused as they
+are. search() routes a query to one shard or to the global index.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import traceback
+
+import numpy as np
+
+from pages.helper import ann_backends, db_queries, descriptor, metrics, model_registry
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(db_queries.DB_PATH), "index_cache")
+# Tables indexed per submitted_by. Public submissions are not: their
+# submitted_by is the member of the public who sent them, not a station.
+SHARDED_TABLES = {db_queries.RegisteredCases.__tablename__}
+# Station models in model_registry are trained on these shards (train_model.train)
+REGISTRY_STATUS = "NF"
+REGISTRY_FEATURES = "descriptor"
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class NeighborIndex:
+    """Feature matrix of one (table, status) with precomputed row norms."""
+
+    def __init__(self, ids, features, fingerprint, sq_norms=None):
+        self.ids = list(ids)
+        self.features = features
+        self.fingerprint = fingerprint
+        self.sq_norms = np.einsum("ij,ij->i", features, features) if sq_norms is None else sq_norms
+        self._backend = None
+
+    def backend(self):
+        """The configured ann_backends backend, fitted on first use and kept."""
+        if self._backend is None:
+            with metrics.timed("index.fit"):
+                self._backend = ann_backends.get_backend().fit(self.features, self.sq_norms)
+        return self._backend
+
+    def query(self, queries, k):
+        """(list of lists of row ids, (M, k') distances) of the k nearest rows, closest first."""
+        if len(self) == 0:
+            return [[] for _ in queries], np.empty((len(queries), 0), dtype=np.float32)
+        indices, distances = self.backend().query(queries, k)
+        return [[self.ids[i] for i in row] for row in indices], distances
+
+    def rows(self, ids):
+        """(ids, features) of the indexed rows among `ids`, in index order."""
+        wanted = set(ids)
+        positions = [i for i, row_id in enumerate(self.ids) if row_id in wanted]
+        return [self.ids[i] for i in positions], self.features[positions]
+
+    @property
+    def last_rowid(self):
+        return self.fingerprint[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ShardedIndex:
+    """
+    Global index of a sharded table: the NeighborIndex of every submitter.
+
+    Queries fan out to each shard's backend and are merged into the overall
+    top k, so no backend is ever fitted on the whole table. The fingerprint
+    is the tuple of (submitted_by, shard fingerprint) pairs.
+    """
+
+    def __init__(self, shards, fingerprint):
+        self.shards = [shard for shard in shards if len(shard)]
+        self.fingerprint = fingerprint
+        self.ids = [row_id for shard in self.shards for row_id in shard.ids]
+        self._features = None
+
+    @property
+    def features(self):
+        """(N, D) features of every shard, in ids order. Concatenated on first use."""
+        if self._features is None:
+            if self.shards:
+                self._features = np.concatenate([shard.features for shard in self.shards])
+            else:
+                self._features = np.empty((0, 0), dtype=np.float32)
+        return self._features
+
+    def query(self, queries, k):
+        """Per-shard top k of every query row, merged. Same return as NeighborIndex.query."""
+        results = [shard.query(queries, k) for shard in self.shards]
+        if not results or len(queries) == 0:
+            return [[] for _ in queries], np.empty((len(queries), 0), dtype=np.float32)
+        if len(results) == 1:
+            return results[0]
+        return _merge_top_k(results, k)
+
+    def rows(self, ids):
+        """(ids, features) of the indexed rows among `ids`, shard by shard."""
+        parts = [shard.rows(ids) for shard in self.shards]
+        row_ids = [row_id for part_ids, _ in parts for row_id in part_ids]
+        if not parts:
+            return row_ids, self.features
+        return row_ids, np.concatenate([features for _, features in parts])
+
+    @property
+    def last_rowid(self):
+        return max((shard.last_rowid for shard in self.shards), default=None)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _key(model, status, features, submitted_by=None):
+    return model.__tablename__, status, features, submitted_by
+
+
+def _snapshot_base(key):
+    table, status, features, submitted_by = key
+    base = os.path.join(SNAPSHOT_DIR, f"{table}_{status}_{features}")
+    if submitted_by is not None:
+        # Filesystem-safe and collision-free, whatever the user name is
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", submitted_by)[:32]
+        base += f"_{slug}-{hashlib.sha1(submitted_by.encode()).hexdigest()[:8]}"
+    return base
+
+
+def _read_meta(meta_path):
+    with open(meta_path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _save_snapshot(key, index):
+    """
+    Publishes the snapshot with a single rename.
+
+    The features go to a new uniquely named .npy file; the meta file, which
+    holds the fingerprint, the ids and the name of that .npy, is then
+    replaced in one os.replace. A reader in another process therefore sees
+    either the old snapshot or the new one, never new features with old
+    meta. The superseded .npy is removed afterwards.
+    """
+    base = _snapshot_base(key)
+    meta_path = base + ".json"
+    features_path = tmp_meta = None
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        fd, features_path = tempfile.mkstemp(
+            dir=SNAPSHOT_DIR, prefix=os.path.basename(base) + ".", suffix=".npy"
+        )
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, index.features)
+        fd, tmp_meta = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "fingerprint": list(index.fingerprint),
+                    "features": os.path.basename(features_path),
+                    "ids": index.ids,
+                },
+                file,
+            )
+        try:
+            previous = _read_meta(meta_path).get("features")
+        except (OSError, ValueError):
+            previous = None
+        os.replace(tmp_meta, meta_path)
+        tmp_meta = features_path = None
+    except Exception:
+        traceback.print_exc()
+        for path in (features_path, tmp_meta):
+            if path and os.path.exists(path):
+                os.remove(path)
+        return
+
+    if previous:
+        try:
+            os.remove(os.path.join(SNAPSHOT_DIR, previous))
+        except OSError:
+            # Already gone, or still mapped by a reader on Windows
+            pass
+
+
+def _load_snapshot(key, fingerprint):
+    meta_path = _snapshot_base(key) + ".json"
+    if not os.path.isfile(meta_path):
+        return None
+    try:
+        meta = _read_meta(meta_path)
+        if tuple(meta["fingerprint"]) != fingerprint or "features" not in meta:
+            return None
+        features = np.load(os.path.join(SNAPSHOT_DIR, meta["features"]), mmap_mode="r")
+        if len(features) != len(meta["ids"]):
+            return None
+        return NeighborIndex(meta["ids"], features, fingerprint)
+    except FileNotFoundError:
+        # Superseded by a newer snapshot between reading the meta and the features
+        return None
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def _load_registry(key, fingerprint):
+    """A station shard from its trained model_registry model, if that is current."""
+    table, status, features, submitted_by = key
+    if (
+        submitted_by is None
+        or table not in SHARDED_TABLES
+        or (status, features) != (REGISTRY_STATUS, REGISTRY_FEATURES)
+    ):
+        return None
+    manifest = model_registry.read_manifest(submitted_by)
+    if manifest is None or manifest["fingerprint"] != model_registry.index_fingerprint(fingerprint):
+        return None
+    try:
+        model = model_registry.load_model(submitted_by)
+    except (OSError, ValueError):
+        # Pruned or replaced between reading the manifest and the arrays
+        return None
+    if model is None or model.manifest["fingerprint"] != manifest["fingerprint"]:
+        return None
+    return NeighborIndex(model.labels, model.features, fingerprint, model.sq_norms)
+
+
+def resolve_descriptor_model(features, descriptor_model=None):
+    """The descriptor model to build `features` indexes with (None for raw landmarks)."""
+    if features != "descriptor":
+        return None
+    return descriptor_model or descriptor.get_model()
+
+
+def _version(descriptor_model):
+    return descriptor_model.version if descriptor_model else None
+
+
+def _load_index(key, fingerprint, model, status, features, submitted_by, descriptor_model):
+    """
+    Cached index for `key` if its fingerprint still matches, else the trained
+    model_registry model, the disk snapshot or, failing those, the database.
+    Holds _lock.
+    """
+    index = _indexes.get(key)
+    if index is not None and index.fingerprint == fingerprint:
+        return index
+
+    index = _load_registry(key, fingerprint)
+    if index is not None:
+        metrics.increment("index.registry_loads")
+        _indexes[key] = index
+        return index
+
+    index = _load_snapshot(key, fingerprint)
+    if index is not None:
+        metrics.increment("index.snapshot_loads")
+    else:
+        with metrics.timed("index.build"):
+            if features == "descriptor":
+                ids, matrix = descriptor.load_descriptors(
+                    model, status, until_rowid=fingerprint[1], submitted_by=submitted_by,
+                    model=descriptor_model,
+                )
+            else:
+                ids, matrix = db_queries.fetch_landmarks(
+                    model, status, until_rowid=fingerprint[1], submitted_by=submitted_by
+                )
+            index = NeighborIndex(ids, matrix, fingerprint)
+            _save_snapshot(key, index)
+    _indexes[key] = index
+    return index
+
+
+def _assemble_global(key, model, status, features, descriptor_model):
+    """ShardedIndex of a sharded table, reusing every unchanged shard. Holds _lock."""
+    version = _version(descriptor_model)
+    shard_fingerprints = {
+        submitted_by: (*shard_fingerprint, version)
+        for submitted_by, shard_fingerprint in db_queries.get_submitter_fingerprints(model, status).items()
+    }
+    fingerprint = tuple(sorted(shard_fingerprints.items()))
+    index = _indexes.get(key)
+    if index is not None and index.fingerprint == fingerprint:
+        return index
+
+    shards = [
+        _load_index(
+            _key(model, status, features, submitted_by),
+            shard_fingerprint,
+            model,
+            status,
+            features,
+            submitted_by,
+            descriptor_model,
+        )
+        for submitted_by, shard_fingerprint in fingerprint
+    ]
+    index = ShardedIndex(shards, fingerprint)
+    _indexes[key] = index
+    return index
+
+
+def get_index(model, status="NF", features="descriptor", submitted_by=None, descriptor_model=None):
+    """
+    Returns the NeighborIndex for `model` rows with `status` (a ShardedIndex
+    for the global index of a sharded table), building it only if the
+    cached one is missing or stale.
+
+    Args:
+        model: RegisteredCases or PublicSubmissions
+        status: str - case status, e.g. "NF"
+        features: str - "descriptor" (aligned, reduced) or "landmarks" (raw)
+        submitted_by: str - one submitter's shard (sharded tables only);
+            None for the global index
+        descriptor_model: descriptor.DescriptorModel - the model to build
+            descriptor indexes with, defaults to descriptor.get_model()
+    """
+    descriptor_model = resolve_descriptor_model(features, descriptor_model)
+    key = _key(model, status, features, submitted_by)
+    with _lock:
+        if submitted_by is None and model.__tablename__ in SHARDED_TABLES:
+            return _assemble_global(key, model, status, features, descriptor_model)
+        fingerprint = (
+            *db_queries.get_table_fingerprint(model, status, submitted_by),
+            _version(descriptor_model),
+        )
+        return _load_index(key, fingerprint, model, status, features, submitted_by, descriptor_model)
+
+
+def _merge_top_k(results, k):
+    """Merges per-shard (labels, distances) results into the overall top k per query."""
+    labels = np.concatenate([np.asarray(shard_labels, dtype=object) for shard_labels, _ in results], axis=1)
+    distances = np.concatenate([shard_distances for _, shard_distances in results], axis=1)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return (
+        np.take_along_axis(labels, order, axis=1).tolist(),
+        np.take_along_axis(distances, order, axis=1),
+    )
+
+
+def search(model, queries, k=1, status="NF", features="descriptor", submitted_by=None, descriptor_model=None):
+    """
+    k nearest `model` rows for every query row.
+
+    Args:
+        queries: (M, D) ndarray of features of the same kind
+        submitted_by: str - only search this submitter's shard; otherwise
+            the global index answers, which for a sharded table searches
+            every shard and merges the top k
+
+    Returns:
+        (list of lists of row ids, (M, k') ndarray of distances), closest
+        first; k' is at most k and the number of indexed rows
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    index = get_index(model, status, features, submitted_by, descriptor_model)
+    with metrics.timed("index.query"):
+        return index.query(queries, k)
+
+
+def invalidate(table_name=None, submitted_by=None):
+    """
+    Drops cached indexes for `table_name`, or all of them if None. With
+    `submitted_by`, only that submitter's shard and the global index go.
+    """
+    with _lock:
+        for key in list(_indexes):
+            if table_name is not None and key[0] != table_name:
+                continue
+            if submitted_by is None or key[3] in (None, submitted_by):
+                del _indexes[key]
+
+
+db_queries.register_change_hook(invalidate)
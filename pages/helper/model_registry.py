@@ -0,0 +1,164 @@
+"""
+Versioned, per-user nearest-neighbour model artifacts.
+
+Each user's models live under models/<user>/ next to the database:
+
+    models/<user>/manifest.json            current version + metadata
+    models/<user>/<version>/features.npy   (N, D) float32 training descriptors
+    models/<user>/<version>/sq_norms.npy   (N,) squared row norms
+    models/<user>/<version>/labels.json    case id of every row
+
+A version directory is written under a temporary name and renamed into
+place once complete, and the manifest is replaced atomically afterwards, so
+a reader always sees either the previous model or the new one, never a
+missing or half-written one. Version directories are immutable; the last
+KEEP_VERSIONS are kept so readers holding an older manifest can finish.
+
+Loading memory-maps the .npy arrays instead of unpickling an sklearn
+object, so a model costs no copy until its pages are touched. Models are
+trained on a station's model_cache shard (train_model.train), and
+model_cache serves that shard from the current model while its
+index_fingerprint() still matches.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from pages.helper import ann_backends, db_queries
+
+MODELS_DIR = os.path.join(os.path.dirname(db_queries.DB_PATH), "models")
+MANIFEST = "manifest.json"
+KEEP_VERSIONS = 3
+
+
+def user_dir(submitted_by: str) -> str:
+    """Filesystem-safe, collision-free directory for `submitted_by`'s models."""
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", submitted_by)[:32]
+    digest = hashlib.sha1(submitted_by.encode()).hexdigest()[:8]
+    return os.path.join(MODELS_DIR, f"{slug}-{digest}")
+
+
+def fingerprint(labels, features) -> str:
+    """Content hash of a training set: same rows in the same order, same hash."""
+    digest = hashlib.sha1(json.dumps(list(labels)).encode())
+    digest.update(np.ascontiguousarray(features, dtype=np.float32).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def index_fingerprint(shard_fingerprint) -> str:
+    """
+    Manifest fingerprint of a model trained on a model_cache shard with this
+    (row count, last rowid, descriptor version) fingerprint.
+    """
+    return json.dumps(list(shard_fingerprint))
+
+
+class NeighborModel:
+    """A loaded artifact: memory-mapped features plus their case ids."""
+
+    def __init__(self, manifest: dict, labels: list, features, sq_norms):
+        self.manifest = manifest
+        self.labels = labels
+        self.features = features
+        self.sq_norms = sq_norms
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    def kneighbors(self, queries, n_neighbors: int = None):
+        """
+        Closest training cases for every query row.
+
+        Returns:
+            (list of lists of case ids, (M, k) ndarray of distances)
+        """
+        k = n_neighbors or self.manifest["n_neighbors"]
+        indices, distances = ann_backends.blocked_knn(
+            self.features, np.atleast_2d(queries), k, sq_norms=self.sq_norms
+        )
+        return [[self.labels[i] for i in row] for row in indices], distances
+
+
+def read_manifest(submitted_by: str):
+    path = os.path.join(user_dir(submitted_by), MANIFEST)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_model(submitted_by: str, labels, features, n_neighbors: int, training_fingerprint: str = None) -> dict:
+    """
+    Writes a new artifact version for `submitted_by` and makes it current.
+
+    Returns:
+        dict - the new manifest
+    """
+    directory = user_dir(submitted_by)
+    os.makedirs(directory, exist_ok=True)
+    features = np.ascontiguousarray(features, dtype=np.float32)
+    trained_on = datetime.utcnow()
+    version = f"{trained_on:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    manifest = {
+        "version": version,
+        "submitted_by": submitted_by,
+        "trained_on": trained_on.isoformat(),
+        "fingerprint": training_fingerprint or fingerprint(labels, features),
+        "rows": len(labels),
+        "dim": int(features.shape[1]) if features.ndim == 2 else 0,
+        "n_neighbors": n_neighbors,
+    }
+
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+    try:
+        np.save(os.path.join(tmp_dir, "features.npy"), features)
+        np.save(os.path.join(tmp_dir, "sq_norms.npy"), np.einsum("ij,ij->i", features, features))
+        with open(os.path.join(tmp_dir, "labels.json"), "w", encoding="utf-8") as file:
+            json.dump(list(labels), file)
+        os.rename(tmp_dir, os.path.join(directory, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    fd, tmp_manifest = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_manifest, os.path.join(directory, MANIFEST))
+
+    _prune(directory, version)
+    return manifest
+
+
+def _prune(directory: str, current: str):
+    # Version names sort by training time
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if not name.startswith(".") and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def load_model(submitted_by: str):
+    """The current NeighborModel for `submitted_by`, or None if never trained."""
+    manifest = read_manifest(submitted_by)
+    if manifest is None:
+        return None
+    version_dir = os.path.join(user_dir(submitted_by), manifest["version"])
+    with open(os.path.join(version_dir, "labels.json"), encoding="utf-8") as file:
+        labels = json.load(file)
+    return NeighborModel(
+        manifest,
+        labels,
+        np.load(os.path.join(version_dir, "features.npy"), mmap_mode="r"),
+        np.load(os.path.join(version_dir, "sq_norms.npy"), mmap_mode="r"),
+    )
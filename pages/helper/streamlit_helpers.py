@@ -1,6 +1,9 @@
 import streamlit as st
 from functools import wraps
 
+from pages.helper import db_queries
+from pages.helper.data_models import Jobs
+
 
 def require_login(func):
     """Decorator to require login for Streamlit pages."""
@@ -28,3 +31,38 @@ def show_error(message: str):
 
 def show_warning(message: str):
     st.warning(message)
+
+
+JOB_POLL_SECONDS = 2
+# Status wait_for_job() reports for a job id the Jobs table doesn't have
+JOB_MISSING = "missing"
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _job_progress(job_id: str):
+    job = db_queries.get_job(job_id)
+    if job is None or job.status not in ("queued", "running"):
+        # Finished: rerun the page so it can show the result
+        st.rerun()
+    label = "Waiting for the background worker" if job.status == "queued" else job.message or "Working"
+    st.progress(job.progress, text=label)
+
+
+def wait_for_job(job_id: str, state_key: str = None):
+    """
+    Returns the finished Jobs row for `job_id`. While it is still queued or
+    running, shows a progress bar that polls the job and returns None.
+
+    A job id that is no longer in the table (purged by the worker, or from
+    another database) returns an unsaved Jobs row with status JOB_MISSING,
+    and `state_key` is removed from st.session_state so the page stops
+    waiting for it.
+    """
+    job = db_queries.get_job(job_id)
+    if job is None:
+        st.session_state.pop(state_key, None)
+        return Jobs(id=job_id, kind="", status=JOB_MISSING, error="The job no longer exists")
+    if job.status in ("queued", "running"):
+        _job_progress(job_id)
+        return None
+    return job
@@ -1,71 +1,90 @@
-import os
-import json
-import pickle
 import traceback
 
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-from sklearn.neighbors import KNeighborsClassifier
+from pages.helper import db_queries, descriptor, model_cache, model_registry
 
-from pages.helper import db_queries
+# Neighbours returned per query by default
+N_NEIGHBORS = 5
 
 
-def get_train_data(submitted_by: str):
+def get_train_data(submitted_by: str, descriptor_model=None):
     """
-    Gets the training data for the user logged in
+    Gets the training data for the user logged in: the descriptors of their
+    not-found cases, the same rows and features match() searches
 
     Args:
         submitted_by: str
+        descriptor_model: descriptor.DescriptorModel - defaults to descriptor.get_model()
+
+    Returns:
+        model_cache.NeighborIndex - the user's shard of registered cases
     """
 
     try:
-        result = db_queries.get_training_data(submitted_by)
-
-        d1 = pd.DataFrame(result, columns=["label", "face_mesh"])
-        d1["face_mesh"] = d1["face_mesh"].apply(lambda x: json.loads(x))
-
-        d2 = pd.DataFrame(d1.pop("face_mesh").values.tolist(), index=d1.index).rename(
-            columns=lambda x: "fm_{}".format(x + 1)
+        return model_cache.get_index(
+            db_queries.RegisteredCases,
+            model_cache.REGISTRY_STATUS,
+            model_cache.REGISTRY_FEATURES,
+            submitted_by=submitted_by,
+            descriptor_model=descriptor_model,
         )
-        df = d1.join(d2)
-        return df["label"], df.drop("label", axis=1)
 
     except Exception as e:
         traceback.print_exc()
         raise e
 
 
-def train(submitted_by: str):
+def train(submitted_by: str, force: bool = False):
     """
     Trains a KNN Model on the submitted cases.
 
+    The fitted model is saved as a new version in model_registry; the
+    previous version stays current until the new one is complete. Its
+    fingerprint is the shard's (row count, last rowid, descriptor version),
+    so model_cache serves the shard from it until the cases or the
+    descriptor model change.
+
     Args:
         submitted_by: str
+        force: bool - retrain even if the cases have not changed
 
     Returns:
         dict - {
             "status": bool - whether the functional call was successful or not
             "message": str - message returned on each case
+            "version": str - current model version, when successful
         }
 
     """
-    model_name = "classifier.pkl"
-    if os.path.isfile(model_name):
-        os.remove(model_name)
     try:
-        labels, key_pts = get_train_data(submitted_by)
-        if len(labels) == 0:
-            return {"status": False, "message": "No cases submmited by this user"}
-        le = LabelEncoder()
-        encoded_labels = le.fit_transform(labels)
-        classifier = KNeighborsClassifier(
-            n_neighbors=len(labels), algorithm="ball_tree", weights="distance"
+        descriptor_model = descriptor.get_model()
+        if descriptor_model is None:
+            return {"status": False, "message": "Descriptor model not fitted yet"}
+
+        # Cheap up-to-date check before any descriptor is loaded
+        training_fingerprint = model_registry.index_fingerprint(
+            (
+                *db_queries.get_table_fingerprint(
+                    db_queries.RegisteredCases, model_cache.REGISTRY_STATUS, submitted_by
+                ),
+                descriptor_model.version,
+            )
         )
-        classifier.fit(key_pts, encoded_labels)
+        manifest = model_registry.read_manifest(submitted_by)
+        if not force and manifest and manifest["fingerprint"] == training_fingerprint:
+            return {"status": True, "message": "Model up to date", "version": manifest["version"]}
+
+        shard = get_train_data(submitted_by, descriptor_model)
+        if len(shard) == 0:
+            return {"status": False, "message": "No cases submmited by this user"}
 
-        with open(model_name, "wb") as file:
-            pickle.dump((le, classifier), file)
-        return {"status": True, "message": "Model Refreshed"}
+        manifest = model_registry.save_model(
+            submitted_by,
+            shard.ids,
+            shard.features,
+            n_neighbors=min(N_NEIGHBORS, len(shard)),
+            training_fingerprint=model_registry.index_fingerprint(shard.fingerprint),
+        )
+        return {"status": True, "message": "Model Refreshed", "version": manifest["version"]}
     except Exception as e:
         traceback.print_exc()
         return {"status": False, "message": str(e)}
@@ -73,3 +92,4 @@ def train(submitted_by: str):
 
 if __name__ == "__main__":
     result = train("admin")
+    print(result)
@@ -1,29 +1,302 @@
-import PIL
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import streamlit as st
-import mediapipe as mp
+from PIL import Image, ImageOps
+
+from pages.helper import metrics
+from pages.helper.lazy import lazy_import
+
+# Loaded on the first face mesh extraction, not when only the image helpers are used
+mp = lazy_import("mediapipe")
+
+# One FaceMesh graph per thread: graphs are expensive to build and not safe
+# to share between threads, so each worker lazily creates and keeps its own.
+_thread_local = threading.local()
+
+# Multi-face mode (crowd / CCTV stills)
+MAX_FACES = 20
+# Images whose long side exceeds TILE_MIN_SIDE are also searched in
+# overlapping TILE_SIZE tiles: the face detector sees a downscaled frame,
+# so small faces in a large image are only found at tile resolution
+TILE_SIZE = 960
+TILE_OVERLAP = 0.25
+TILE_MIN_SIDE = int(TILE_SIZE * 1.5)
+# Detections from overlapping tiles above this box IoU are the same face
+FACE_IOU = 0.4
+EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Long-lived pools, one per size, so their threads keep their FaceMesh
+# graphs between uploads and batches
+_executors = {}
+_executor_lock = threading.Lock()
+# Every graph built by any thread, closed at exit
+_face_meshes = []
+
+# Preprocessing: FaceMesh detects on a ~256px frame and places landmarks on a
+# 192px crop, so a 12 MP photo only costs memory and decode time. Crowd
+# mode keeps more pixels, because small faces are searched tile by tile.
+WORKING_SIDE = 1280
+CROWD_WORKING_SIDE = 3840
+# Cheap quality gate, measured on a grey copy at most QUALITY_SIDE px wide
+QUALITY_SIDE = 512
+MIN_SIDE = 64
+MIN_CONTRAST = 8.0  # grey-level std; below it the image is blank, black or washed out
+# Variance of the Laplacian below which the image is too blurry. Kept low:
+# the gate only rejects hopeless images, FaceMesh still rejects the rest
+BLUR_THRESHOLD = 10.0
+
+
+def _to_rgb(image):
+    """Any PIL mode -> RGB; transparent areas become white instead of black."""
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA", "PA"):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def image_obj_to_numpy(image_obj, max_side: int = WORKING_SIDE) -> np.ndarray:
+    """
+    Decode an uploaded image into the RGB array the extractor works on.
+
+    JPEGs are decoded at a reduced scale (draft mode) when the full size is
+    not needed. The EXIF orientation is applied, the image is converted to
+    3-channel RGB and its long side is reduced to `max_side`.
+    """
+    with metrics.timed("extract.decode"), Image.open(image_obj) as image:
+        # Picks the smallest JPEG DCT scale still >= max_side; no-op for PNG
+        image.draft("RGB", (max_side, max_side))
+        image = _to_rgb(ImageOps.exif_transpose(image))
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        return np.asarray(image)
+
+
+def image_quality_issue(image: np.ndarray):
+    """
+    Cheap check, before landmark extraction, for images that can't show a
+    usable face: too small, nearly uniform (blank, black, washed out) or
+    too blurry.
+
+    Returns:
+        str - why the image is rejected, or None if it passes
+    """
+    height, width = image.shape[:2]
+    if min(height, width) < MIN_SIDE:
+        return "Image is too small to find a face in."
+    step = max(1, max(height, width) // QUALITY_SIDE)
+    grey = image[::step, ::step, :3].astype(np.float32) @ np.float32([0.299, 0.587, 0.114])
+    if grey.std() < MIN_CONTRAST:
+        return "Image is blank or too dark/bright to show a face."
+    laplacian = (
+        grey[1:-1, :-2] + grey[1:-1, 2:] + grey[:-2, 1:-1] + grey[2:, 1:-1] - 4 * grey[1:-1, 1:-1]
+    )
+    if laplacian.var() < BLUR_THRESHOLD:
+        return "Image is too blurry. Please upload a sharper photo."
+    return None
+
+
+def _get_face_mesh(max_faces: int = 1):
+    graphs = getattr(_thread_local, "face_meshes", None)
+    if graphs is None:
+        graphs = _thread_local.face_meshes = {}
+    face_mesh = graphs.get(max_faces)
+    if face_mesh is None:
+        face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=True, max_num_faces=max_faces, refine_landmarks=True
+        )
+        graphs[max_faces] = face_mesh
+        with _executor_lock:
+            _face_meshes.append(face_mesh)
+    return face_mesh
+
+
+def _get_executor(max_workers: int = EXTRACT_WORKERS):
+    with _executor_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=f"facemesh{max_workers}"
+            )
+        return executor
+
+
+@atexit.register
+def _shutdown():
+    """Stops the pools, then closes every FaceMesh graph their threads built."""
+    with _executor_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+    with _executor_lock:
+        face_meshes = list(_face_meshes)
+        _face_meshes.clear()
+    for face_mesh in face_meshes:
+        face_mesh.close()
+
+
+def _faces_from_image(image: np.ndarray, max_faces: int = 1) -> list:
+    results = _get_face_mesh(max_faces).process(image)
+    # Flatten each face's landmarks into a single list [x1, y1, z1, x2, y2, z2, ...]
+    return [
+        [coord for lm in face.landmark for coord in (lm.x, lm.y, lm.z)]
+        for face in results.multi_face_landmarks or []
+    ]
 
 
-def image_obj_to_numpy(image_obj) -> np.ndarray:
-    """Convert a Streamlit-uploaded image object to a numpy array."""
-    image = PIL.Image.open(image_obj)
-    return np.array(image)
+@metrics.timed("extract.image")
+def _landmarks_from_image(image: np.ndarray):
+    faces = _faces_from_image(image)
+    if not faces:
+        metrics.increment("extract.no_face")
+        return None
+    return faces[0]
 
 
+@metrics.timed("extract.face_mesh")
 def extract_face_mesh_landmarks(image: np.ndarray):
     """
     Extract face mesh landmarks from an image using MediaPipe.
     Returns a flattened list of all (x, y, z) landmarks if a face is found, else None.
     """
-    mp_face_mesh = mp.solutions.face_mesh
-    with mp_face_mesh.FaceMesh(
-        static_image_mode=True, max_num_faces=1, refine_landmarks=True
-    ) as face_mesh:
-        results = face_mesh.process(image)
-        if results.multi_face_landmarks:
-            landmarks = results.multi_face_landmarks[0].landmark
-            # Flatten all landmarks into a single list [x1, y1, z1, x2, y2, z2, ...]
-            return [coord for lm in landmarks for coord in (lm.x, lm.y, lm.z)]
-        else:
-            st.error("Couldn't find face mesh in image. Please try another image.")
-            return None
+    landmarks = _landmarks_from_image(image)
+    if landmarks is None:
+        st.error("Couldn't find face mesh in image. Please try another image.")
+    return landmarks
+
+
+@metrics.timed("extract.batch")
+def extract_batch(images, max_workers: int = 1):
+    """
+    Extract face mesh landmarks for several images, reusing the per-thread graphs.
+
+    Args:
+        images: iterable of RGB numpy arrays
+        max_workers: int - threads to spread the images over; a long-lived
+            pool of that size is used, so its threads keep their graphs
+
+    Returns:
+        list - one flattened landmark list (or None) per image, in input order;
+        images failing image_quality_issue() are not searched
+    """
+    if max_workers <= 1:
+        return [_gated_landmarks(image) for image in images]
+    return list(_get_executor(max_workers).map(_gated_landmarks, images))
+
+
+def _gated_landmarks(image: np.ndarray):
+    if image_quality_issue(image) is not None:
+        metrics.increment("extract.rejected")
+        return None
+    return _landmarks_from_image(image)
+
+
+def _tiles(height: int, width: int, tile_size: int = TILE_SIZE, overlap: float = TILE_OVERLAP) -> list:
+    """(top, left, bottom, right) of overlapping tiles covering the image."""
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = int(tile_size * (1 - overlap))
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    return [
+        (top, left, min(top + tile_size, height), min(left + tile_size, width))
+        for top in starts(height)
+        for left in starts(width)
+    ]
+
+
+def _tile_faces(image: np.ndarray, tile: tuple, max_faces: int) -> list:
+    """Faces found in one tile, in whole-image normalised coordinates."""
+    top, left, bottom, right = tile
+    height, width = image.shape[:2]
+    tile_height, tile_width = bottom - top, right - left
+    faces = []
+    for landmarks in _faces_from_image(np.ascontiguousarray(image[top:bottom, left:right]), max_faces):
+        points = np.asarray(landmarks, dtype=np.float64).reshape(-1, 3)
+        points[:, 0] = (points[:, 0] * tile_width + left) / width
+        points[:, 1] = (points[:, 1] * tile_height + top) / height
+        # MediaPipe's z uses the same scale as x
+        points[:, 2] *= tile_width / width
+        x0, y0 = points[:, :2].min(axis=0)
+        x1, y1 = points[:, :2].max(axis=0)
+        # A face cut by an inner tile edge is only partially visible there
+        margin = 0.02
+        clipped = (
+            (left > 0 and x0 * width < left + margin * tile_width)
+            or (top > 0 and y0 * height < top + margin * tile_height)
+            or (right < width and x1 * width > right - margin * tile_width)
+            or (bottom < height and y1 * height > bottom - margin * tile_height)
+        )
+        faces.append(
+            {
+                "landmarks": points.reshape(-1).tolist(),
+                "box": [float(x0), float(y0), float(x1), float(y1)],
+                "clipped": bool(clipped),
+            }
+        )
+    return faces
+
+
+def _box_area(box) -> float:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def box_iou(a, b) -> float:
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (_box_area(a) + _box_area(b) - intersection)
+
+
+@metrics.timed("extract.all_faces")
+def extract_all_faces(image: np.ndarray, max_faces: int = MAX_FACES, tile_size: int = TILE_SIZE):
+    """
+    Extract every face in an image (crowd photos, CCTV stills).
+
+    The whole image is searched once, and large images are additionally
+    searched tile by tile on the shared extraction pool. Detections of the
+    same face from overlapping tiles are merged, preferring one that no
+    tile edge cuts, then the larger.
+
+    Args:
+        image: RGB numpy array
+        max_faces: int - most faces returned (largest first)
+        tile_size: int - tile side in pixels
+
+    Returns:
+        list of dicts - "landmarks": flattened (x, y, z) list in whole-image
+        normalised coordinates, "box": [x0, y0, x1, y1] normalised
+    """
+    height, width = image.shape[:2]
+    tiles = [(0, 0, height, width)]
+    if max(height, width) > max(TILE_MIN_SIDE, tile_size):
+        tiles += _tiles(height, width, tile_size)
+
+    if len(tiles) == 1:
+        detections = _tile_faces(image, tiles[0], max_faces)
+    else:
+        per_tile = _get_executor().map(lambda tile: _tile_faces(image, tile, max_faces), tiles)
+        detections = [face for faces in per_tile for face in faces]
+
+    faces = []
+    for face in sorted(detections, key=lambda face: (face["clipped"], -_box_area(face["box"]))):
+        if all(box_iou(face["box"], kept["box"]) <= FACE_IOU for kept in faces):
+            faces.append(face)
+    faces = faces[:max_faces]
+    metrics.increment("extract.faces", len(faces))
+    if not faces:
+        metrics.increment("extract.no_face")
+    return [{"landmarks": face["landmarks"], "box": face["box"]} for face in faces]
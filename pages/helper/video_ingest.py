@@ -0,0 +1,367 @@
+"""
+Ingest a video clip (e.g. a CCTV export) as a public submission.
+
+Decoding and landmark extraction run on a producer thread:
+
+1. sample - frames are read at an adaptive interval: denser while faces are
+   in view or the scene moves, sparser over static, empty footage. Skipped
+   frames are only grabbed, never converted or searched.
+2. extract - sampled frames are downscaled to working resolution and
+   searched with utils.extract_all_faces, whose FaceMesh graph the thread
+   keeps for the whole clip.
+3. track - detections are linked across samples by box overlap. Each track
+   keeps only its best landmark set (large, sharp, frontal), so a person
+   walking past the camera becomes one face rather than dozens.
+
+Finished tracks go through a bounded queue to the consumer, which stores
+them in batches with db_queries.new_public_faces. The queue bound applies
+backpressure: decoding waits when the database falls behind, and memory
+stays flat for clips of any length. If storing fails, a stop event ends the
+producer, so the capture is always released.
+
+Every stored batch queues the incremental match job, but the worker runs one
+job at a time, so a queued match only starts after the whole clip is done.
+The worker's video job therefore matches in-process after every batch
+(match_inline) instead of queueing, and leads show up while the rest of the
+clip is still being processed; --match does the same from the command line.
+A batch whose inline match fails is left to a queued match job.
+
+    python -m pages.helper.video_ingest --video clip.mp4 --location "Platform 3" --mobile 9999999999
+"""
+import argparse
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from pages.helper import db_queries, image_store, metrics
+from pages.helper.data_models import PublicSubmissions
+from pages.helper.lazy import lazy_import
+from pages.helper.utils import box_iou, extract_all_faces
+
+cv2 = lazy_import("cv2")
+
+VIDEO_CONFIG = {
+    "sample_every": 0.5,  # seconds between samples at normal activity
+    "min_interval": 0.2,
+    "max_interval": 2.0,
+    "motion_high": 12.0,  # mean abs grey-level change between samples
+    "motion_low": 2.0,
+    "working_side": 1280,  # long side frames are downscaled to
+    "max_faces": 10,
+    "track_iou": 0.3,  # box overlap linking a detection to a track
+    "track_ttl": 2.0,  # seconds unseen before a track is closed
+    "min_track_hits": 1,  # shorter tracks are dropped as spurious detections
+    "queue_size": 32,
+    "batch_size": 16,
+    "batch_wait": 2.0,  # seconds a partial batch waits before it is stored
+}
+# Laplacian variance at which a face crop counts as fully sharp
+SHARPNESS_REF = 100.0
+# MediaPipe face mesh points used for the frontal-pose estimate
+NOSE_TIP, LEFT_EYE_OUTER, RIGHT_EYE_OUTER = 1, 33, 263
+_DONE = object()
+
+VIDEO_EXTENSIONS = ("mp4", "mov", "avi", "mkv")
+# Uploaded clips wait here for the worker
+UPLOAD_DIR = os.path.join(image_store.RESOURCES_DIR, "videos")
+
+
+def _motion(previous, grey):
+    """(mean abs change against the previous sample, this sample's thumbnail)."""
+    small = cv2.resize(grey, (64, 36), interpolation=cv2.INTER_AREA).astype(np.float32)
+    if previous is None:
+        return 0.0, small
+    return float(np.abs(small - previous).mean()), small
+
+
+def face_quality(grey: np.ndarray, face: dict) -> float:
+    """
+    Higher for larger, sharper and more frontal faces.
+
+    Size is the box side in pixels; sharpness the Laplacian variance of the
+    face crop (capped at SHARPNESS_REF); frontality how evenly the nose tip
+    sits between the outer eye corners.
+    """
+    height, width = grey.shape
+    x0, y0, x1, y1 = face["box"]
+    left, top = max(0, int(x0 * width)), max(0, int(y0 * height))
+    right, bottom = min(width, int(x1 * width) + 1), min(height, int(y1 * height) + 1)
+    crop = grey[top:bottom, left:right]
+    if crop.size == 0:
+        return 0.0
+    side = np.sqrt((right - left) * (bottom - top))
+    sharpness = min(1.0, cv2.Laplacian(crop, cv2.CV_64F).var() / SHARPNESS_REF)
+
+    points = np.asarray(face["landmarks"]).reshape(-1, 3)[:, :2] * (width, height)
+    to_left = np.linalg.norm(points[NOSE_TIP] - points[LEFT_EYE_OUTER])
+    to_right = np.linalg.norm(points[NOSE_TIP] - points[RIGHT_EYE_OUTER])
+    frontal = 1 - abs(to_left - to_right) / max(to_left + to_right, 1e-6)
+    return float(side * sharpness * frontal)
+
+
+def _face_jpeg(rgb: np.ndarray, box, margin: float = 0.5) -> bytes:
+    """
+    JPEG of the face in `box` with `margin` of its size around it, or None
+    if the box lies outside the frame.
+    """
+    height, width = rgb.shape[:2]
+    x0, y0, x1, y1 = box
+    pad_x, pad_y = (x1 - x0) * margin, (y1 - y0) * margin
+    crop = rgb[
+        max(0, int((y0 - pad_y) * height)):min(height, int((y1 + pad_y) * height)),
+        max(0, int((x0 - pad_x) * width)):min(width, int((x1 + pad_x) * width)),
+    ]
+    if crop.size == 0:
+        return None
+    ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(crop, cv2.COLOR_RGB2BGR))
+    return encoded.tobytes() if ok else None
+
+
+class FaceTracker:
+    """Links per-frame detections into tracks and keeps each track's best face."""
+
+    def __init__(self, config: dict = VIDEO_CONFIG):
+        self.config = config
+        self.tracks = []
+
+    def update(self, timestamp: float, faces: list, rgb: np.ndarray, grey: np.ndarray) -> list:
+        """Adds one sample's detections; returns the tracks this closed."""
+        unmatched = list(self.tracks)
+        for face in faces:
+            quality = face_quality(grey, face)
+            best, best_iou = None, self.config["track_iou"]
+            for track in unmatched:
+                iou = box_iou(face["box"], track["box"])
+                if iou >= best_iou:
+                    best, best_iou = track, iou
+            if best is None:
+                best = {"hits": 0, "quality": -1.0}
+                self.tracks.append(best)
+            else:
+                unmatched.remove(best)
+            best.update(box=face["box"], last_seen=timestamp, hits=best["hits"] + 1)
+            if quality > best["quality"]:
+                # Only the winning frame's crop is kept, not the frame
+                best.update(
+                    quality=quality,
+                    face={"landmarks": face["landmarks"], "box": face["box"], "timestamp": timestamp},
+                    jpeg=_face_jpeg(rgb, face["box"]),
+                )
+        closed = [t for t in self.tracks if timestamp - t["last_seen"] > self.config["track_ttl"]]
+        self.tracks = [t for t in self.tracks if t not in closed]
+        return self._keep(closed)
+
+    def flush(self) -> list:
+        closed, self.tracks = self.tracks, []
+        return self._keep(closed)
+
+    def _keep(self, tracks: list) -> list:
+        return [t for t in tracks if t["hits"] >= self.config["min_track_hits"]]
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """out.put(item), unless `stop` is set first (the consumer has failed)."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(path: str, config: dict, out: queue.Queue, stats: dict, stop: threading.Event, progress=None):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Couldn't open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+    tracker = FaceTracker(config)
+    interval = config["sample_every"]
+    next_sample, previous, index = 0.0, None, -1
+    try:
+        while not stop.is_set() and capture.grab():
+            index += 1
+            timestamp = index / fps
+            if timestamp < next_sample:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                continue
+            with metrics.timed("video.sample"):
+                scale = config["working_side"] / max(frame.shape[:2])
+                if scale < 1:
+                    frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                # Working resolution is below the tiling threshold, so the
+                # whole frame goes through one FaceMesh pass
+                faces = extract_all_faces(rgb, config["max_faces"], tile_size=config["working_side"])
+                for track in tracker.update(timestamp, faces, rgb, grey):
+                    _put(out, track, stop)
+            stats["frames_sampled"] += 1
+            stats["faces_detected"] += len(faces)
+
+            motion, previous = _motion(previous, grey)
+            if faces or motion > config["motion_high"]:
+                interval = max(config["min_interval"], interval / 2)
+            elif motion < config["motion_low"]:
+                interval = min(config["max_interval"], interval * 2)
+            else:
+                interval = config["sample_every"]
+            next_sample = timestamp + interval
+            if progress and total_frames:
+                progress(min(0.95, index / total_frames), f"{timestamp:.0f}s of video")
+        for track in tracker.flush():
+            _put(out, track, stop)
+    finally:
+        capture.release()
+    stats["frames_total"] = index + 1
+
+
+def ingest_video(path: str, details: dict, config: dict = VIDEO_CONFIG, match_inline: bool = False, progress=None) -> dict:
+    """
+    Extracts the faces in a video and stores them as one public submission.
+
+    Args:
+        path: str - local video file
+        details: dict - PublicSubmissions fields (location, mobile, ...)
+        config: dict - VIDEO_CONFIG overrides
+        match_inline: bool - also run match() after every stored batch, so
+            matches appear while the clip is processed (the worker's video
+            job does; queued match jobs would only run after it)
+        progress: callable(fraction, message) or None
+
+    Returns:
+        dict - {
+            "submission_id": str or None - row of the first stored face
+            "faces": int - faces stored (one per track)
+            "frames_total", "frames_sampled", "faces_detected": int
+            "seconds": float
+        }
+    """
+    config = {**VIDEO_CONFIG, **config}
+    start = time.perf_counter()
+    tracks = queue.Queue(maxsize=config["queue_size"])
+    stop = threading.Event()
+    stats = {"frames_total": 0, "frames_sampled": 0, "faces_detected": 0}
+    errors = []
+
+    def producer():
+        try:
+            _produce(path, config, tracks, stats, stop, progress)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(tracks, _DONE, stop)
+
+    thread = threading.Thread(target=producer, name="video-ingest", daemon=True)
+    thread.start()
+
+    # Row id of the first stored face, the parent of every other
+    template_id = str(uuid.uuid4())
+    stored = 0
+
+    def store(batch):
+        nonlocal stored
+        faces = []
+        for track in batch:
+            face = dict(track["face"])
+            if track["jpeg"]:
+                face["image_hash"] = image_store.store_file(io.BytesIO(track["jpeg"]))
+            faces.append(face)
+        # Built per batch, so every batch is stamped when it is stored. After
+        # the first batch the row with template_id exists and this copy only
+        # supplies the details and the parent id
+        upload = PublicSubmissions(id=template_id, status="NF", **details)
+        db_queries.new_public_faces(upload, faces, first_index=stored, queue_match=not match_inline)
+        stored += len(faces)
+        metrics.increment("video.faces", len(faces))
+        if match_inline:
+            from pages.helper import match_algo
+
+            result = match_algo.match()
+            if result.get("skipped"):
+                metrics.increment("video.match_skipped")
+            elif not result["status"]:
+                # Leave the batch to the worker's match job instead
+                metrics.increment("video.match_failed")
+                db_queries.enqueue_job("match", {"mode": "incremental"}, dedupe=True)
+
+    batch, done = [], False
+    deadline = None
+    try:
+        while not done:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = tracks.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                done = True
+            elif item is not None:
+                batch.append(item)
+                deadline = deadline or time.monotonic() + config["batch_wait"]
+            if batch and (done or item is None or len(batch) >= config["batch_size"]):
+                store(batch)
+                batch, deadline = [], None
+    finally:
+        # On a failed store the producer may be blocked on a full queue:
+        # stop it, drain what it queued, and wait for it to release the capture
+        stop.set()
+        while True:
+            try:
+                tracks.get_nowait()
+            except queue.Empty:
+                break
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    return {
+        "submission_id": template_id if stored else None,
+        "faces": stored,
+        **stats,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def save_upload(file_obj) -> str:
+    """Streams an uploaded clip to UPLOAD_DIR and returns its path."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    extension = os.path.splitext(getattr(file_obj, "name", ""))[1].lower() or ".mp4"
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{extension}")
+    with open(path, "wb") as file:
+        shutil.copyfileobj(file_obj, file, image_store.CHUNK_SIZE)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a video as a public submission")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--location", default=None)
+    parser.add_argument("--mobile", default="0000000000")
+    parser.add_argument("--submitted-by", default=None)
+    parser.add_argument("--birth-marks", default=None)
+    parser.add_argument("--match", action="store_true", help="match each batch in this process")
+    args = parser.parse_args()
+
+    db_queries.create_db()
+    result = ingest_video(
+        args.video,
+        {
+            "location": args.location,
+            "mobile": args.mobile,
+            "submitted_by": args.submitted_by,
+            "birth_marks": args.birth_marks,
+        },
+        match_inline=args.match,
+        progress=lambda fraction, message: print(f"[VIDEO] {fraction:.0%} {message}"),
+    )
+    print(result)
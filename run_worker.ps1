@@ -0,0 +1 @@
+.\fmp\fmp\python.exe -m pages.helper.jobs --worker
\ No newline at end of file